@@ -0,0 +1,104 @@
+"""
+Small square renditions of profile photos.
+
+Author embeds (posts, comments, replies) show profile photos at avatar
+size, so each upload is cropped to ``AVATAR_SIZES`` squares and saved as
+JPEG under ``<upload dir>/avatars/``, in the blog.renditions thread pool.
+The sizes that exist are stored on ``User.avatar_sizes``; until they are
+rendered, embeds fall back to the original photo.
+"""
+import io
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from blog.authors import invalidate_author
+from blog.renditions import RENDITION_FORMATS, flatten, submit
+from utils import cache
+
+from .models import User
+
+
+AVATAR_SIZES = (48, 96)
+
+
+def avatar_name(name, size):
+    """``images/profile/a.png`` -> ``images/profile/avatars/a-48.jpg``."""
+    directory, filename = posixpath.split(posixpath.splitext(name)[0])
+    return posixpath.join(directory, 'avatars', f'{filename}-{size}.jpg')
+
+
+def avatar_url(user, size, request=None):
+    """URL of the user's avatar ``size`` px wide, the photo until rendered."""
+    if not user.profile_photo:
+        return None
+    if size in user.avatar_sizes:
+        url = default_storage.url(avatar_name(user.profile_photo.name, size))
+    else:
+        url = user.profile_photo.url
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def avatar_srcset(user, request=None):
+    """``srcset`` of the user's avatars, None until rendered."""
+    if not user.profile_photo or not user.avatar_sizes:
+        return None
+    return ', '.join(
+        f'{avatar_url(user, size, request)} {size}w'
+        for size in user.avatar_sizes)
+
+
+def render_avatars(name):
+    """Save the avatars of the image ``name`` and return their sizes."""
+    _, _, options = RENDITION_FORMATS['jpg']
+    with default_storage.open(name, 'rb') as fh:
+        with Image.open(fh) as original:
+            image = flatten(ImageOps.exif_transpose(original))
+    for size in AVATAR_SIZES:
+        avatar = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        avatar.save(buffer, 'JPEG', **options)
+        target = avatar_name(name, size)
+        if default_storage.exists(target):
+            default_storage.delete(target)
+        default_storage.save(target, ContentFile(buffer.getvalue()))
+    return list(AVATAR_SIZES)
+
+
+def generate_avatars(user_id):
+    """
+    Render the user's avatars and record the sizes. Returns the sizes, or
+    None when the user is gone or changed photo meanwhile.
+    """
+    name = User.objects.filter(pk=user_id).values_list(
+        'profile_photo', flat=True).first()
+    if not name:
+        return None
+    # Photos are stored by content (utils.media): reuse another user's.
+    shared = next(
+        (sizes for sizes in User.objects.filter(profile_photo=name)
+         .exclude(pk=user_id).values_list('avatar_sizes', flat=True)
+         if sizes), None)
+    sizes = shared or render_avatars(name)
+    updated = User.objects.filter(pk=user_id, profile_photo=name).update(
+        avatar_sizes=sizes, updated_at=timezone.now())
+    if not updated:
+        return None
+    cache.invalidate(f'user:{user_id}')
+    invalidate_author(user_id)
+    return sizes
+
+
+def delete_avatars(name):
+    """Delete the avatars of the image ``name``."""
+    for size in AVATAR_SIZES:
+        default_storage.delete(avatar_name(name, size))
+
+
+def schedule_avatars(user):
+    """Render the user's avatars after the current transaction commits."""
+    transaction.on_commit(lambda: submit(generate_avatars, user.pk))
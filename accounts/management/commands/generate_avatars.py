@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.avatars import generate_avatars
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the avatars of users whose profile photo has none yet (or "
+        "of every user with a photo with --all), in parallel threads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument(
+            '--all', action='store_true',
+            help="Re-render users that already have avatars.")
+
+    def handle(self, *args, **options):
+        users = User.objects.exclude(profile_photo='').order_by('pk')
+        pks = [
+            pk for pk, sizes in users.values_list('pk', 'avatar_sizes')
+            if options['all'] or not sizes
+        ]
+        self.stdout.write(f'Rendering avatars of {len(pks)} users.')
+        rendered = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for pk, error in zip(pks, executor.map(self.render, pks)):
+                if error is None:
+                    rendered += 1
+                else:
+                    failed += 1
+                    self.stderr.write(f'user {pk}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{rendered} rendered, {failed} failed.'))
+
+    def render(self, pk):
+        try:
+            generate_avatars(pk)
+        except Exception as error:
+            return error
+        finally:
+            connection.close()
+        return None
@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-18 17:17
+
+from django.db import migrations
+import utils.media
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='profile_photo',
+            field=utils.media.DedupImageField(blank=True, upload_to='images/profile', verbose_name='profile picture'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_dedup_profile_photo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_sizes',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
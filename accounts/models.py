@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils.translation import gettext_lazy as _
 
+from utils.media import DedupImageField, DedupMediaModel
+
 
 class UserManager(BaseUserManager):
     def create_user(self, email, username, password, **extra_fields):
@@ -28,14 +30,18 @@ class UserManager(BaseUserManager):
         return self.create_user(email, username, password, **extra_fields)
 
 
-class User(AbstractUser):
+class User(AbstractUser, DedupMediaModel):
     email = models.EmailField(_('email address'), unique=True)
     username = models.CharField(
         _('username'), max_length=50, unique=True
     )
     bio = models.TextField(_('bio'), max_length=500, blank=True)
-    profile_photo = models.ImageField(
+    profile_photo = DedupImageField(
         _('profile picture'), upload_to='images/profile', blank=True)
+    # Sizes of the avatar renditions rendered so far (see accounts.avatars);
+    # empty until the upload has been processed.
+    avatar_sizes = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
 
     objects = UserManager()
 
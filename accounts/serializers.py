@@ -4,6 +4,7 @@ from rest_framework.validators import UniqueValidator, ValidationError
 import re
 from pprint import pprint
 
+from .avatars import schedule_avatars
 from .models import User
 
 USERNAME_REGEX = r'^[\w.]+$'
@@ -70,3 +71,12 @@ class UserProfileSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'profile_photo', 'email', 'username',
                   'first_name', 'last_name', 'bio', 'date_joined']
+
+    def update(self, instance, validated_data):
+        photo = validated_data.get('profile_photo')
+        if photo is not None:
+            validated_data['avatar_sizes'] = []
+        instance = super().update(instance, validated_data)
+        if photo is not None:
+            schedule_avatars(instance)
+        return instance
@@ -1,3 +1,106 @@
-from django.test import TestCase
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from blog.models import BlogPost
+from blog.tests import IN_MEMORY_STORAGES, image_upload
+
+from .avatars import AVATAR_SIZES, avatar_name
+from .models import User
+
+
+class ProfileConditionalGetTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', username='reader', password='Passw0rd!')
+
+    def test_unchanged_profile_returns_304(self):
+        url = reverse('user-profile', args=[self.user.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_profile_update_changes_etag(self):
+        url = reverse('user-profile', args=[self.user.id])
+        etag = self.client.get(url)['ETag']
+        self.user.bio = 'Hello'
+        self.user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['bio'], 'Hello')
+
+
+@override_settings(STORAGES=IN_MEMORY_STORAGES, THUMBNAIL_WORKERS=0)
+class AvatarTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='writer@example.com', username='writer', password='Passw0rd!')
+        cls.post = BlogPost.objects.create(
+            thumbnail='thumbnails/a.png', title='Hello', author=cls.user,
+            content='words')
+
+    def setUp(self):
+        cache.clear()
+
+    def upload_photo(self, execute=True, **kwargs):
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=execute):
+            response = self.client.patch(
+                reverse('user-profile', args=[self.user.id]),
+                {'profile_photo': image_upload(**kwargs)}, format='multipart')
+        self.client.force_authenticate(None)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.user.refresh_from_db()
+
+    def embedded_author(self):
+        return self.client.get(
+            reverse('blogs-detail', args=[self.post.slug])).data['author']
+
+    def test_profile_photo_upload_renders_avatars(self):
+        self.upload_photo()
+        self.assertEqual(self.user.avatar_sizes, list(AVATAR_SIZES))
+        for size in AVATAR_SIZES:
+            name = avatar_name(self.user.profile_photo.name, size)
+            with default_storage.open(name) as fh, Image.open(fh) as image:
+                self.assertEqual(image.format, 'JPEG')
+                self.assertEqual(image.size, (size, size))
+
+        author = self.embedded_author()
+        self.assertTrue(author['profile_photo'].endswith('-96.jpg'))
+        self.assertIn('-48.jpg 48w', author['profile_photo_srcset'])
+        profile = self.client.get(
+            reverse('user-profile', args=[self.user.id])).data
+        self.assertTrue(profile['profile_photo'].endswith(
+            self.user.profile_photo.name))
+
+    def test_embeds_use_the_photo_until_rendered(self):
+        self.upload_photo(execute=False)
+        self.assertEqual(self.user.avatar_sizes, [])
+        author = self.embedded_author()
+        self.assertTrue(author['profile_photo'].endswith(
+            self.user.profile_photo.name))
+        self.assertIsNone(author['profile_photo_srcset'])
+
+    def test_replaced_photos_avatars_are_collected(self):
+        self.upload_photo()
+        old = self.user.profile_photo.name
+        self.upload_photo(size=(300, 200))
+        self.assertTrue(self.embedded_author()['profile_photo'].endswith(
+            avatar_name(self.user.profile_photo.name, 96)))
+
+        call_command('gc_media_blobs', grace=0, stdout=StringIO())
+        self.assertFalse(default_storage.exists(avatar_name(old, 48)))
+        self.assertTrue(default_storage.exists(
+            avatar_name(self.user.profile_photo.name, 48)))
@@ -13,6 +13,7 @@ from .models import User
 from .serializers import UserSerializer, UserProfileSerializer
 from utils.responses import SuccessResponse
 from utils.permissions import IsOwner, IsOwnerOrReadOnly
+from utils.conditional import conditional_get
 from utils import swagger_schemas
 
 
@@ -78,6 +79,14 @@ class LoginView(APIView):
         raise ValidationError("Invalid credentials")
 
 
+def profile_validators(request, pk=None, **kwargs):
+    updated_at = User.objects.filter(pk=pk).values_list(
+        'updated_at', flat=True).first()
+    if updated_at is None:
+        return None, None
+    return updated_at, updated_at
+
+
 class UserProfileView(
     mixins.RetrieveModelMixin,
     mixins.UpdateModelMixin,
@@ -96,6 +105,7 @@ class UserProfileView(
             200: UserProfileSerializer
         }
     )
+    @conditional_get(profile_validators)
     def get(self, request, *args, **kwargs):
         return self.retrieve(request, *args, **kwargs)
 
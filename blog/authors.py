@@ -0,0 +1,170 @@
+"""
+Two-tier cache of the author summaries (``AuthorSerializer`` data) embedded
+in posts, comments and replies.
+
+A per-process TTL/LRU cache of ``AUTHOR_CACHE_LOCAL_SIZE`` entries sits in
+front of the shared cache; both are keyed by user id and keep entries for
+``AUTHOR_CACHE_TIMEOUT`` seconds. An entry is stamped with the user's
+``updated_at`` and only served for a user instance with the same stamp, so
+a process that missed an invalidation still never serves an old profile.
+``invalidate_author`` drops the entries as soon as a profile changes.
+Photo URLs are absolute, so an entry keeps one summary per base URL.
+
+List serializers look up the authors of a whole page at once
+(:meth:`AuthorSummaries.prime`): one ``get_many`` for what the local tier
+doesn't have, and one ``set_many`` for the summaries serialized meanwhile.
+"""
+import threading
+
+from cachetools import TTLCache
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from utils.metrics import record_cache_lookup
+
+
+_local = None
+_local_lock = threading.Lock()
+
+
+def author_key(user_id):
+    return f'author:{user_id}'
+
+
+def invalidate_author(user_id):
+    """Forget the summary of ``user_id`` in both tiers."""
+    local = _local_cache()
+    if local is not None:
+        with _local_lock:
+            local.pop(user_id, None)
+    cache.delete(author_key(user_id))
+
+
+class AuthorSummaries:
+    """The author summaries of one serialization (one response)."""
+
+    def __init__(self, request=None):
+        self.base = (
+            request.build_absolute_uri('/') if request is not None else '')
+        self.found = {}
+        self.looked_up = set()
+        self.pending = {}
+        self.depth = 0
+
+    @classmethod
+    def of(cls, context):
+        """The summaries shared by every serializer of ``context``."""
+        summaries = context.get('author_summaries')
+        if summaries is None:
+            summaries = cls(context.get('request'))
+            context['author_summaries'] = summaries
+        return summaries
+
+    def prime(self, users):
+        """
+        Look up the summaries of ``users`` in one round trip, and hold back
+        the writes of the missing ones until the matching :meth:`flush`.
+        """
+        self.lookup(users)
+        self.depth += 1
+
+    def flush(self):
+        # Nested lists (replies in comments) write with the outermost one.
+        self.depth -= 1
+        if self.depth == 0 and self.pending:
+            cache.set_many(self.pending, settings.AUTHOR_CACHE_TIMEOUT)
+            self.pending = {}
+
+    def get(self, user):
+        """The cached summary of ``user``, or None."""
+        if user.pk not in self.looked_up:
+            self.lookup([user])
+        summary = self.found.get(user.pk)
+        return dict(summary) if summary is not None else None
+
+    def store(self, user, summary):
+        key = author_key(user.pk)
+        entry = {'version': _version(user), 'data': {self.base: summary}}
+        local = _local_cache()
+        if local is not None:
+            with _local_lock:
+                # Keep the summaries of the other base URLs.
+                previous = local.get(user.pk)
+                if previous and previous['version'] == entry['version']:
+                    entry['data'] = {**previous['data'], **entry['data']}
+                local[user.pk] = entry
+        self.found[user.pk] = summary
+        if self.depth:
+            self.pending[key] = entry
+        else:
+            cache.set(key, entry, settings.AUTHOR_CACHE_TIMEOUT)
+        return dict(summary)
+
+    def lookup(self, users):
+        users = {
+            user.pk: user for user in users
+            if user is not None and user.pk not in self.looked_up
+        }
+        if not users:
+            return
+        self.looked_up.update(users)
+        local = _local_cache()
+        remote = {}
+        for pk, user in users.items():
+            entry = None
+            if local is not None:
+                with _local_lock:
+                    entry = local.get(pk)
+            summary = self._summary(entry, user)
+            if summary is None:
+                remote[author_key(pk)] = user
+            else:
+                self.found[pk] = summary
+        if remote:
+            entries = cache.get_many(list(remote))
+            for key, user in remote.items():
+                summary = self._summary(entries.get(key), user)
+                if summary is not None:
+                    self.found[user.pk] = summary
+                    if local is not None:
+                        with _local_lock:
+                            local[user.pk] = entries[key]
+        for pk in users:
+            record_cache_lookup('author', pk in self.found)
+
+    def _summary(self, entry, user):
+        if entry is None or entry['version'] != _version(user):
+            return None
+        return entry['data'].get(self.base)
+
+
+def _version(user):
+    return user.updated_at.isoformat() if user.updated_at else None
+
+
+def _local_cache():
+    global _local
+    if _local is None and settings.AUTHOR_CACHE_LOCAL_SIZE:
+        with _local_lock:
+            if _local is None:
+                _local = TTLCache(
+                    maxsize=settings.AUTHOR_CACHE_LOCAL_SIZE,
+                    ttl=settings.AUTHOR_CACHE_TIMEOUT)
+    return _local
+
+
+def clear_local_cache():
+    """Empty this process's tier (it is rebuilt from the settings)."""
+    global _local
+    with _local_lock:
+        _local = None
+
+
+@receiver(setting_changed)
+def reset_local_cache(setting, **kwargs):
+    # Summaries hold media URLs, and the cache is sized from settings.
+    if setting in ('STORAGES', 'MEDIA_URL', 'AUTHOR_CACHE_LOCAL_SIZE',
+                   'AUTHOR_CACHE_TIMEOUT'):
+        clear_local_cache()
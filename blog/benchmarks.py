@@ -0,0 +1,238 @@
+"""
+Helpers shared by the benchmark management commands: fast dataset
+seeding and query and request timing.
+"""
+import itertools
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .imports import bulk_create_with_timestamps, refresh_derived_data
+from .models import BlogPost, Comment, Tag, summarize_content
+
+
+User = get_user_model()
+
+WORDS = (
+    'django api python cache query index database latency throughput '
+    'request response server client thread comment reply post tag author '
+    'search ranking cursor page stream batch import export storage image '
+    'thumbnail upload token session profile user blog write read update '
+    'delete create schema migration signal counter queue worker async '
+    'memory profile benchmark metric trace span deploy release review test '
+    'coverage design pattern model view serializer router middleware'
+).split()
+
+
+def seed_dataset(users=100, posts=10000, tags=50, tags_per_post=3,
+                 comments=0, batch_size=2000, prefix='bench', rng=None):
+    """
+    Bulk-insert a synthetic dataset and return ``(users, tags, post_ids)``.
+
+    Bypasses ``save()`` and signals, so derived columns are left at their
+    defaults; this is meant for timing queries, not for serving the API.
+    """
+    rng = rng or random.Random(0)
+    user_objs = User.objects.bulk_create([
+        User(email=f'{prefix}{i}@example.com', username=f'{prefix}{i}',
+             password='!')
+        for i in range(users)
+    ], batch_size=batch_size)
+    tag_objs = Tag.objects.bulk_create([
+        Tag(name=f'{prefix.capitalize()}{i}', slug=f'{prefix}-{i}')
+        for i in range(tags)
+    ], batch_size=batch_size)
+
+    through = BlogPost.tags.through
+    post_ids = []
+    for start in range(0, posts, batch_size):
+        batch = BlogPost.objects.bulk_create([
+            BlogPost(
+                thumbnail='thumbnails/bench.jpg',
+                title=f'{prefix} post {i}',
+                slug=f'{prefix}-post-{i}',
+                author=rng.choice(user_objs),
+                content=f'{prefix} content {i}',
+            )
+            for i in range(start, min(start + batch_size, posts))
+        ])
+        through.objects.bulk_create([
+            through(blogpost_id=post.id, tag_id=tag.id)
+            for post in batch
+            for tag in rng.sample(tag_objs, min(tags_per_post, len(tag_objs)))
+        ])
+        post_ids.extend(post.id for post in batch)
+
+    for start in range(0, comments, batch_size):
+        Comment.objects.bulk_create([
+            Comment(post_id=rng.choice(post_ids),
+                    author=rng.choice(user_objs),
+                    content=f'{prefix} comment {i}')
+            for i in range(start, min(start + batch_size, comments))
+        ])
+    return user_objs, tag_objs, post_ids
+
+
+def zipf_cum_weights(n, skew):
+    """Cumulative weights of ranks ``1..n`` under a Zipf law of ``skew``."""
+    return list(itertools.accumulate(
+        1 / rank ** skew for rank in range(1, n + 1)))
+
+
+def seed_blog(users=200, posts=5000, tags=100, comments=50000,
+              reply_share=0.5, viral_posts=5, viral_share=0.3, skew=1.1,
+              password='bench-password', prefix='seed', batch_size=2000,
+              rng=None, log=None):
+    """
+    Bulk-insert a realistic, skewed blog and return the row counts.
+
+    Unlike :func:`seed_dataset`, the result can serve the API: derived
+    columns, counters and the search index are filled in. Authorship, tags,
+    comments and replies follow Zipf laws of ``skew`` (a few prolific
+    authors, long-tail tags, long reply threads under a few comments), and
+    ``viral_share`` of the top-level comments go to ``viral_posts`` posts.
+    Every user can log in as ``<prefix><i>@example.com`` / ``password``.
+    """
+    rng = rng or random.Random(0)
+    log = log or (lambda message: None)
+    now = timezone.now()
+
+    hashed = make_password(password)
+    user_ids = [user.pk for user in User.objects.bulk_create([
+        User(email=f'{prefix}{i}@example.com', username=f'{prefix}{i}',
+             password=hashed)
+        for i in range(users)
+    ], batch_size=batch_size)]
+    tag_ids = [tag.pk for tag in Tag.objects.bulk_create([
+        Tag(name=f'{WORDS[i % len(WORDS)].capitalize()} {i}',
+            slug=f'{prefix}-{WORDS[i % len(WORDS)]}-{i}')
+        for i in range(tags)
+    ], batch_size=batch_size)]
+    log(f'{users} users, {tags} tags')
+
+    author_weights = zipf_cum_weights(len(user_ids), skew)
+    tag_weights = zipf_cum_weights(len(tag_ids), skew)
+    through = BlogPost.tags.through
+    post_ids = []
+    for start in range(0, posts, batch_size):
+        batch = []
+        for i in range(start, min(start + batch_size, posts)):
+            words = min(max(int(rng.lognormvariate(6, 0.6)), 30), 4000)
+            content = ' '.join(rng.choices(WORDS, k=words))
+            post = BlogPost(
+                thumbnail=f'thumbnails/{prefix}.jpg',
+                title=' '.join(rng.choices(WORDS, k=6)).capitalize(),
+                slug=f'{prefix}-post-{i}',
+                author_id=rng.choices(user_ids, cum_weights=author_weights)[0],
+                content=content,
+            )
+            post.excerpt, post.word_count, post.reading_time = (
+                summarize_content(content))
+            post.created_at = post.updated_at = now - timedelta(
+                minutes=(posts - i) * 30)
+            batch.append(post)
+        bulk_create_with_timestamps(BlogPost, batch)
+        through.objects.bulk_create([
+            through(blogpost_id=post.pk, tag_id=tag_id)
+            for post in batch
+            for tag_id in set(rng.choices(
+                tag_ids, cum_weights=tag_weights, k=rng.randint(1, 5)))
+        ])
+        post_ids.extend(post.pk for post in batch)
+    log(f'{posts} posts')
+
+    viral = post_ids[-viral_posts:] if viral_posts else []
+    post_weights = zipf_cum_weights(len(post_ids), skew)
+    shuffled = rng.sample(post_ids, len(post_ids))
+    top_level = comments - int(comments * reply_share)
+    user_weights = zipf_cum_weights(len(user_ids), skew / 2)
+
+    def commenter():
+        return rng.choices(user_ids, cum_weights=user_weights)[0]
+
+    comment_ids = []
+    for start in range(0, top_level, batch_size):
+        batch = Comment.objects.bulk_create([
+            Comment(
+                post_id=(rng.choice(viral) if viral and rng.random() < viral_share
+                         else rng.choices(shuffled, cum_weights=post_weights)[0]),
+                author_id=commenter(),
+                content=' '.join(rng.choices(WORDS, k=rng.randint(3, 40))),
+            )
+            for _ in range(min(batch_size, top_level - start))
+        ])
+        comment_ids.extend(comment.pk for comment in batch)
+
+    replies = comments - top_level
+    if comment_ids:
+        parents = rng.sample(comment_ids, len(comment_ids))
+        parent_weights = zipf_cum_weights(len(parents), skew)
+        for start in range(0, replies, batch_size):
+            Comment.objects.bulk_create([
+                Comment(
+                    parent_id=rng.choices(parents, cum_weights=parent_weights)[0],
+                    author_id=commenter(),
+                    content=' '.join(rng.choices(WORDS, k=rng.randint(3, 40))),
+                )
+                for _ in range(min(batch_size, replies - start))
+            ])
+    log(f'{top_level} comments, {replies} replies')
+
+    refresh_derived_data(
+        post_ids, comment_ids[0] if comment_ids else None,
+        batch_size=batch_size)
+    return {
+        'users': users, 'tags': tags, 'posts': posts,
+        'comments': top_level, 'replies': replies if comment_ids else 0,
+    }
+
+
+def time_call(func, repeat=5):
+    """Median wall time of ``func()`` in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def time_request(send, **kwargs):
+    """
+    Send one test-client request and return ``(milliseconds, queries,
+    response bytes, status)``. Streamed bodies are read inside the timing.
+    """
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        response = send(**kwargs)
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        elapsed = (time.perf_counter() - start) * 1000
+    return elapsed, len(queries), size, response.status_code
+
+
+def summarize_samples(samples):
+    """Latency percentiles, mean queries and median size of ``time_request`` samples."""
+    latencies = [sample[0] for sample in samples]
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies[0]
+    return {
+        'p50_ms': round(p50, 3),
+        'p95_ms': round(p95, 3),
+        'p99_ms': round(p99, 3),
+        'queries': round(statistics.mean(sample[1] for sample in samples), 2),
+        'bytes': int(statistics.median(sample[2] for sample in samples)),
+        'statuses': sorted({sample[3] for sample in samples}),
+    }
@@ -0,0 +1,47 @@
+"""
+Dependency names for cached blog responses (see ``utils.cache``).
+
+``posts``           the set of posts (a post was created or deleted)
+``post:<id>``       a post, its tags or its comments
+``user-posts:<id>`` the set of posts of an author
+``user:<id>``       a user profile, as embedded in post payloads
+``tag:<slug>``      a tag and the set of posts carrying it
+``tags``            the set of tags and their post counts
+"""
+from .filters import get_tag_filter
+
+
+def post_dependencies(data):
+    """Posts, authors and tags that appear in a post or page of posts."""
+    items = data.get('results', [data]) if isinstance(data, dict) else data
+    for item in items:
+        yield f'post:{item["id"]}'
+        if item.get('author'):
+            yield f'user:{item["author"]["id"]}'
+        for tag in item.get('tags', []):
+            yield f'tag:{tag["slug"]}'
+
+
+def list_dependencies(view, data, **kwargs):
+    yield 'posts'
+    for slug in get_tag_filter(view.request)[0]:
+        yield f'tag:{slug}'
+    yield from post_dependencies(data)
+
+
+def detail_dependencies(view, data, **kwargs):
+    return post_dependencies(data)
+
+
+def user_posts_dependencies(view, data, user_id=None, **kwargs):
+    yield f'user-posts:{user_id}'
+    yield from post_dependencies(data)
+
+
+def tag_posts_dependencies(view, data, slug=None, **kwargs):
+    yield f'tag:{slug}'
+    yield from post_dependencies(data)
+
+
+def tag_cloud_dependencies(view, data, **kwargs):
+    return ['tags']
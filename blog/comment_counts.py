@@ -0,0 +1,73 @@
+"""
+Upkeep of the denormalized ``BlogPost.comment_count`` (comments and
+replies on the post) and ``Comment.reply_count`` columns.
+
+``blog.signals`` adjusts the counters with ``F()`` updates as comments are
+created and deleted; the comment views run those writes in one
+transaction. ``reconcile_comment_counts`` recomputes the counters in
+chunks for anything that bypassed signals.
+"""
+from django.db import transaction
+from django.db.models import F, Func, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import BlogPost, Comment
+
+
+def adjust_comment_count(post_filter, delta):
+    """Add ``delta`` to the comment count of the posts matching ``post_filter``."""
+    BlogPost.objects.filter(post_filter).update(
+        comment_count=Greatest(F('comment_count') + delta, 0))
+
+
+def adjust_reply_count(comment_id, delta):
+    Comment.objects.filter(pk=comment_id).update(
+        reply_count=Greatest(F('reply_count') + delta, 0))
+
+
+def _count(queryset):
+    return Coalesce(Subquery(
+        queryset.order_by().annotate(
+            total=Func(F('id'), function='COUNT')).values('total')
+    ), 0)
+
+
+def actual_comment_counts():
+    """Posts annotated with ``actual_count``, counted from the comments."""
+    # Two indexed counts rather than one OR over post and parent__post.
+    return BlogPost.objects.annotate(actual_count=(
+        _count(Comment.objects.filter(post_id=OuterRef('pk'))) +
+        _count(Comment.objects.filter(parent__post_id=OuterRef('pk')))
+    ))
+
+
+def actual_reply_counts():
+    """Comments annotated with ``actual_count``, counted from the replies."""
+    return Comment.objects.annotate(actual_count=_count(
+        Comment.objects.filter(parent_id=OuterRef('pk'))))
+
+
+def reconcile_counts(queryset, field, batch_size=1000, dry_run=False):
+    """
+    Walk ``queryset`` (annotated with ``actual_count``) in primary key
+    chunks of ``batch_size`` and fix the rows whose ``field`` disagrees,
+    one transaction per chunk. Yields ``{'pk', field, 'actual_count'}``
+    for each drifted row, as it was.
+    """
+    model = queryset.model
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            chunk = list(
+                queryset.filter(pk__gt=last_pk).order_by('pk')
+                .values('pk', field, 'actual_count')[:batch_size])
+            if not chunk:
+                return
+            last_pk = chunk[-1]['pk']
+            drifted = [row for row in chunk
+                       if row[field] != row['actual_count']]
+            if drifted and not dry_run:
+                model.objects.bulk_update(
+                    [model(pk=row['pk'], **{field: row['actual_count']})
+                     for row in drifted], [field])
+        yield from drifted
@@ -0,0 +1,75 @@
+"""
+Validators for conditional GETs on blog endpoints (see
+``utils.conditional``). Each one is a single aggregate query; none of them
+loads or serializes the rows they describe.
+
+They give an ETag only. No timestamp moves when a post or comment is
+deleted, a comment count drops or a tag is renamed, so a Last-Modified
+date would answer 304 for changed data; the ETag state has the row counts
+and the ``tags`` generation (see ``utils.cache``) for those. That
+generation moves again when the write commits, so an ETag computed from
+it before the commit, over the old rows, doesn't match afterwards.
+"""
+from django.db.models import Count, Max, Q, Sum
+
+from utils.cache import dependency_generations
+
+from .filters import filter_by_tags, get_tag_filter
+from .models import BlogPost, Comment
+
+
+def _post_set_validators(queryset):
+    # Comment counts change without touching updated_at.
+    state = queryset.aggregate(
+        count=Count('id'),
+        comments=Sum('comment_count'),
+        updated=Max('updated_at'),
+        author_updated=Max('author__updated_at'),
+    )
+    return (*state.values(), dependency_generations('tags')), None
+
+
+def post_list_validators(request, **kwargs):
+    queryset = BlogPost.objects.all()
+    slugs, match = get_tag_filter(request)
+    if slugs:
+        queryset = filter_by_tags(queryset, slugs, match)
+    return _post_set_validators(queryset)
+
+
+def user_posts_validators(request, user_id=None, **kwargs):
+    return _post_set_validators(BlogPost.objects.filter(author=user_id))
+
+
+def tag_posts_validators(request, slug=None, **kwargs):
+    return _post_set_validators(filter_by_tags(BlogPost.objects.all(), [slug]))
+
+
+def post_validators(request, slug=None, **kwargs):
+    state = BlogPost.objects.filter(slug=slug).aggregate(
+        comments=Max('comment_count'),
+        updated=Max('updated_at'),
+        author_updated=Max('author__updated_at'),
+    )
+    if state['updated'] is None:
+        return None, None
+    return (*state.values(), dependency_generations('tags')), None
+
+
+def _comment_set_validators(queryset):
+    state = queryset.aggregate(
+        count=Count('id'),
+        updated=Max('updated_at'),
+        author_updated=Max('author__updated_at'),
+    )
+    return tuple(state.values()), None
+
+
+def comment_validators(request, post_id=None, **kwargs):
+    return _comment_set_validators(Comment.objects.filter(
+        Q(post_id=post_id) | Q(parent__post_id=post_id)))
+
+
+def reply_validators(request, comment_id=None, **kwargs):
+    return _comment_set_validators(
+        Comment.objects.filter(parent_id=comment_id))
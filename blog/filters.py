@@ -0,0 +1,38 @@
+from django.db.models import Count
+from rest_framework.exceptions import ValidationError
+
+from .models import BlogPost
+
+
+TAG_MATCH_ANY = 'any'
+TAG_MATCH_ALL = 'all'
+
+
+def filter_by_tags(queryset, slugs, match=TAG_MATCH_ANY):
+    """
+    Restrict ``queryset`` to posts tagged with any / all of ``slugs``.
+
+    Slugs are resolved inside the same statement through the posts-tags
+    table. ``all`` groups the matching links per post and keeps posts with
+    one link per requested tag, so the query has one join however many
+    tags are asked for.
+    """
+    slugs = set(slugs)
+    links = BlogPost.tags.through.objects.filter(tag__slug__in=slugs)
+    if match == TAG_MATCH_ALL and len(slugs) > 1:
+        links = links.values('blogpost_id').annotate(
+            matched=Count('tag_id')).filter(matched=len(slugs))
+    return queryset.filter(id__in=links.values('blogpost_id'))
+
+
+def get_tag_filter(request):
+    """
+    Parse ``?tags=a,b&match=all|any`` into ``(slugs, match)``; ``slugs`` is
+    empty when no tag filter was asked for.
+    """
+    raw = request.query_params.get('tags', '')
+    slugs = [slug.strip() for slug in raw.split(',') if slug.strip()]
+    match = request.query_params.get('match', TAG_MATCH_ANY)
+    if match not in (TAG_MATCH_ANY, TAG_MATCH_ALL):
+        raise ValidationError("'match' must be 'all' or 'any'.")
+    return slugs, match
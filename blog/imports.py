@@ -0,0 +1,342 @@
+"""
+Bulk import of the files written by ``export_blog`` (JSONL, optionally
+gzipped), used by ``import_blog``.
+
+Rows are inserted with ``bulk_create`` in batches, one transaction per
+batch. Source ids are mapped to the ids of the new rows. Every batch saves
+the mapping and the file position in an ``ImportBatch`` row, in the same
+transaction, so an interrupted import resumes after the last committed
+batch. Signals don't fire for bulk inserts, so the search index and the
+denormalized counters of the imported rows are rebuilt at the end.
+"""
+import gzip
+import json
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from django.utils.text import slugify
+
+from utils import cache
+from utils.counting import invalidate_counts
+
+from .comment_counts import actual_comment_counts, actual_reply_counts, reconcile_counts
+from .models import BlogPost, Comment, ImportBatch, Tag, summarize_content
+from .search import index_posts
+from .tag_counts import reconcile_tag_counts
+
+
+User = get_user_model()
+
+IMPORT_BATCH_SIZE = 1000
+SLUG_MAX_LENGTH = BlogPost._meta.get_field('slug').max_length
+USERNAME_MAX_LENGTH = User._meta.get_field('username').max_length
+
+
+def allocate_username(username, taken):
+    """
+    ``username``, or ``username_2``, ``username_3``... if it is in ``taken``
+    (the usernames of the batch that have an account) or belongs to one.
+    """
+    candidate, n = username, 1
+    # Only suffixed names, which are rare, cost a query.
+    while candidate in taken or n > 1 and User.objects.filter(
+            username=candidate).exists():
+        n += 1
+        suffix = f'_{n}'
+        candidate = username[:USERNAME_MAX_LENGTH - len(suffix)] + suffix
+    return candidate
+
+
+class SlugAllocator:
+    """
+    Hands out unique post slugs (``title``, ``title-2``, ...) from an
+    in-memory set of the taken ones, loaded once, instead of a collision
+    query per row.
+    """
+
+    def __init__(self):
+        self.taken = set(
+            BlogPost.objects.values_list('slug', flat=True).iterator())
+
+    def allocate(self, text):
+        base = slugify(text)[:SLUG_MAX_LENGTH] or 'post'
+        slug, n = base, 1
+        while slug in self.taken:
+            n += 1
+            suffix = f'-{n}'
+            slug = base[:SLUG_MAX_LENGTH - len(suffix)] + suffix
+        self.taken.add(slug)
+        return slug
+
+
+def bulk_create_with_timestamps(model, objs):
+    """
+    ``bulk_create`` ``objs`` keeping the ``created_at``/``updated_at`` they
+    carry. The insert stamps these auto_now(_add) fields with the current
+    time, so the given values are written back with one ``bulk_update``.
+    """
+    timestamps = [(obj.created_at, obj.updated_at) for obj in objs]
+    model.objects.bulk_create(objs)
+    for obj, (created_at, updated_at) in zip(objs, timestamps):
+        obj.created_at, obj.updated_at = created_at, updated_at
+    model.objects.bulk_update(objs, ['created_at', 'updated_at'])
+    return objs
+
+
+class Checkpoint:
+    """
+    The batches committed under the name ``name`` (``ImportBatch`` rows),
+    as the number of input lines consumed per dataset and the source id to
+    new id maps. :meth:`record` must run in the transaction of the batch.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.positions = {}
+        self.ids = {}
+        for dataset, position, pairs in ImportBatch.objects.filter(
+                checkpoint=name).order_by('pk').values_list(
+                'dataset', 'position', 'ids').iterator():
+            self.positions[dataset] = position
+            self.ids.setdefault(dataset, {}).update(
+                (source, new) for source, new in pairs)
+
+    def position(self, dataset):
+        return self.positions.get(dataset, 0)
+
+    def id_map(self, dataset):
+        return self.ids.setdefault(dataset, {})
+
+    def record(self, dataset, position, pairs):
+        ImportBatch.objects.create(
+            checkpoint=self.name, dataset=dataset, position=position,
+            ids=list(pairs))
+        self.positions[dataset] = position
+        self.id_map(dataset).update(pairs)
+
+    def clear(self):
+        ImportBatch.objects.filter(checkpoint=self.name).delete()
+        self.positions, self.ids = {}, {}
+
+
+class BlogImporter:
+
+    def __init__(self, input_dir, checkpoint, batch_size=IMPORT_BATCH_SIZE,
+                 match_users=False, log=print):
+        self.input_dir = input_dir
+        self.checkpoint = Checkpoint(checkpoint)
+        self.batch_size = batch_size
+        # Map imported authors onto the local accounts with their username.
+        self.match_users = match_users
+        self.log = log
+        self.skipped = 0
+        self.slugs = None
+
+    def run(self):
+        started = time.monotonic()
+        total = 0
+        steps = [
+            ('users', 'users', self.import_users),
+            ('tags', 'tags', self.import_tags),
+            ('posts', 'posts', self.import_posts),
+            ('post_tags', 'post_tags', self.import_post_tags),
+            # Two passes over the comments: top-level comments first, then
+            # the replies, whose parents then all have new ids.
+            ('comments', 'comments', self.import_comments),
+            ('replies', 'comments', self.import_replies),
+        ]
+        for dataset, filename, load in steps:
+            total += self.run_step(dataset, filename, load)
+        self.finish()
+        elapsed = time.monotonic() - started
+        self.log(f'Imported {total} rows in {elapsed:.1f}s '
+                 f'({total / elapsed if elapsed else 0:.0f} rows/s), '
+                 f'skipped {self.skipped}.')
+        return total
+
+    def run_step(self, dataset, filename, load):
+        position = self.checkpoint.position(dataset)
+        started = time.monotonic()
+        imported = 0
+        batch = []
+        for line_number, record in self.read(filename, skip=position):
+            batch.append(record)
+            if len(batch) == self.batch_size:
+                imported += self.commit(dataset, load, batch, line_number)
+                batch = []
+        if batch:
+            imported += self.commit(dataset, load, batch, line_number)
+        elapsed = time.monotonic() - started
+        self.log(f'{dataset}: {imported} rows in {elapsed:.1f}s '
+                 f'({imported / elapsed if elapsed else 0:.0f} rows/s)'
+                 + (f', resumed after line {position}' if position else ''))
+        return imported
+
+    def commit(self, dataset, load, batch, position):
+        # The checkpoint commits with the rows: resuming never loads a
+        # batch twice.
+        with transaction.atomic():
+            imported, pairs = load(batch)
+            self.checkpoint.record(dataset, position, pairs)
+        return imported
+
+    def read(self, name, skip=0):
+        """Yield ``(line number, record)`` from ``<name>.jsonl[.gz]``."""
+        path = os.path.join(self.input_dir, f'{name}.jsonl')
+        if not os.path.exists(path) and os.path.exists(path + '.gz'):
+            path += '.gz'
+        if not os.path.exists(path):
+            return
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as fh:
+            for line_number, line in enumerate(fh, 1):
+                if line_number > skip and line.strip():
+                    yield line_number, json.loads(line)
+
+    def new_id(self, dataset, source_id):
+        if source_id is None:
+            return None
+        return self.checkpoint.id_map(dataset).get(str(source_id))
+
+    # Loaders insert one batch and return the number of rows inserted and
+    # the [source id, new id] pairs of the batch.
+
+    def import_users(self, records):
+        taken = dict(User.objects.filter(
+            username__in=[r['username'] for r in records]
+        ).values_list('username', 'pk'))
+        unusable_password = make_password(None)
+        pairs, new, sources = [], [], []
+        for r in records:
+            if self.match_users and r['username'] in taken:
+                pairs.append((str(r['id']), taken[r['username']]))
+                continue
+            # Never hand an imported author a local account: a taken
+            # username gets a suffix (``name_2``, ...).
+            username = allocate_username(r['username'], taken)
+            taken[username] = None
+            new.append(User(
+                username=username,
+                # Exports leave out emails; the address must be unique.
+                email=r.get('email') or f'{username}@users.invalid',
+                password=unusable_password,
+                first_name=r.get('first_name', ''),
+                last_name=r.get('last_name', ''),
+                bio=r.get('bio', ''),
+                profile_photo=r.get('profile_photo') or '',
+                date_joined=parse_datetime(r['date_joined']),
+            ))
+            sources.append(r['id'])
+        User.objects.bulk_create(new)
+        pairs.extend(
+            (str(source), user.pk) for source, user in zip(sources, new))
+        return len(new), pairs
+
+    def import_tags(self, records):
+        Tag.objects.bulk_create(
+            [Tag(name=r['name'], slug=r['slug']) for r in records],
+            ignore_conflicts=True)
+        pks = dict(Tag.objects.filter(
+            slug__in=[r['slug'] for r in records]).values_list('slug', 'pk'))
+        return len(records), [(str(r['id']), pks[r['slug']]) for r in records]
+
+    def import_posts(self, records):
+        if self.slugs is None:
+            self.slugs = SlugAllocator()
+        posts, sources = [], []
+        for r in records:
+            author_id = self.new_id('users', r['author_id'])
+            if author_id is None:
+                self.skipped += 1
+                continue
+            post = BlogPost(
+                author_id=author_id, title=r['title'],
+                slug=self.slugs.allocate(r.get('slug') or r['title']),
+                thumbnail=r['thumbnail'], content=r['content'])
+            post.excerpt, post.word_count, post.reading_time = summarize_content(
+                post.content)
+            post.created_at = parse_datetime(r['created_at'])
+            post.updated_at = parse_datetime(r['updated_at'])
+            posts.append(post)
+            sources.append(r['id'])
+        bulk_create_with_timestamps(BlogPost, posts)
+        return len(posts), [
+            (str(source), post.pk) for source, post in zip(sources, posts)]
+
+    def import_post_tags(self, records):
+        through = BlogPost.tags.through
+        links = []
+        for r in records:
+            post_id = self.new_id('posts', r['blogpost_id'])
+            tag_id = self.new_id('tags', r['tag_id'])
+            if post_id is None or tag_id is None:
+                self.skipped += 1
+                continue
+            links.append(through(blogpost_id=post_id, tag_id=tag_id))
+        through.objects.bulk_create(links, ignore_conflicts=True)
+        return len(links), []
+
+    def import_comments(self, records):
+        return self.insert_comments(
+            [r for r in records if r['parent_id'] is None],
+            post_id=lambda r: self.new_id('posts', r['post_id']),
+            parent_id=lambda r: None)
+
+    def import_replies(self, records):
+        return self.insert_comments(
+            [r for r in records if r['parent_id'] is not None],
+            post_id=lambda r: None,
+            parent_id=lambda r: self.new_id('comments', r['parent_id']))
+
+    def insert_comments(self, records, post_id, parent_id):
+        comments, sources = [], []
+        for r in records:
+            comment = Comment(
+                post_id=post_id(r), parent_id=parent_id(r),
+                author_id=self.new_id('users', r['author_id']),
+                content=r['content'])
+            if comment.author_id is None or (
+                    comment.post_id is None and comment.parent_id is None):
+                self.skipped += 1
+                continue
+            comment.created_at = parse_datetime(r['created_at'])
+            comment.updated_at = parse_datetime(r['updated_at'])
+            comments.append(comment)
+            sources.append(r['id'])
+        bulk_create_with_timestamps(Comment, comments)
+        return len(comments), [
+            (str(source), comment.pk)
+            for source, comment in zip(sources, comments)]
+
+    def finish(self):
+        refresh_derived_data(
+            list(self.checkpoint.id_map('posts').values()),
+            min(self.checkpoint.id_map('comments').values(), default=None),
+            batch_size=self.batch_size)
+
+
+def refresh_derived_data(post_ids, first_comment_pk=None, batch_size=1000):
+    """
+    Rebuild what signals would have kept up to date after bulk inserts:
+    the search index of ``post_ids``, their comment counts, the reply
+    counts of comments from ``first_comment_pk`` on, the tag counts and
+    the cached counts and responses.
+    """
+    for start in range(0, len(post_ids), batch_size):
+        index_posts(post_ids[start:start + batch_size])
+    if post_ids:
+        list(reconcile_counts(
+            actual_comment_counts().filter(pk__gte=min(post_ids)),
+            'comment_count', batch_size=batch_size))
+    if first_comment_pk is not None:
+        list(reconcile_counts(
+            actual_reply_counts().filter(pk__gte=first_comment_pk),
+            'reply_count', batch_size=batch_size))
+    reconcile_tag_counts()
+    invalidate_counts(BlogPost)
+    invalidate_counts(Comment)
+    cache.invalidate('posts', 'tags')
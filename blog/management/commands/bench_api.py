@@ -0,0 +1,316 @@
+import json
+import subprocess
+from itertools import count
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.test import override_settings
+from django.urls import URLResolver, get_resolver, resolve, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from blog.benchmarks import WORDS, summarize_samples, time_request
+from blog.models import BlogPost, Comment, Tag
+from utils import cache
+from utils.counting import invalidate_counts
+
+
+User = get_user_model()
+
+# A 1x1 GIF, so uploads pass ImageField validation.
+PIXEL = (
+    b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04'
+    b'\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D'
+    b'\x01\x00;'
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every route of the blog and accounts apps in-process "
+        "against a seeded database (see seed_blog) and report p50/p95/p99 "
+        "latency, queries and response size per route. Writes are rolled "
+        "back and uploads go to in-memory storage."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--password', default='bench-password',
+            help="Password of the seeded users.")
+        parser.add_argument(
+            '--only', nargs='+', metavar='SCENARIO',
+            help="Run only these scenarios, e.g. posts:list.")
+        parser.add_argument('--output', help="Save the results as JSON.")
+        parser.add_argument(
+            '--compare', help="JSON results of an earlier run to diff against.")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as fh:
+                baseline = json.load(fh)['routes']
+
+        storages = {
+            'default': {
+                'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+            'staticfiles': {
+                'BACKEND':
+                    'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        }
+        self.touched = []
+        # No debug toolbar: it would dominate the timings in DEBUG.
+        with override_settings(STORAGES=storages, INTERNAL_IPS=[],
+                               ALLOWED_HOSTS=['testserver']):
+            try:
+                with transaction.atomic():
+                    routes = self.run(options)
+                    raise Rollback
+            except Rollback:
+                pass
+            finally:
+                # The cache isn't rolled back with the database.
+                cache.invalidate('posts', 'tags', *self.touched)
+                invalidate_counts(BlogPost)
+                invalidate_counts(Comment)
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'created_at': timezone.now().isoformat(),
+                'iterations': options['iterations'],
+                'rows': {
+                    'users': User.objects.count(),
+                    'posts': BlogPost.objects.count(),
+                    'comments': Comment.objects.count(),
+                    'tags': Tag.objects.count(),
+                },
+            },
+            'routes': routes,
+        }
+        self.print_report(routes, baseline)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(f"Results saved to {options['output']}.")
+
+    def run(self, options):
+        scenarios = self.scenarios(options['password'])
+        self.check_coverage(scenarios)
+        if options['only']:
+            scenarios = {name: scenarios[name] for name in options['only']}
+        routes = {}
+        for name, (method, prepare, user) in scenarios.items():
+            client = APIClient(HTTP_ACCEPT='application/json')
+            if user is not None:
+                client.credentials(HTTP_AUTHORIZATION=self.bearer(user))
+            send = getattr(client, method)
+            for _ in range(options['warmup']):
+                time_request(send, **prepare())
+            routes[name] = summarize_samples([
+                time_request(send, **prepare())
+                for _ in range(options['iterations'])
+            ])
+        return routes
+
+    def scenarios(self, password):
+        """
+        ``{name: (client method, prepare, user)}``. ``prepare()`` runs
+        untimed before every request and returns the request's arguments;
+        requests are sent with the user's token, if any.
+        """
+        post = BlogPost.objects.order_by('-comment_count', 'pk').first()
+        comment = Comment.objects.filter(parent=None).order_by(
+            '-reply_count', 'pk').first()
+        if post is None or comment is None:
+            raise CommandError("Nothing to benchmark; run seed_blog first.")
+        author = post.author
+        reader = User.objects.exclude(pk=author.pk).order_by('pk').first()
+        top_tags = list(Tag.objects.order_by('-post_count', 'pk')[:2])
+        top_author = BlogPost.objects.values('author').annotate(
+            posts=Count('id')).order_by('-posts', 'author').first()['author']
+        self.password = password
+        self.tokens = {}
+        self.touched += [
+            f'post:{post.pk}', f'user:{author.pk}', f'user-posts:{author.pk}',
+            f'user-posts:{top_author}', f'tag:{top_tags[0].slug}']
+        serial = count()
+
+        def get(path, **params):
+            return lambda: {'path': path, 'data': params}
+
+        def new_post():
+            return BlogPost.objects.create(
+                thumbnail='thumbnails/bench.gif', author=author,
+                title=f'Bench {next(serial)}', content='Bench content')
+
+        def new_comment(**fields):
+            return Comment.objects.create(
+                author=author, content='Bench comment', **fields)
+
+        def new_account():
+            n = next(serial)
+            user = User.objects.create_user(
+                email=f'bench-{n}@example.com', username=f'bench-{n}',
+                password=password)
+            return {'path': reverse('user-delete'),
+                    'HTTP_AUTHORIZATION': self.bearer(user)}
+
+        def register():
+            n = next(serial)
+            return {'path': reverse('user-register'), 'data': {
+                'email': f'bench-register-{n}@example.com',
+                'username': f'bench_register_{n}',
+                'first_name': 'Bench', 'last_name': 'Bench',
+                'password': 'Bench#pass1', 'confirm_password': 'Bench#pass1',
+            }}
+
+        posts = reverse('blogs-list')
+        post_detail = reverse('blogs-detail', args=[post.slug])
+        comments = reverse('get_post_comments', args=[post.pk])
+        replies = reverse('get_comment_replies', args=[comment.pk])
+        # Both reply routes are named 'reply'; reverse() finds the other one.
+        create_reply = replies.replace('/replies/', '/reply/')
+
+        return {
+            'posts:list': ('get', get(posts), None),
+            'posts:list-cursor': ('get', get(posts, pagination='cursor'), None),
+            'posts:list-tags': ('get', get(
+                posts, tags=','.join(tag.slug for tag in top_tags),
+                match='all'), None),
+            'posts:search': ('get', get(
+                reverse('blogs-search'), q=f'{WORDS[0]} {WORDS[1]}'), None),
+            'posts:retrieve': ('get', get(post_detail), None),
+            'posts:user': ('get', get(
+                reverse('get_user_posts', args=[top_author])), None),
+            'posts:tag': ('get', get(
+                reverse('get_posts_by_tag', args=[top_tags[0].slug])), None),
+            'posts:create': ('post', lambda: {
+                'path': posts, 'format': 'multipart', 'data': {
+                    'title': f'Bench {next(serial)}', 'content': 'Bench',
+                    'tag_names': ['bench'],
+                    'thumbnail': SimpleUploadedFile(
+                        'bench.gif', PIXEL, content_type='image/gif'),
+                },
+            }, author),
+            'posts:update': ('patch', lambda: {
+                'path': post_detail, 'format': 'json',
+                'data': {'content': f'Edited {next(serial)}'},
+            }, author),
+            'posts:delete': ('delete', lambda: {
+                'path': reverse('blogs-detail', args=[new_post().slug]),
+            }, author),
+            'tags:list': ('get', get(reverse('tags-list')), reader),
+            'tags:cloud': ('get', get(reverse('tags-cloud')), None),
+            'tags:create': ('post', lambda: {
+                'path': reverse('tags-list'),
+                'data': {'name': f'bench {next(serial)}'},
+            }, reader),
+            'comments:list': ('get', get(comments), None),
+            'comments:export': ('get', get(
+                reverse('export_post_comments', args=[post.pk])), reader),
+            'comments:create': ('post', lambda: {
+                'path': comments, 'data': {'content': 'Bench comment'},
+            }, reader),
+            'comments:update': ('put', lambda: {
+                'path': reverse('comment', args=[new_comment(post=post).pk]),
+                'data': {'content': 'Edited'},
+            }, author),
+            'comments:delete': ('delete', lambda: {
+                'path': reverse('comment', args=[new_comment(post=post).pk]),
+            }, author),
+            'replies:list': ('get', get(replies), None),
+            'replies:create': ('post', lambda: {
+                'path': create_reply, 'data': {'content': 'Bench reply'},
+            }, reader),
+            'replies:update': ('put', lambda: {
+                'path': reverse('reply', args=[new_comment(parent=comment).pk]),
+                'data': {'content': 'Edited'},
+            }, author),
+            'replies:delete': ('delete', lambda: {
+                'path': reverse('reply', args=[new_comment(parent=comment).pk]),
+            }, author),
+            'accounts:register': ('post', register, None),
+            'accounts:login': ('post', lambda: {
+                'path': reverse('user-login'),
+                'data': {'email': author.email, 'password': password},
+            }, None),
+            'accounts:profile': ('get', get(
+                reverse('user-profile', args=[author.pk])), None),
+            'accounts:profile-update': ('patch', lambda: {
+                'path': reverse('user-profile', args=[author.pk]),
+                'data': {'bio': f'Bio {next(serial)}'},
+            }, author),
+            # Each request deletes a fresh account.
+            'accounts:delete': ('delete', new_account, None),
+        }
+
+    def bearer(self, user):
+        if user.pk not in self.tokens:
+            response = APIClient().post(
+                reverse('user-login'),
+                {'email': user.email, 'password': self.password})
+            if response.status_code != 200:
+                raise CommandError(
+                    f"Can't log in as {user.email}; check --password.")
+            self.tokens[user.pk] = response.data['tokens']['access']
+        return f'Bearer {self.tokens[user.pk]}'
+
+    def check_coverage(self, scenarios):
+        covered = {
+            resolve(prepare()['path']).route
+            for _, prepare, _ in scenarios.values()
+        }
+        for route in api_routes():
+            if route not in covered:
+                self.stderr.write(f'Not benchmarked: {route}')
+
+    def print_report(self, routes, baseline):
+        header = (f"{'scenario':<24} {'p50 ms':>8} {'p95 ms':>8} "
+                  f"{'p99 ms':>8} {'queries':>8} {'bytes':>8}")
+        if baseline:
+            header += f" {'p50 diff':>9} {'queries diff':>13}"
+        self.stdout.write(header)
+        for name, row in routes.items():
+            line = (f"{name:<24} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+                    f"{row['p99_ms']:>8.2f} {row['queries']:>8g} "
+                    f"{row['bytes']:>8}")
+            old = (baseline or {}).get(name)
+            if old:
+                change = (row['p50_ms'] / old['p50_ms'] - 1) * 100
+                line += (f" {change:>+8.1f}% "
+                         f"{row['queries'] - old['queries']:>+13g}")
+            errors = [status for status in row['statuses'] if status >= 400]
+            if errors:
+                line += ' ' + self.style.ERROR(f'HTTP {errors}')
+            self.stdout.write(line)
+
+
+def api_routes(prefix='api/v1/'):
+    """The routes under ``prefix``, without format suffixes."""
+    def walk(patterns, parent=''):
+        for pattern in patterns:
+            route = URLResolver._join_route(parent, str(pattern.pattern))
+            if isinstance(pattern, URLResolver):
+                yield from walk(pattern.url_patterns, route)
+            elif route.startswith(prefix) and '<format>' not in route:
+                yield route
+    return sorted(set(walk(get_resolver().url_patterns)))
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,97 @@
+import time
+
+import rsa
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from google.oauth2 import service_account
+
+from accounts.avatars import AVATAR_SIZES
+from blog.benchmarks import seed_dataset, time_call
+from blog.models import BlogPost
+from blog.renditions import THUMBNAIL_WIDTHS
+from blog.serializers import BlogPostCardSerializer
+
+
+MODES = [
+    ('signed', {'url_cache_size': 0}),
+    ('signed, cached', {}),
+    ('public', {'public_urls': True}),
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time serializing a page of post cards (thumbnail, srcset and author "
+        "avatar URLs) through MediaStorage with signed URLs, cached signed "
+        "URLs and public URLs. URLs are signed with a throwaway local key; "
+        "nothing is sent to Cloud Storage. The seeded rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=25)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--key-bits', type=int, default=2048)
+
+    def handle(self, *args, **options):
+        credentials = throwaway_credentials(options['key_bits'])
+        self.stdout.write(
+            f"{'mode':<16} {'first page':>11} {'page':>9} {'pages/s':>8}")
+        try:
+            with transaction.atomic():
+                posts = self.page(options['posts'])
+                for label, storage_options in MODES:
+                    self.run(label, posts, options['repeat'], {
+                        'credentials': credentials, 'project_id': 'bench',
+                        **storage_options,
+                    })
+                raise Rollback
+        except Rollback:
+            pass
+
+    def page(self, size):
+        _, _, post_ids = seed_dataset(users=size, posts=size, tags=5)
+        posts = list(BlogPost.objects.filter(pk__in=post_ids).select_related(
+            'author').prefetch_related('tags'))
+        for post in posts:
+            post.thumbnail_widths = list(THUMBNAIL_WIDTHS)
+            post.author.profile_photo = f'profile_photos/{post.author_id}.jpg'
+            post.author.avatar_sizes = list(AVATAR_SIZES)
+        return posts
+
+    def run(self, label, posts, repeat, storage_options):
+        storages = {
+            'default': {
+                'BACKEND': 'custom_storages.MediaStorage',
+                'OPTIONS': storage_options,
+            },
+            'staticfiles': {
+                'BACKEND':
+                    'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        }
+        with override_settings(STORAGES=storages):
+            def serialize():
+                return BlogPostCardSerializer(posts, many=True).data
+
+            start = time.perf_counter()
+            serialize()
+            first = (time.perf_counter() - start) * 1000
+            page = time_call(serialize, repeat=repeat)
+        self.stdout.write(
+            f'{label:<16} {first:>9.1f}ms {page:>7.1f}ms {1000 / page:>8.1f}')
+
+
+def throwaway_credentials(bits):
+    """Service account credentials with a fresh key, good for signing only."""
+    _, private_key = rsa.newkeys(bits)
+    return service_account.Credentials.from_service_account_info({
+        'type': 'service_account',
+        'client_email': 'bench@example.iam.gserviceaccount.com',
+        'private_key': private_key.save_pkcs1().decode(),
+        'private_key_id': 'bench',
+        'token_uri': 'https://oauth2.googleapis.com/token',
+    })
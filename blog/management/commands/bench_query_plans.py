@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from blog.benchmarks import seed_dataset, time_call
+from blog.models import BlogPost, Comment
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway dataset and show the plans and timings of the hot "
+        "list queries with and without the composite indexes. Everything, "
+        "including the seeded rows, is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                users, tags, post_ids = seed_dataset(
+                    users=options['users'], posts=options['posts'],
+                    tags=options['tags'], comments=options['comments'])
+                queries = self.hot_queries(users[0], tags[0], post_ids[0])
+                self.report('with indexes', queries, options['repeat'])
+                self.drop_indexes()
+                self.report('without indexes', queries, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def hot_queries(self, user, tag, post_id):
+        return {
+            'posts page': lambda: BlogPost.objects.defer('content')[:25],
+            'user posts page': lambda: BlogPost.objects.filter(
+                author=user).defer('content')[:25],
+            'tag posts page': lambda: BlogPost.objects.filter(
+                tags=tag).defer('content')[:25],
+            'post comments page': lambda: Comment.objects.filter(
+                post_id=post_id, parent=None)[:10],
+        }
+
+    def drop_indexes(self):
+        # Plain DDL rather than the schema editor, which SQLite refuses to
+        # use inside a transaction.
+        with connection.cursor() as cursor:
+            for model in (BlogPost, Comment):
+                for index in model._meta.indexes:
+                    cursor.execute(
+                        f'DROP INDEX {connection.ops.quote_name(index.name)}')
+
+    def report(self, label, queries, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'== {label} =='))
+        for name, build in queries.items():
+            elapsed = time_call(lambda: list(build()), repeat)
+            self.stdout.write(self.style.MIGRATE_LABEL(
+                f'{name}: {elapsed:.2f} ms'))
+            self.stdout.write(self.explain(build(), label))
+            self.stdout.write('')
+
+    def explain(self, queryset, label):
+        # QuerySet.explain() would reuse SQLite's cached statement and show
+        # the plan from before the indexes were dropped; the trailing
+        # comment makes the statement text unique per round.
+        sql, params = queryset.query.sql_with_params()
+        prefix = connection.ops.explain_query_prefix()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {sql} -- {label}', params)
+            return '\n'.join(
+                ' '.join(str(column) for column in row)
+                for row in cursor.fetchall()
+            )
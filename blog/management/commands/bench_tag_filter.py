@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.benchmarks import seed_dataset, time_call
+from blog.filters import TAG_MATCH_ALL, TAG_MATCH_ANY, filter_by_tags
+from blog.models import BlogPost
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time multi-tag post filters as the number of tags per post grows: "
+        "the grouped 'all' filter, the 'any' filter, and chained joins for "
+        "comparison. The number of tags grows with the tags per post so each "
+        "tag keeps the same share of posts. The seeded rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument(
+            '--tag-spread', type=int, default=10,
+            help="Each tag is on about 1/N of the posts.")
+        parser.add_argument(
+            '--tags-per-post', type=int, nargs='+', default=[2, 4, 8, 16])
+        parser.add_argument('--filter-tags', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'tags/post':>9} {'all (grouped)':>14} {'any':>9} "
+            f"{'all (joins)':>12}  matches")
+        for per_post in options['tags_per_post']:
+            try:
+                with transaction.atomic():
+                    self.run(per_post, options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def run(self, per_post, options):
+        _, tags, _ = seed_dataset(
+            users=50, posts=options['posts'],
+            tags=per_post * options['tag_spread'],
+            tags_per_post=per_post)
+        slugs = [tag.slug for tag in tags[:options['filter_tags']]]
+        page = BlogPost.objects.defer('content')
+
+        def grouped():
+            return list(filter_by_tags(page, slugs, TAG_MATCH_ALL)[:25])
+
+        def any_tag():
+            return list(filter_by_tags(page, slugs, TAG_MATCH_ANY)[:25])
+
+        def joins():
+            queryset = page
+            for slug in slugs:
+                queryset = queryset.filter(tags__slug=slug)
+            return list(queryset[:25])
+
+        matches = filter_by_tags(page, slugs, TAG_MATCH_ALL).count()
+        repeat = options['repeat']
+        self.stdout.write(
+            f'{per_post:>9} {time_call(grouped, repeat):>11.2f} ms '
+            f'{time_call(any_tag, repeat):>6.2f} ms '
+            f'{time_call(joins, repeat):>9.2f} ms  {matches}')
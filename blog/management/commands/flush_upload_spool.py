@@ -0,0 +1,25 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from custom_storages import SpooledStorage
+
+
+class Command(BaseCommand):
+    help = (
+        "Upload the files left in the upload spool, e.g. after their "
+        "retries ran out or the process stopped before uploading them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--timeout', type=float, default=None)
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, SpooledStorage):
+            raise CommandError("The default storage doesn't spool uploads.")
+        names = list(default_storage.spooled())
+        futures = [default_storage.upload(name) for name in names]
+        default_storage.join(options['timeout'])
+        uploaded = sum(
+            1 for future in futures if future.done() and future.result())
+        self.stdout.write(self.style.SUCCESS(
+            f'{uploaded} of {len(names)} spooled files uploaded.'))
@@ -0,0 +1,65 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.avatars import delete_avatars
+from blog.models import BlogPost, MediaBlob
+from blog.renditions import delete_renditions
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the content-addressed media files no post or profile points "
+        "at any more (thumbnails and profile photos, with their renditions), "
+        "in batches. Blobs unreferenced for less than --grace seconds are kept, "
+        "as an upload may be about to reference them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--grace', type=int, default=3600)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="List the blobs that would be deleted.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options['grace'])
+        unreferenced = MediaBlob.objects.filter(
+            ref_count=0, updated_at__lt=cutoff).order_by('pk')
+        thumbnails = BlogPost._meta.get_field('thumbnail').upload_to
+        photos = User._meta.get_field('profile_photo').upload_to
+        deleted = freed = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                # Locked rows can't be referenced (see utils.media.store_blob)
+                # until they are gone.
+                batch = list(unreferenced.select_for_update(skip_locked=True)
+                             .filter(pk__gt=last_pk)[:options['batch_size']])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                for blob in batch:
+                    if options['dry_run']:
+                        self.stdout.write(blob.name)
+                        continue
+                    if blob.name.startswith(thumbnails):
+                        delete_renditions(blob.name)
+                    elif blob.name.startswith(photos):
+                        delete_avatars(blob.name)
+                    default_storage.delete(blob.name)
+                if not options['dry_run']:
+                    MediaBlob.objects.filter(
+                        pk__in=[blob.pk for blob in batch]).delete()
+                deleted += len(batch)
+                freed += sum(blob.size for blob in batch)
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {deleted} blobs ({freed} bytes).'))
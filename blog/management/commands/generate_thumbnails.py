@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from blog.models import BlogPost
+from blog.renditions import generate_renditions
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the resized thumbnails of posts that have none yet (or of "
+        "every post with --all), in parallel threads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument(
+            '--all', action='store_true',
+            help="Re-render posts that already have renditions.")
+
+    def handle(self, *args, **options):
+        posts = BlogPost.objects.exclude(thumbnail='').order_by('pk')
+        pks = [
+            pk for pk, widths in posts.values_list('pk', 'thumbnail_widths')
+            if options['all'] or not widths
+        ]
+        self.stdout.write(f'Rendering thumbnails of {len(pks)} posts.')
+        rendered = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for pk, error in zip(pks, executor.map(self.render, pks)):
+                if error is None:
+                    rendered += 1
+                else:
+                    failed += 1
+                    self.stderr.write(f'post {pk}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{rendered} rendered, {failed} failed.'))
+
+    def render(self, pk):
+        try:
+            generate_renditions(pk)
+        except Exception as error:
+            return error
+        finally:
+            connection.close()
+        return None
@@ -0,0 +1,42 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from blog.imports import IMPORT_BATCH_SIZE, BlogImporter
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-load users, tags, posts, post tags and comments from the JSONL "
+        "files written by export_blog. Rows are inserted in batches with new "
+        "ids; each batch is checkpointed in the database as it commits, so "
+        "running the command again after a failure resumes where it stopped. "
+        "Imported users get new accounts with unusable passwords."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input_dir')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument(
+            '--checkpoint',
+            help="Name of the checkpoint (default: the absolute input_dir).")
+        parser.add_argument(
+            '--restart', action='store_true',
+            help="Forget the checkpoint and import the files from the start.")
+        parser.add_argument(
+            '--match-users', action='store_true',
+            help="Attribute the content of imported users to the existing "
+                 "accounts with the same username, instead of creating "
+                 "accounts with a suffixed username.")
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint'] or os.path.abspath(
+            options['input_dir'])
+        importer = BlogImporter(
+            options['input_dir'], checkpoint,
+            batch_size=options['batch_size'],
+            match_users=options['match_users'], log=self.stdout.write)
+        if options['restart']:
+            importer.checkpoint.clear()
+        importer.run()
+        self.stdout.write(self.style.SUCCESS('Import complete.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from blog.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of every post, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index(
+            batch_size=options['batch_size'],
+            callback=lambda done: self.stdout.write(f'Indexed {done} posts'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Search index rebuilt for {indexed} posts.'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from blog.comment_counts import (
+    actual_comment_counts,
+    actual_reply_counts,
+    reconcile_counts,
+)
+from utils import cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute BlogPost.comment_count and Comment.reply_count in chunks "
+        "and fix the rows whose counter drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report drifted counters without fixing them.")
+
+    def handle(self, *args, **options):
+        checks = [
+            ('post', actual_comment_counts(), 'comment_count'),
+            ('comment', actual_reply_counts(), 'reply_count'),
+        ]
+        for label, queryset, field in checks:
+            drifted = 0
+            rows = reconcile_counts(
+                queryset, field, batch_size=options['batch_size'],
+                dry_run=options['dry_run'])
+            for row in rows:
+                drifted += 1
+                self.stdout.write(
+                    f"{label} {row['pk']}: {row[field]} -> {row['actual_count']}")
+                if label == 'post' and not options['dry_run']:
+                    cache.invalidate(f"post:{row['pk']}")
+            verb = 'drifted' if options['dry_run'] else 'reconciled'
+            self.stdout.write(self.style.SUCCESS(
+                f'{drifted} {label} {field} values {verb}.'))
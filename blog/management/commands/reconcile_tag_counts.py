@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from blog.tag_counts import reconcile_tag_counts
+from utils import cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute Tag.post_count from the posts-tags table and fix the tags "
+        "whose counter drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report drifted counters without fixing them.")
+
+    def handle(self, *args, **options):
+        drifted = reconcile_tag_counts(dry_run=options['dry_run'])
+        for tag in drifted:
+            self.stdout.write(
+                f'{tag.slug}: {tag.post_count} -> {tag.actual_count}')
+        if drifted and not options['dry_run']:
+            cache.invalidate('tags')
+        verb = 'drifted' if options['dry_run'] else 'reconciled'
+        self.stdout.write(self.style.SUCCESS(f'{len(drifted)} tag counts {verb}.'))
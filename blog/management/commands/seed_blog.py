@@ -0,0 +1,54 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.benchmarks import seed_blog
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic blog for load testing: users, posts, long-tail "
+        "tags and skewed comment threads, with a few viral posts and a few "
+        "comments carrying most of the replies. Counters and the search "
+        "index are filled in, so the API can serve it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--posts', type=int, default=5000)
+        parser.add_argument('--tags', type=int, default=100)
+        parser.add_argument(
+            '--comments', type=int, default=50000,
+            help="Comments and replies together.")
+        parser.add_argument(
+            '--reply-share', type=float, default=0.5,
+            help="Fraction of --comments that are replies.")
+        parser.add_argument('--viral-posts', type=int, default=5)
+        parser.add_argument(
+            '--viral-share', type=float, default=0.3,
+            help="Fraction of top-level comments on the viral posts.")
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help="Zipf exponent for authors, tags, posts and reply threads.")
+        parser.add_argument('--password', default='bench-password')
+        parser.add_argument(
+            '--prefix', default='seed',
+            help="Prefix of usernames, emails and slugs; use a new one to "
+                 "seed the same database again.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            counts = seed_blog(
+                users=options['users'], posts=options['posts'],
+                tags=options['tags'], comments=options['comments'],
+                reply_share=options['reply_share'],
+                viral_posts=options['viral_posts'],
+                viral_share=options['viral_share'], skew=options['skew'],
+                password=options['password'], prefix=options['prefix'],
+                rng=random.Random(options['seed']), log=self.stdout.write)
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Seeded {summary}.'))
+        self.stdout.write(
+            f"Log in as {options['prefix']}0@example.com / {options['password']}.")
@@ -0,0 +1,61 @@
+# Generated by Django 4.2 on 2026-10-18 16:37
+
+import math
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+
+# A copy of blog.models.summarize_content as of this migration, so later
+# changes to it don't change what this migration does.
+EXCERPT_LENGTH = 200
+WORDS_PER_MINUTE = 200
+
+
+def summarize_content(content):
+    words = strip_tags(content or '').split()
+    excerpt = Truncator(' '.join(words)).chars(EXCERPT_LENGTH)
+    reading_time = math.ceil(len(words) / WORDS_PER_MINUTE)
+    return excerpt, len(words), reading_time
+
+
+def fill_summaries(apps, schema_editor):
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    batch = []
+    for post in BlogPost.objects.only('id', 'content').iterator(chunk_size=500):
+        post.excerpt, post.word_count, post.reading_time = summarize_content(
+            post.content)
+        batch.append(post)
+        if len(batch) == 500:
+            BlogPost.objects.bulk_update(
+                batch, ['excerpt', 'word_count', 'reading_time'])
+            batch = []
+    BlogPost.objects.bulk_update(
+        batch, ['excerpt', 'word_count', 'reading_time'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_alter_comment_post'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='excerpt',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='reading_time',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='blogpost',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
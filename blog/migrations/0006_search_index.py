@@ -0,0 +1,54 @@
+from django.db import migrations
+
+
+# The search index as this migration creates it; blog.search maintains it
+# from then on. Other databases have no search index.
+TAG_NAMES_SQL = (
+    "SELECT {agg} FROM blog_tag t "
+    "JOIN blog_blogpost_tags pt ON pt.tag_id = t.id "
+    "WHERE pt.blogpost_id = p.id"
+)
+
+INSTALL = {
+    'postgresql': [
+        'ALTER TABLE blog_blogpost ADD COLUMN search_vector tsvector',
+        'CREATE INDEX blogpost_search_idx ON blog_blogpost '
+        'USING GIN (search_vector)',
+        "UPDATE blog_blogpost p SET search_vector = "
+        "setweight(to_tsvector('english', coalesce(p.title, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(({tag_names}), '')), 'B') || "
+        "setweight(to_tsvector('english', coalesce(p.content, '')), 'C')".format(
+            tag_names=TAG_NAMES_SQL.format(agg="string_agg(t.name, ' ')")),
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE blog_blogpost_fts USING "
+        "fts5(title, content, tags, tokenize='porter unicode61')",
+        "INSERT INTO blog_blogpost_fts (rowid, title, content, tags) "
+        "SELECT p.id, p.title, p.content, coalesce(({tag_names}), '') "
+        "FROM blog_blogpost p".format(
+            tag_names=TAG_NAMES_SQL.format(agg="group_concat(t.name, ' ')")),
+    ],
+}
+
+UNINSTALL = {
+    'postgresql': ['ALTER TABLE blog_blogpost DROP COLUMN search_vector'],
+    'sqlite': ['DROP TABLE blog_blogpost_fts'],
+}
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(INSTALL), run(UNINSTALL)),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-18 16:47
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_post_counts(apps, schema_editor):
+    Tag = apps.get_model('blog', 'Tag')
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    links = BlogPost.tags.through.objects.filter(
+        tag_id=OuterRef('pk')).values('tag_id').annotate(
+        total=Count('blogpost_id')).values('total')
+    Tag.objects.update(post_count=Coalesce(Subquery(links), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['-post_count', 'name'], name='tag_popularity_idx'),
+        ),
+        migrations.RunPython(fill_post_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2 on 2026-10-18 16:51
+
+from django.db import migrations, models
+from django.db.models import F, Func, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset):
+    return Coalesce(Subquery(
+        queryset.order_by().annotate(
+            total=Func(F('id'), function='COUNT')).values('total')
+    ), 0)
+
+
+def fill_counts(apps, schema_editor):
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    Comment = apps.get_model('blog', 'Comment')
+    BlogPost.objects.update(comment_count=_count(Comment.objects.filter(
+        Q(post_id=OuterRef('pk')) | Q(parent__post_id=OuterRef('pk')))))
+    Comment.objects.update(reply_count=_count(
+        Comment.objects.filter(parent_id=OuterRef('pk'))))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_tag_post_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
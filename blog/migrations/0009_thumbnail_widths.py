@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 17:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_comment_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='thumbnail_widths',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
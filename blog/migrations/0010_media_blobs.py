@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-18 17:17
+
+from django.db import migrations, models
+import utils.media
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_thumbnail_widths'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(max_length=64)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='blogpost',
+            name='thumbnail',
+            field=utils.media.DedupImageField(upload_to='thumbnails/'),
+        ),
+        migrations.AddIndex(
+            model_name='mediablob',
+            index=models.Index(fields=['ref_count', 'updated_at'], name='mediablob_unreferenced_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_media_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checkpoint', models.CharField(max_length=255)),
+                ('dataset', models.CharField(max_length=20)),
+                ('position', models.PositiveIntegerField()),
+                ('ids', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='importbatch',
+            index=models.Index(fields=['checkpoint', 'id'], name='importbatch_checkpoint_idx'),
+        ),
+    ]
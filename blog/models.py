@@ -1,12 +1,31 @@
+import math
+
 from django.db import models
 from django.contrib.auth import get_user_model
-from django.utils.text import slugify
+from django.utils.html import strip_tags
+from django.utils.text import slugify, Truncator
+
+from utils.media import DedupImageField, DedupMediaModel
 
 User = get_user_model()
 
+EXCERPT_LENGTH = 200
+WORDS_PER_MINUTE = 200
+
 
-class BlogPost(models.Model):
-    thumbnail = models.ImageField(upload_to="thumbnails/")
+def summarize_content(content):
+    """Return ``(excerpt, word_count, reading_time)`` for a post body."""
+    words = strip_tags(content or '').split()
+    excerpt = Truncator(' '.join(words)).chars(EXCERPT_LENGTH)
+    reading_time = math.ceil(len(words) / WORDS_PER_MINUTE)
+    return excerpt, len(words), reading_time
+
+
+class BlogPost(DedupMediaModel):
+    thumbnail = DedupImageField(upload_to="thumbnails/")
+    # Widths of the thumbnail renditions rendered so far (see
+    # blog.renditions); empty until the upload has been processed.
+    thumbnail_widths = models.JSONField(default=list, blank=True)
     title = models.CharField(max_length=255)
     slug = models.SlugField(max_length=255, unique=True)
     author = models.ForeignKey(
@@ -14,12 +33,29 @@ class BlogPost(models.Model):
     )
     content = models.TextField(default=None)
     tags = models.ManyToManyField('Tag', related_name='blog_posts')
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True)
+    word_count = models.PositiveIntegerField(default=0)
+    reading_time = models.PositiveIntegerField(default=0)
+    # Comments and replies on the post, kept up to date from blog.signals
+    # (see reconcile_comment_counts).
+    comment_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'],
+                         name='blogpost_created_idx'),
+            models.Index(fields=['author', '-created_at', '-id'],
+                         name='blogpost_author_created_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if self.title != self._old_title or not self.slug:
             self.slug = slugify(self.title)
+        self.excerpt, self.word_count, self.reading_time = summarize_content(
+            self.content)
         super().save(*args, **kwargs)
 
     def __init__(self, *args, **kwargs):
@@ -39,9 +75,19 @@ class Comment(models.Model):
     parent = models.ForeignKey(
         'self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies'
     )
+    reply_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['post', 'parent', 'created_at', 'id'],
+                         name='comment_post_created_idx'),
+            models.Index(fields=['parent', 'created_at', 'id'],
+                         name='comment_parent_created_idx'),
+        ]
+
     def __str__(self):
         return f'Comment by @{self.author.username}'
 
@@ -49,6 +95,15 @@ class Comment(models.Model):
 class Tag(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(max_length=100, unique=True)
+    # Number of posts carrying the tag, kept up to date from blog.signals
+    # (see reconcile_tag_counts).
+    post_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-post_count', 'name'],
+                         name='tag_popularity_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -60,6 +115,69 @@ class Tag(models.Model):
         return self.name
 
 
+def get_or_create_tags(names):
+    """
+    Return the tags for ``names``, creating the missing ones in a single
+    insert. Names are matched on their slug, as ``Tag.save`` would set it.
+    """
+    names_by_slug = {slugify(name): name for name in names}
+    names_by_slug.pop('', None)
+    Tag.objects.bulk_create(
+        [Tag(name=name.capitalize(), slug=slug)
+         for slug, name in names_by_slug.items()],
+        ignore_conflicts=True,
+    )
+    return list(Tag.objects.filter(slug__in=names_by_slug))
+
+
+class MediaBlob(models.Model):
+    """
+    A content-addressed media file and the number of model fields pointing
+    at it (see utils.media). Unreferenced blobs are deleted by
+    gc_media_blobs.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Moves whenever the blob is reused or referenced, so a blob that has
+    # just been uploaded isn't collected before the row pointing at it is
+    # saved.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'updated_at'],
+                         name='mediablob_unreferenced_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class ImportBatch(models.Model):
+    """
+    A batch committed by ``import_blog``, saved in the transaction of its
+    rows (see blog.imports): the dataset, the number of input lines consumed
+    so far and the ``[source id, new id]`` pairs of the batch.
+    """
+    checkpoint = models.CharField(max_length=255)
+    dataset = models.CharField(max_length=20)
+    position = models.PositiveIntegerField()
+    ids = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['checkpoint', 'id'],
+                         name='importbatch_checkpoint_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.checkpoint} {self.dataset}:{self.position}'
+
+
 # class Paragraph(models.Model):
 #     post = models.ForeignKey(
 #         BlogPost, on_delete=models.CASCADE, related_name='paragraphs')
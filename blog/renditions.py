@@ -0,0 +1,189 @@
+"""
+Resized renditions of post thumbnails.
+
+Each thumbnail is scaled with Pillow to the ``THUMBNAIL_WIDTHS`` narrower
+than the original, and every width is saved as WebP and JPEG under
+``<upload dir>/renditions/``. The widths that exist are stored on
+``BlogPost.thumbnail_widths``, and the serializers build a ``srcset`` from
+them.
+
+Uploads are rendered in a thread pool of ``THUMBNAIL_WORKERS`` threads once
+the post is committed, so the request doesn't wait on image work. Pillow
+releases the GIL while it resizes and encodes, so the threads do run in
+parallel; profile photo avatars (accounts.avatars) share the pool. Renders
+that a worker restart drops are picked up by ``generate_thumbnails``.
+Thumbnails are stored by content (see utils.media), so a post reusing an
+image another post has rendered reuses its renditions too.
+"""
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from utils import cache
+
+from .models import BlogPost
+
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTHS = (320, 640, 1024)
+
+# extension: (Pillow format, MIME type, save options)
+RENDITION_FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg',
+            {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def rendition_name(name, width, extension):
+    """``thumbnails/a.png`` -> ``thumbnails/renditions/a-320w.webp``."""
+    directory, filename = posixpath.split(posixpath.splitext(name)[0])
+    return posixpath.join(
+        directory, 'renditions', f'{filename}-{width}w.{extension}')
+
+
+def thumbnail_srcset(post, request=None):
+    """``{MIME type: srcset}`` for the post's renditions, None until rendered."""
+    if not post.thumbnail or not post.thumbnail_widths:
+        return None
+    srcset = {}
+    for extension, (_, mime_type, _) in RENDITION_FORMATS.items():
+        candidates = []
+        for width in post.thumbnail_widths:
+            url = default_storage.url(
+                rendition_name(post.thumbnail.name, width, extension))
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            candidates.append(f'{url} {width}w')
+        srcset[mime_type] = ', '.join(candidates)
+    return srcset
+
+
+def rendition_widths(original_width):
+    """The widths an image ``original_width`` pixels wide is rendered at."""
+    widths = [width for width in THUMBNAIL_WIDTHS if width < original_width]
+    return widths or [original_width]
+
+
+def render_thumbnail(name):
+    """Save the renditions of the image ``name`` and return their widths."""
+    with default_storage.open(name, 'rb') as fh:
+        with Image.open(fh) as original:
+            image = flatten(ImageOps.exif_transpose(original))
+    widths = rendition_widths(image.width)
+    for width in widths:
+        height = max(round(image.height * width / image.width), 1)
+        resized = image.resize(
+            (width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        for extension, (image_format, _, options) in RENDITION_FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, image_format, **options)
+            target = rendition_name(name, width, extension)
+            # Fixed names, so a re-render replaces instead of suffixing.
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(target, ContentFile(buffer.getvalue()))
+    return widths
+
+
+def generate_renditions(post_id):
+    """
+    Render the post's thumbnail and record the widths. Returns the widths,
+    or None when the post is gone or got a new thumbnail meanwhile.
+    """
+    name = BlogPost.objects.filter(pk=post_id).values_list(
+        'thumbnail', flat=True).first()
+    if not name:
+        return None
+    widths = shared_widths(name, post_id) or render_thumbnail(name)
+    # updated_at moves so conditional GETs see the new representation.
+    updated = BlogPost.objects.filter(pk=post_id, thumbnail=name).update(
+        thumbnail_widths=widths, updated_at=timezone.now())
+    if not updated:
+        return None
+    cache.invalidate(f'post:{post_id}')
+    return widths
+
+
+def shared_widths(name, post_id):
+    """Widths already rendered for another post with the same thumbnail."""
+    others = BlogPost.objects.filter(thumbnail=name).exclude(pk=post_id)
+    return next(
+        (widths for widths in others.values_list('thumbnail_widths', flat=True)
+         if widths), None)
+
+
+def delete_renditions(name):
+    """Delete the renditions of the image ``name``, before deleting it."""
+    try:
+        with default_storage.open(name, 'rb') as fh:
+            with Image.open(fh) as image:
+                widths = rendition_widths(image.width)
+    except (OSError, ValueError):  # gone, or not an image Pillow reads
+        widths = THUMBNAIL_WIDTHS
+    for width in widths:
+        for extension in RENDITION_FORMATS:
+            default_storage.delete(rendition_name(name, width, extension))
+
+
+def schedule_renditions(post):
+    """Render the post's thumbnail after the current transaction commits."""
+    transaction.on_commit(lambda: submit(generate_renditions, post.pk))
+
+
+def submit(function, *args):
+    """
+    Run ``function(*args)`` in the rendering pool, or inline when
+    ``THUMBNAIL_WORKERS`` is 0. Failures are logged.
+    """
+    if settings.THUMBNAIL_WORKERS == 0:
+        _call_logged(function, args)
+        return
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails')
+    _executor.submit(_run_in_worker, function, args)
+
+
+def _run_in_worker(function, args):
+    close_old_connections()
+    try:
+        _call_logged(function, args)
+    finally:
+        # Worker threads open their own connections; don't leak them.
+        connection.close()
+
+
+def _call_logged(function, args):
+    try:
+        function(*args)
+    except Exception:
+        logger.exception('%s%r failed', function.__name__, args)
+
+
+def flatten(image):
+    """RGB image, with any transparency composited onto white."""
+    if image.mode == 'RGB':
+        return image
+    if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, 'white')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return image.convert('RGB')
@@ -0,0 +1,196 @@
+"""
+Full-text search over posts.
+
+PostgreSQL keeps a weighted ``tsvector`` in ``blog_blogpost.search_vector``
+(title > tag names > content) behind a GIN index. SQLite keeps the same
+text in the FTS5 table ``blog_blogpost_fts``, keyed by post id. Neither is
+a model field: the column/table is created by migration 0006 and kept up
+to date from ``blog.signals``. Other databases fall back to unindexed
+substring matching.
+"""
+import re
+
+from django.db import connection as default_connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+
+POST_TABLE = 'blog_blogpost'
+FTS_TABLE = 'blog_blogpost_fts'
+TAG_NAMES_SQL = (
+    "SELECT {agg} FROM blog_tag t "
+    "JOIN blog_blogpost_tags pt ON pt.tag_id = t.id "
+    "WHERE pt.blogpost_id = p.id"
+)
+
+
+class PostgresSearchBackend:
+    config = 'english'
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def index(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+        tag_names = TAG_NAMES_SQL.format(agg="string_agg(t.name, ' ')")
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {POST_TABLE} p SET search_vector = "
+                f"setweight(to_tsvector(%s, coalesce(p.title, '')), 'A') || "
+                f"setweight(to_tsvector(%s, coalesce(({tag_names}), '')), 'B') || "
+                f"setweight(to_tsvector(%s, coalesce(p.content, '')), 'C') "
+                f"WHERE p.id = ANY(%s)",
+                [self.config, self.config, self.config, post_ids],
+            )
+
+    def remove(self, post_ids):
+        # The vector lives on the post row and goes away with it.
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, queryset, query):
+        tsquery = f"websearch_to_tsquery('{self.config}', %s)"
+        return queryset.filter(RawSQL(
+            f'{POST_TABLE}.search_vector @@ {tsquery}', (query,),
+            output_field=BooleanField(),
+        )).annotate(rank=RawSQL(
+            # ts_rank() is a real; as a double the rank in a cursor compares
+            # equal to the row's rank again.
+            f'ts_rank({POST_TABLE}.search_vector, {tsquery})::float8',
+            (query,), output_field=FloatField(),
+        ))
+
+
+class SQLiteSearchBackend:
+    # bm25() column weights for title, content and tags.
+    weights = '10.0, 1.0, 5.0'
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def index(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        tag_names = TAG_NAMES_SQL.format(agg="group_concat(t.name, ' ')")
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+                post_ids)
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, content, tags) "
+                f"SELECT p.id, p.title, p.content, coalesce(({tag_names}), '') "
+                f"FROM {POST_TABLE} p WHERE p.id IN ({placeholders})",
+                post_ids)
+
+    def remove(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+                post_ids)
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,),
+        )).annotate(rank=RawSQL(
+            f'(SELECT -bm25({FTS_TABLE}, {self.weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {POST_TABLE}.id)',
+            (match,), output_field=FloatField(),
+        ))
+
+    @staticmethod
+    def match_expression(query):
+        # Quote every word so user input can't inject FTS5 query syntax.
+        words = re.findall(r'\w+', query)
+        return ' '.join(f'"{word}"' for word in words) or '""'
+
+
+class FallbackSearchBackend:
+    """
+    Other databases have no index: posts are matched with ``icontains`` on
+    the title and content, and all rank the same.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def index(self, post_ids):
+        pass
+
+    def remove(self, post_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(title__icontains=query) | Q(content__icontains=query),
+        ).annotate(rank=Value(0.0, output_field=FloatField()))
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_backend(connection=None):
+    connection = connection or default_connection
+    return BACKENDS.get(connection.vendor, FallbackSearchBackend)(connection)
+
+
+def search_posts(queryset, query):
+    """Filter ``queryset`` to posts matching ``query``, annotated with ``rank``."""
+    return get_backend().search(queryset, query)
+
+
+def index_posts(post_ids, batch_size=500):
+    backend = get_backend()
+    post_ids = list(post_ids)
+    for start in range(0, len(post_ids), batch_size):
+        backend.index(post_ids[start:start + batch_size])
+
+
+def unindex_posts(post_ids):
+    get_backend().remove(post_ids)
+
+
+def rebuild_index(batch_size=1000, callback=None):
+    """Re-index every post in batches of ``batch_size`` ids."""
+    from .models import BlogPost
+
+    backend = get_backend()
+    backend.clear()
+    batch = []
+    indexed = 0
+    ids = BlogPost.objects.order_by('id').values_list('id', flat=True)
+    for post_id in ids.iterator(chunk_size=batch_size):
+        batch.append(post_id)
+        if len(batch) == batch_size:
+            backend.index(batch)
+            indexed += len(batch)
+            batch = []
+            if callback:
+                callback(indexed)
+    if batch:
+        backend.index(batch)
+        indexed += len(batch)
+        if callback:
+            callback(indexed)
+    return indexed
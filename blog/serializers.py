@@ -1,18 +1,116 @@
 from rest_framework import serializers
 from rest_framework.exceptions import NotFound
 from django.contrib.auth import get_user_model
+from django.db import models, transaction
 from django.shortcuts import get_object_or_404
+from django.utils.text import slugify
 
-from .models import BlogPost, Comment, Tag
+from accounts.avatars import AVATAR_SIZES, avatar_srcset, avatar_url
+
+from .authors import AuthorSummaries
+from .models import BlogPost, Comment, Tag, get_or_create_tags
+from .renditions import schedule_renditions, thumbnail_srcset
 
 
 User = get_user_model()
 
 
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """
+    Primary-key list field that looks all the submitted objects up in one
+    query, instead of one per item as ``PrimaryKeyRelatedField(many=True)``
+    does.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        child = self.child_relation
+        pks = []
+        for pk in data:
+            try:
+                pks.append(int(pk))
+            except (TypeError, ValueError):
+                child.fail('incorrect_type', data_type=type(pk).__name__)
+        objects = child.get_queryset().in_bulk(pks)
+        for pk in pks:
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in dict.fromkeys(pks)]
+
+
+class ThumbnailSrcsetField(serializers.Field):
+    """``{MIME type: srcset}`` of the post's resized thumbnails."""
+
+    def __init__(self, **kwargs):
+        super().__init__(source='*', read_only=True, **kwargs)
+
+    def to_representation(self, post):
+        return thumbnail_srcset(post, self.context.get('request'))
+
+
+class AvatarField(serializers.Field):
+    """The author's avatar at ``size`` px, or every size as a ``srcset``."""
+
+    def __init__(self, size=None, **kwargs):
+        self.size = size
+        super().__init__(source='*', read_only=True, **kwargs)
+
+    def to_representation(self, user):
+        request = self.context.get('request')
+        if self.size is None:
+            return avatar_srcset(user, request)
+        return avatar_url(user, self.size, request)
+
+
 class AuthorSerializer(serializers.ModelSerializer):
+    # Embeds link the avatar rendition, not the full-size upload (that is
+    # on the profile).
+    profile_photo = AvatarField(size=AVATAR_SIZES[-1])
+    profile_photo_srcset = AvatarField()
+
     class Meta:
         model = User
-        fields = ['id', 'username', 'first_name', 'last_name', 'profile_photo']
+        fields = ['id', 'username', 'first_name', 'last_name', 'profile_photo',
+                  'profile_photo_srcset']
+
+
+class CachedAuthorSerializer(AuthorSerializer):
+    """``AuthorSerializer`` served from the author summary cache."""
+
+    def to_representation(self, user):
+        summaries = AuthorSummaries.of(self.context)
+        summary = summaries.get(user)
+        if summary is None:
+            summary = summaries.store(user, super().to_representation(user))
+        return summary
+
+
+class AuthorPrimingListSerializer(serializers.ListSerializer):
+    """
+    Looks up the authors of every item (and of their ``first_replies``) in
+    one round trip before serializing the list.
+    """
+
+    def to_representation(self, data):
+        items = (data.all() if isinstance(data, models.manager.BaseManager)
+                 else data)
+        items = list(items)
+        summaries = AuthorSummaries.of(self.context)
+        summaries.prime(
+            author for item in items for author in _authors(item))
+        try:
+            return super().to_representation(items)
+        finally:
+            summaries.flush()
+
+
+def _authors(item):
+    yield item.author
+    for reply in getattr(item, 'first_replies', ()):
+        yield reply.author
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -23,23 +121,35 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'slug']
 
 
+class TagCloudSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ['name', 'slug', 'post_count']
+
+
 class ReplySerializer(serializers.ModelSerializer):
-    author = AuthorSerializer(read_only=True)
+    author = CachedAuthorSerializer(read_only=True)
     content = serializers.CharField(max_length=500)
 
     class Meta:
         model = Comment
         fields = ['id', 'post', 'author', 'content']
+        list_serializer_class = AuthorPrimingListSerializer
 
 
 class ListCommentSerializer(serializers.ModelSerializer):
-    author = AuthorSerializer(read_only=True)
-    replies = ReplySerializer(many=True, read_only=True)
+    """
+    A comment with a preview of its first replies; expects the
+    ``first_replies`` prefetch of ``ListCreateCommentView``.
+    """
+    author = CachedAuthorSerializer(read_only=True)
+    replies = ReplySerializer(source='first_replies', many=True, read_only=True)
 
     class Meta:
         model = Comment
         fields = ['id', 'author', 'content',
-                  'created_at', 'updated_at', 'replies',]
+                  'created_at', 'updated_at', 'replies', 'reply_count']
+        list_serializer_class = AuthorPrimingListSerializer
 
 
 class CreateCommentSerializer(serializers.ModelSerializer):
@@ -50,6 +160,7 @@ class CreateCommentSerializer(serializers.ModelSerializer):
         fields = ['id', 'post', 'content', 'created_at', 'updated_at']
         read_only_fields = ['post']
 
+    @transaction.atomic
     def create(self, validated_data):
         user = self.context.get('user')
         post_id = self.context.get('post_id')
@@ -84,6 +195,7 @@ class CreateReplySerializer(serializers.ModelSerializer):
         fields = ['id', 'content', 'parent', 'created_at', 'updated_at']
         read_only_fields = ['parent']
 
+    @transaction.atomic
     def create(self, validated_data):
         user = self.context.get('user')
         comment_id = self.context.get('comment_id')
@@ -106,57 +218,100 @@ class UpdateReplySerializer(serializers.ModelSerializer):
 
 class GetBlogPostSerializer(serializers.ModelSerializer):
     thumbnail = serializers.ImageField(use_url=True)
+    thumbnail_srcset = ThumbnailSrcsetField()
     slug = serializers.SlugField(read_only=True)
-    author = AuthorSerializer(read_only=True)
+    author = CachedAuthorSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
 
     class Meta:
         model = BlogPost
-        fields = ['id',  'thumbnail', 'title', 'slug', 'author', 'content', 'tags', 'created_at',
-                  'updated_at']
+        fields = ['id',  'thumbnail', 'thumbnail_srcset', 'title', 'slug', 'author',
+                  'content', 'tags', 'comment_count', 'created_at', 'updated_at']
 
 
-class GetUserBlogPostSerializer(serializers.ModelSerializer):
+class BlogPostCardSerializer(serializers.ModelSerializer):
+    """Post summary for list endpoints; the body is only sent by retrieve."""
     thumbnail = serializers.ImageField(use_url=True)
+    thumbnail_srcset = ThumbnailSrcsetField()
     slug = serializers.SlugField(read_only=True)
+    author = CachedAuthorSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
 
     class Meta:
         model = BlogPost
-        fields = ['id',  'thumbnail', 'title', 'slug', 'content', 'tags', 'created_at',
-                  'updated_at']
+        fields = ['id', 'thumbnail', 'thumbnail_srcset', 'title', 'slug', 'author',
+                  'excerpt', 'word_count', 'reading_time', 'comment_count', 'tags',
+                  'created_at', 'updated_at']
+        list_serializer_class = AuthorPrimingListSerializer
 
 
 class CreateUpdateBlogPostSerializer(serializers.ModelSerializer):
     thumbnail = serializers.ImageField(use_url=True)
+    thumbnail_srcset = ThumbnailSrcsetField()
     slug = serializers.SlugField(read_only=True)
-    author = AuthorSerializer(read_only=True)
+    author = CachedAuthorSerializer(read_only=True)
+    tags = BulkManyRelatedField(
+        child_relation=serializers.PrimaryKeyRelatedField(
+            queryset=Tag.objects.all()),
+        required=False)
+    tag_names = serializers.ListField(
+        child=serializers.CharField(max_length=100), write_only=True,
+        required=False,
+        help_text="Tags by name, created if missing. Combined with 'tags'.")
 
     class Meta:
         model = BlogPost
-        fields = ['id',  'thumbnail', 'title', 'slug', 'author', 'content', 'tags', 'created_at',
-                  'updated_at']
-
+        fields = ['id',  'thumbnail', 'thumbnail_srcset', 'title', 'slug', 'author',
+                  'content', 'tags', 'tag_names', 'created_at', 'updated_at']
+
+    def validate_tag_names(self, value):
+        if any(not slugify(name) for name in value):
+            raise serializers.ValidationError(
+                "Tag names must contain letters or digits.")
+        return value
+
+    def validate(self, attrs):
+        if self.instance is None and not (
+                attrs.get('tags') or attrs.get('tag_names')):
+            raise serializers.ValidationError(
+                {'tags': "Provide at least one tag in 'tags' or 'tag_names'."})
+        return attrs
+
+    def pop_tags(self, validated_data):
+        """The requested tags, or None when the request leaves them alone."""
+        tags = validated_data.pop('tags', None)
+        names = validated_data.pop('tag_names', None)
+        if tags is None and names is None:
+            return None
+        return list(tags or []) + get_or_create_tags(names or [])
+
+    @transaction.atomic
     def create(self, validated_data):
-        tags = validated_data.pop('tags')
+        tags = self.pop_tags(validated_data)
         instance = BlogPost.objects.create(
             author=self.context["user"], **validated_data)
-        for tag in tags:
-            instance.tags.add(tag)
+        # One insert for all links, so one m2m_changed round of signals.
+        instance.tags.add(*tags)
+        schedule_renditions(instance)
         return instance
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tags_data = validated_data.pop('tags', None)
+        tags = self.pop_tags(validated_data)
 
-        instance.thumbnail = validated_data.get(
-            'thumbnail', instance.thumbnail)
+        thumbnail = validated_data.get('thumbnail')
+        if thumbnail is not None:
+            instance.thumbnail = thumbnail
+            instance.thumbnail_widths = []
         instance.title = validated_data.get('title', instance.title)
         instance.content = validated_data.get('content', instance.content)
         instance.save()
+        if thumbnail is not None:
+            schedule_renditions(instance)
 
-        if tags_data is not None:
-            instance.tags.clear()
-            for tag in tags_data:
-                instance.tags.add(tag)
+        if tags is not None:
+            # set() diffs against the current links: one delete for the
+            # dropped tags and one insert for the new ones.
+            instance.tags.set(tags)
 
         return instance
@@ -0,0 +1,180 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from utils import cache
+from utils.counting import invalidate_counts
+
+from .authors import invalidate_author
+from .models import BlogPost, Comment, Tag
+from .search import index_posts, unindex_posts
+from .comment_counts import adjust_comment_count, adjust_reply_count
+from .tag_counts import adjust_post_counts
+
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=BlogPost)
+@receiver(post_delete, sender=BlogPost)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_cached_counts(sender, **kwargs):
+    invalidate_counts(sender)
+
+
+@receiver(m2m_changed, sender=BlogPost.tags.through)
+def invalidate_tagged_post_counts(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_counts(BlogPost)
+
+
+@receiver(post_save, sender=BlogPost)
+def invalidate_saved_post(sender, instance, created, **kwargs):
+    if created:
+        cache.invalidate('posts', f'user-posts:{instance.author_id}')
+    cache.invalidate(f'post:{instance.pk}')
+
+
+@receiver(pre_delete, sender=BlogPost)
+def remember_deleted_post_tags(sender, instance, **kwargs):
+    # The tag links are gone (without m2m_changed) once the post is deleted.
+    tags = list(instance.tags.values_list('pk', 'slug'))
+    instance._tag_ids = [pk for pk, _ in tags]
+    instance._tag_slugs = [slug for _, slug in tags]
+
+
+@receiver(post_delete, sender=BlogPost)
+def uncount_deleted_post(sender, instance, **kwargs):
+    adjust_post_counts(getattr(instance, '_tag_ids', ()), -1)
+
+
+@receiver(post_delete, sender=BlogPost)
+def invalidate_deleted_post(sender, instance, **kwargs):
+    cache.invalidate(
+        'posts',
+        'tags',
+        f'post:{instance.pk}',
+        f'user-posts:{instance.author_id}',
+        *(f'tag:{slug}' for slug in getattr(instance, '_tag_slugs', ())),
+    )
+
+
+@receiver(m2m_changed, sender=BlogPost.tags.through)
+def post_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    related = instance.blog_posts if reverse else instance.tags
+    if action == 'pre_clear':
+        instance._unlinked_pks = set(related.values_list('pk', flat=True))
+        return
+    if action == 'pre_remove':
+        # pk_set holds whatever was asked for; keep the links that exist.
+        instance._unlinked_pks = set(
+            related.filter(pk__in=pk_set).values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action in ('post_remove', 'post_clear'):
+        pk_set = instance.__dict__.pop('_unlinked_pks', set())
+    if not pk_set:
+        return
+    sign = 1 if action == 'post_add' else -1
+    if reverse:
+        posts, tags = pk_set, [instance.slug]
+        adjust_post_counts([instance.pk], sign * len(pk_set))
+    else:
+        posts = [instance.pk]
+        tags = Tag.objects.filter(pk__in=pk_set).values_list('slug', flat=True)
+        adjust_post_counts(pk_set, sign)
+    # Retagging changes the post's representation, so it counts as an update
+    # for conditional GETs.
+    BlogPost.objects.filter(pk__in=posts).update(updated_at=timezone.now())
+    index_posts(posts)
+    cache.invalidate(
+        'tags',
+        *(f'post:{pk}' for pk in posts),
+        *(f'tag:{slug}' for slug in tags),
+    )
+
+
+@receiver(post_save, sender=BlogPost)
+def index_saved_post(sender, instance, **kwargs):
+    index_posts([instance.pk])
+
+
+@receiver(post_delete, sender=BlogPost)
+def unindex_deleted_post(sender, instance, **kwargs):
+    unindex_posts([instance.pk])
+
+
+@receiver(post_save, sender=Tag)
+def reindex_tagged_posts(sender, instance, created, **kwargs):
+    if not created:
+        index_posts(instance.blog_posts.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tagged_posts(sender, instance, **kwargs):
+    instance._post_ids = list(instance.blog_posts.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def reindex_untagged_posts(sender, instance, **kwargs):
+    index_posts(getattr(instance, '_post_ids', ()))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag(sender, instance, **kwargs):
+    cache.invalidate('tags', f'tag:{instance.slug}')
+
+
+@receiver(post_save, sender=Comment)
+def count_created_comment(sender, instance, created, **kwargs):
+    if not created:
+        return
+    if instance.parent_id is None:
+        adjust_comment_count(Q(pk=instance.post_id), 1)
+    else:
+        adjust_reply_count(instance.parent_id, 1)
+        adjust_comment_count(Q(comments=instance.parent_id), 1)
+
+
+@receiver(pre_delete, sender=Comment)
+def remember_deleted_thread_size(sender, instance, origin=None, **kwargs):
+    if instance.parent_id is None and not isinstance(origin, BlogPost):
+        # The replies go with the comment; count them while they exist.
+        instance._thread_size = 1 + instance.replies.count()
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_deleted_comment(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, BlogPost):
+        return  # the counters go with the post
+    if instance.parent_id is None:
+        adjust_comment_count(
+            Q(pk=instance.post_id), -getattr(instance, '_thread_size', 1))
+    elif not (isinstance(origin, Comment) and origin.pk == instance.parent_id):
+        # A reply deleted on its own; replies deleted with their comment
+        # are already counted in its thread size.
+        adjust_reply_count(instance.parent_id, -1)
+        adjust_comment_count(Q(comments=instance.parent_id), -1)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_commented_post(sender, instance, **kwargs):
+    post_id = instance.post_id
+    if post_id is None and instance.parent_id is not None:
+        post_id = Comment.objects.filter(
+            pk=instance.parent_id).values_list('post_id', flat=True).first()
+    if post_id is not None:
+        cache.invalidate(f'post:{post_id}')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    cache.invalidate(f'user:{instance.pk}')
+    invalidate_author(instance.pk)
@@ -0,0 +1,45 @@
+"""
+Upkeep of the denormalized ``Tag.post_count`` column.
+
+``blog.signals`` adjusts the counters as posts are tagged, untagged and
+deleted. Anything that bypasses signals (bulk inserts, raw SQL) lets them
+drift; ``reconcile_tag_counts`` recomputes them from the posts-tags table.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import BlogPost, Tag
+
+
+def adjust_post_counts(tag_ids, delta):
+    """Add ``delta`` (may be negative) to the post count of ``tag_ids``."""
+    tag_ids = list(tag_ids)
+    if not tag_ids or not delta:
+        return
+    # Clamp at zero so a counter that already drifted can't break the
+    # write that untags a post.
+    Tag.objects.filter(pk__in=tag_ids).update(
+        post_count=Greatest(F('post_count') + delta, 0))
+
+
+def actual_post_counts():
+    """Tags annotated with ``actual_count``, counted from the link table."""
+    links = BlogPost.tags.through.objects.filter(
+        tag_id=OuterRef('pk')).values('tag_id').annotate(
+        total=Count('blogpost_id')).values('total')
+    return Tag.objects.annotate(actual_count=Coalesce(Subquery(links), 0))
+
+
+def reconcile_tag_counts(dry_run=False):
+    """
+    Fix every tag whose ``post_count`` disagrees with its links and return
+    the drifted tags as they were, annotated with ``actual_count``.
+    """
+    drifted = list(
+        actual_post_counts().exclude(post_count=F('actual_count'))
+        .order_by('pk'))
+    if not dry_run:
+        Tag.objects.bulk_update(
+            [Tag(pk=tag.pk, post_count=tag.actual_count) for tag in drifted],
+            ['post_count'], batch_size=500)
+    return drifted
@@ -1,3 +1,1760 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import marshal
+import os
+import tempfile
+import threading
+import time
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from google.auth.credentials import AnonymousCredentials
+from google.cloud.storage import Blob
+from PIL import Image
+from rest_framework.test import APITestCase, APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from custom_storages import MediaStorage, SpooledStorage
+from utils import media, metrics
+from utils.cache import invalidate
+
+from .authors import author_key, clear_local_cache
+from .models import BlogPost, Comment, ImportBatch, MediaBlob, Tag
+from .renditions import THUMBNAIL_WIDTHS, render_thumbnail, rendition_name
+from .serializers import AuthorSerializer, GetBlogPostSerializer
+
+
+User = get_user_model()
+
+
+def seed_posts(rows, authors=5, tags=4):
+    """Bulk-create ``rows`` posts spread over several authors and tags."""
+    users = User.objects.bulk_create([
+        User(email=f'author{i}@example.com', username=f'author{i}', password='!')
+        for i in range(authors)
+    ])
+    tag_objs = Tag.objects.bulk_create([
+        Tag(name=f'Tag{i}', slug=f'tag{i}') for i in range(tags)
+    ])
+    posts = BlogPost.objects.bulk_create([
+        BlogPost(
+            thumbnail='thumbnails/post.jpg',
+            title=f'Post {i}',
+            slug=f'post-{i}',
+            author=users[i % authors],
+            content=f'Content of post {i}',
+        )
+        for i in range(rows)
+    ])
+    through = BlogPost.tags.through
+    through.objects.bulk_create(
+        [through(blogpost=post, tag=tag_objs[0]) for post in posts] +
+        [through(blogpost=post, tag=tag_objs[1 + i % (tags - 1)])
+         for i, post in enumerate(posts)]
+    )
+    return users, tag_objs, posts
+
+
+def read_concurrently(url, **headers):
+    """GET ``url`` anonymously from another thread, so another connection."""
+    responses = []
+
+    def read():
+        try:
+            responses.append(APIClient().get(url, **headers))
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=read)
+    thread.start()
+    thread.join()
+    return responses[0]
+
+
+class PostListQueryBudgetMixin:
+    """
+    Every read endpoint must cost a fixed number of queries per page,
+    whatever the number of rows in the table.
+    """
+    rows = None
+    page_size = 25
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.tags, cls.posts = seed_posts(cls.rows)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_page(self, url, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, {'page_size': self.page_size})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_list_posts(self):
+        # validators, count, page with authors, tags
+        data = self.get_page(reverse('blogs-list'), 4)
+        self.assertEqual(data['count'], self.rows)
+        self.assertEqual(len(data['results']), min(self.rows, self.page_size))
+        self.assertEqual(len(data['results'][0]['tags']), 2)
+        self.assertIn('username', data['results'][0]['author'])
+
+    def test_user_posts(self):
+        # validators, count, page with authors, tags
+        user = self.users[0]
+        data = self.get_page(
+            reverse('get_user_posts', args=[user.id]), 4)
+        self.assertEqual(
+            data['count'], BlogPost.objects.filter(author=user).count())
+
+    def test_posts_by_tag(self):
+        # validators, count, page with authors, tags
+        data = self.get_page(
+            reverse('get_posts_by_tag', args=[self.tags[0].slug]), 4)
+        self.assertEqual(data['count'], self.rows)
+
+    def test_list_posts_cursor(self):
+        # validators, page with authors, tags; no count
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('blogs-list'), {
+                'pagination': 'cursor', 'page_size': self.page_size})
+        self.assertEqual(
+            len(response.data['results']), min(self.rows, self.page_size))
+        self.assertNotIn('count', response.data)
+
+
+class PostListQueryBudget5Tests(PostListQueryBudgetMixin, APITestCase):
+    rows = 5
+
+
+class PostListQueryBudget25Tests(PostListQueryBudgetMixin, APITestCase):
+    rows = 25
+
+
+class PostListQueryBudget500Tests(PostListQueryBudgetMixin, APITestCase):
+    rows = 500
+
+
+class CursorPaginationTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.tags, cls.posts = seed_posts(12)
+        # Ties on created_at must be broken by id.
+        BlogPost.objects.update(created_at=timezone.now())
+        cls.comments = Comment.objects.bulk_create([
+            Comment(post=cls.posts[0], author=cls.users[0], content=f'c{i}')
+            for i in range(7)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, url, params):
+        pages = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([item['id'] for item in response.data['results']])
+            if not response.data['next']:
+                return pages, response
+            response = self.client.get(response.data['next'])
+
+    def test_walks_posts_newest_first(self):
+        pages, last = self.walk(
+            reverse('blogs-list'), {'pagination': 'cursor', 'page_size': 5})
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        expected = list(BlogPost.objects.order_by(
+            '-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(sum(pages, []), expected)
+
+        previous = self.client.get(last.data['previous'])
+        self.assertEqual(
+            [item['id'] for item in previous.data['results']], pages[1])
+        self.assertIsNotNone(previous.data['next'])
+
+    def test_first_page_has_no_previous(self):
+        response = self.client.get(
+            reverse('blogs-list'), {'pagination': 'cursor'})
+        self.assertIsNone(response.data['previous'])
+
+    def test_walks_comments_oldest_first(self):
+        pages, _ = self.walk(
+            reverse('get_post_comments', args=[self.posts[0].id]),
+            {'pagination': 'cursor', 'limit': 3})
+        self.assertEqual(sum(pages, []), [c.id for c in self.comments])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('blogs-list'), {'cursor': 'nope'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_values_of_the_wrong_type_are_invalid(self):
+        for position in (['abc', 'x'], [None, 1], [{'a': 1}, 1],
+                         [timezone.now().isoformat(), 'x']):
+            cursor = urlsafe_b64encode(
+                json.dumps({'p': position, 'r': 0}).encode()).decode()
+            with self.subTest(position=position):
+                response = self.client.get(
+                    reverse('blogs-list'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+class CountStrategyTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.tags, cls.posts = seed_posts(12)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_list(self, **params):
+        response = self.client.get(reverse('blogs-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_cached_count_skips_count_query(self):
+        self.assertEqual(self.get_list()['count'], 12)
+        # validators, page with authors, tags
+        with self.assertNumQueries(3):
+            data = self.get_list(page=2)
+        self.assertEqual(data['count'], 12)
+        self.assertEqual(data['count_type'], 'exact')
+
+    def test_writes_invalidate_cached_count(self):
+        self.get_list()
+        self.posts[0].delete()
+        self.assertEqual(self.get_list()['count'], 11)
+
+    def test_exact_count(self):
+        self.get_list()
+        # validators, count, page with authors, tags
+        with self.assertNumQueries(4):
+            data = self.get_list(count='exact')
+        self.assertEqual(data['count'], 12)
+
+    def test_estimate_is_exact_off_postgresql(self):
+        data = self.get_list(count='estimate')
+        self.assertEqual(data['count'], 12)
+        self.assertEqual(data['count_type'], 'exact')
+
+    def test_omitted_count(self):
+        # validators, page with authors, tags
+        with self.assertNumQueries(3):
+            data = self.get_list(count='none', page=2)
+        self.assertIsNone(data['count'])
+        self.assertIsNone(data['total_pages'])
+        self.assertEqual(data['count_type'], 'omitted')
+        self.assertEqual(len(data['results']), 5)
+        self.assertIsNotNone(data['next'])
+        self.assertIsNotNone(data['previous'])
+
+        data = self.get_list(count='none', page=3)
+        self.assertEqual(len(data['results']), 2)
+        self.assertIsNone(data['next'])
+
+    def test_omitted_comment_count(self):
+        Comment.objects.bulk_create([
+            Comment(post=self.posts[0], author=self.users[0], content=f'c{i}')
+            for i in range(3)
+        ])
+        response = self.client.get(
+            reverse('get_post_comments', args=[self.posts[0].id]),
+            {'count': 'none', 'limit': 2})
+        self.assertIsNone(response.data['count'])
+        self.assertIsNotNone(response.data['next'])
+
+
+class PostCardTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.tags, cls.posts = seed_posts(3)
+        cls.post = cls.posts[0]
+        cls.post.content = 'word ' * 450
+        cls.post.save()
+
+    def test_save_stores_summary(self):
+        self.assertEqual(self.post.word_count, 450)
+        self.assertEqual(self.post.reading_time, 3)
+        self.assertLessEqual(len(self.post.excerpt), 200)
+        self.assertTrue(self.post.excerpt.startswith('word word'))
+
+    def test_lists_return_cards_without_content(self):
+        urls = [
+            reverse('blogs-list'),
+            reverse('get_user_posts', args=[self.post.author_id]),
+            reverse('get_posts_by_tag', args=[self.tags[0].slug]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, {'count': 'exact'})
+                page_sql = [q['sql'] for q in queries
+                            if 'blog_blogpost"."title' in q['sql']]
+                self.assertTrue(page_sql)
+                self.assertNotIn('blog_blogpost"."content', page_sql[0])
+                card = response.data['results'][0]
+                self.assertNotIn('content', card)
+                for field in ('excerpt', 'word_count', 'reading_time', 'author', 'tags'):
+                    self.assertIn(field, card)
+
+    def test_retrieve_returns_content(self):
+        response = self.client.get(
+            reverse('blogs-detail', args=[self.post.slug]))
+        self.assertEqual(response.data['content'], self.post.content)
+
+
+def author_calls(mocked):
+    """Calls of a mocked get_many/set_many for author summaries."""
+    return sum(
+        1 for call in mocked.call_args_list
+        if any(str(key).startswith('author:') for key in call.args[0]))
+
+
+class AuthorSummaryCacheTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.tags, cls.posts = seed_posts(6, authors=3)
+        cls.reader = User.objects.create(
+            email='reader@example.com', username='reader', password='!')
+
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        # Authenticated, so responses aren't served from the response cache.
+        self.client.force_authenticate(self.reader)
+
+    def page_authors(self):
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many, \
+                mock.patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            response = self.client.get(reverse('blogs-list'))
+        embedded = {card['author']['id']: card['author']
+                    for card in response.data['results']}
+        return embedded, author_calls(get_many), author_calls(set_many)
+
+    def test_page_authors_are_cached_in_two_tiers(self):
+        embedded, gets, sets = self.page_authors()
+        self.assertEqual((gets, sets), (1, 1))
+        self.assertEqual(len(embedded), 3)
+        for user in self.users:
+            self.assertEqual(embedded[user.pk], AuthorSerializer(user).data)
+
+        # In-process tier: no round trip at all.
+        self.assertEqual(self.page_authors(), (embedded, 0, 0))
+        # Shared tier: one round trip for the page, nothing to write.
+        clear_local_cache()
+        self.assertEqual(self.page_authors(), (embedded, 1, 0))
+
+    def test_comment_and_reply_authors_share_one_round_trip(self):
+        post = self.posts[0]
+        for i, user in enumerate(self.users):
+            comment = Comment.objects.create(
+                post=post, author=user, content=f'Comment {i}')
+            Comment.objects.create(
+                parent=comment, author=self.users[i - 1], content='Reply')
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many, \
+                mock.patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            response = self.client.get(reverse('get_post_comments', args=[post.pk]))
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(
+            response.data['results'][0]['replies'][0]['author']['username'],
+            self.users[-1].username)
+        self.assertEqual((author_calls(get_many), author_calls(set_many)), (1, 1))
+        self.assertEqual(len(set_many.call_args.args[0]), 3)
+
+    def test_profile_updates_are_never_served_stale(self):
+        self.page_authors()
+        user = self.users[0]
+        self.client.force_authenticate(user)
+        response = self.client.patch(
+            reverse('user-profile', args=[user.pk]), {'first_name': 'Renamed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(cache.get(author_key(user.pk)))
+        self.assertEqual(self.page_authors()[0][user.pk]['first_name'], 'Renamed')
+
+        # A change this process wasn't told about (e.g. made by another
+        # one) is caught by the updated_at stamp.
+        User.objects.filter(pk=user.pk).update(
+            first_name='Elsewhere', updated_at=timezone.now())
+        self.assertEqual(
+            self.page_authors()[0][user.pk]['first_name'], 'Elsewhere')
+
+    def test_deleted_accounts_are_forgotten(self):
+        self.page_authors()
+        user = self.users[0]
+        self.client.force_authenticate(user)
+        self.client.delete(reverse('user-delete'))
+        self.assertIsNone(cache.get(author_key(user.pk)))
+        self.assertNotIn(user.pk, self.page_authors()[0])
+
+
+class ResponseCacheTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.tags, cls.posts = seed_posts(6)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertCached(self, url, cached=True):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'HIT' if cached else 'MISS')
+        return response
+
+    def test_anonymous_reads_are_cached(self):
+        urls = [
+            reverse('blogs-list'),
+            reverse('blogs-detail', args=[self.posts[0].slug]),
+            reverse('get_user_posts', args=[self.users[0].id]),
+            reverse('get_posts_by_tag', args=[self.tags[0].slug]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                first = self.assertCached(url, cached=False)
+                # validators only
+                with self.assertNumQueries(1):
+                    second = self.assertCached(url)
+                self.assertEqual(first.data, second.data)
+
+    def test_responses_racing_a_write_are_not_stored(self):
+        url = reverse('blogs-detail', args=[self.posts[0].slug])
+        serialize = GetBlogPostSerializer.to_representation
+
+        def racing_write(serializer, post):
+            data = serialize(serializer, post)
+            # The post changes after the view read it.
+            invalidate(f'post:{post.pk}')
+            return data
+
+        with mock.patch.object(
+                GetBlogPostSerializer, 'to_representation', racing_write):
+            self.assertCached(url, cached=False)
+        self.assertCached(url, cached=False)
+        self.assertCached(url)
+
+    def test_query_params_are_part_of_the_key(self):
+        url = reverse('blogs-list')
+        self.assertCached(url, cached=False)
+        response = self.client.get(url, {'page': 2})
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_authenticated_reads_bypass_cache(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        url = reverse('blogs-list')
+        client.get(url)
+        response = client.get(url)
+        self.assertNotIn('X-Cache', response)
+
+    def test_post_update_invalidates_detail_and_lists(self):
+        post = self.posts[-1]
+        detail = reverse('blogs-detail', args=[post.slug])
+        listing = reverse('blogs-list')
+        other = reverse('blogs-detail', args=[self.posts[0].slug])
+        for url in (detail, listing, other):
+            self.assertCached(url, cached=False)
+        post.content = 'Edited'
+        post.save()
+        response = self.assertCached(detail, cached=False)
+        self.assertEqual(response.data['content'], 'Edited')
+        self.assertCached(listing, cached=False)
+        self.assertCached(other)
+
+    def test_new_post_invalidates_lists(self):
+        listing = reverse('blogs-list')
+        user_posts = reverse('get_user_posts', args=[self.users[0].id])
+        other_user_posts = reverse('get_user_posts', args=[self.users[1].id])
+        for url in (listing, user_posts, other_user_posts):
+            self.assertCached(url, cached=False)
+        BlogPost.objects.create(
+            thumbnail='thumbnails/post.jpg', title='New', author=self.users[0],
+            content='New post')
+        self.assertCached(listing, cached=False)
+        self.assertCached(user_posts, cached=False)
+        self.assertCached(other_user_posts)
+
+    def test_tagging_invalidates_tag_page(self):
+        tag = Tag.objects.create(name='fresh')
+        url = reverse('get_posts_by_tag', args=[tag.slug])
+        self.assertEqual(self.assertCached(url, cached=False).data['count'], 0)
+        self.posts[0].tags.add(tag)
+        self.assertEqual(self.assertCached(url, cached=False).data['count'], 1)
+        self.posts[0].tags.clear()
+        self.assertEqual(self.assertCached(url, cached=False).data['count'], 0)
+
+    def test_comment_invalidates_post(self):
+        post = self.posts[0]
+        url = reverse('blogs-detail', args=[post.slug])
+        self.assertCached(url, cached=False)
+        comment = Comment.objects.create(
+            post=post, author=self.users[1], content='Nice')
+        self.assertCached(url, cached=False)
+        self.assertCached(url)
+        Comment.objects.create(
+            parent=comment, author=self.users[2], content='Reply')
+        self.assertCached(url, cached=False)
+
+    def test_profile_change_invalidates_embedding_pages(self):
+        author = self.posts[0].author
+        url = reverse('blogs-detail', args=[self.posts[0].slug])
+        self.assertCached(url, cached=False)
+        author.first_name = 'Renamed'
+        author.save()
+        response = self.assertCached(url, cached=False)
+        self.assertEqual(response.data['author']['first_name'], 'Renamed')
+
+
+class ConditionalGetTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.tags, cls.posts = seed_posts(6)
+        cls.post = cls.posts[0]
+        cls.comment = Comment.objects.create(
+            post=cls.post, author=cls.users[1], content='First')
+
+    def setUp(self):
+        cache.clear()
+
+    def urls(self):
+        return [
+            reverse('blogs-list'),
+            reverse('blogs-detail', args=[self.post.slug]),
+            reverse('get_user_posts', args=[self.post.author_id]),
+            reverse('get_posts_by_tag', args=[self.tags[0].slug]),
+            reverse('get_post_comments', args=[self.post.id]),
+        ]
+
+    def test_matching_etag_returns_304_without_serializing(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response['ETag'].startswith('"'))
+                self.assertNotIn('Last-Modified', response)
+                # validators only
+                with self.assertNumQueries(1):
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_with_data(self):
+        etags = [self.client.get(url)['ETag'] for url in self.urls()]
+        self.post.content = 'Edited'
+        self.post.save()
+        Comment.objects.filter(pk=self.comment.pk).update(
+            updated_at=timezone.now())
+        for url, etag in zip(self.urls(), etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_deletes_and_tag_renames_change_etag(self):
+        etags = [self.client.get(url)['ETag'] for url in self.urls()]
+        self.comment.delete()
+        tag = self.tags[0]
+        tag.name = 'Renamed'
+        tag.save()
+        for url, etag in zip(self.urls(), etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_author_profile_change_changes_post_etag(self):
+        url = reverse('blogs-detail', args=[self.post.slug])
+        etag = self.client.get(url)['ETag']
+        author = self.post.author
+        author.bio = 'New bio'
+        author.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_query_params_change_etag(self):
+        url = reverse('blogs-list')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, {'page': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_post_is_404(self):
+        response = self.client.get(reverse('blogs-detail', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+
+class UncommittedWriteTests(TransactionTestCase):
+    """
+    Reads from other connections while a write is in an open transaction.
+    SQLite locks the tables a transaction has written to, so the reads run
+    after the invalidation the write's receivers do, and before the rows
+    change.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.users, self.tags, self.posts = seed_posts(2)
+
+    def test_responses_read_before_commit_are_not_served(self):
+        post = self.posts[0]
+        url = reverse('blogs-detail', args=[post.slug])
+        with transaction.atomic():
+            invalidate(f'post:{post.pk}')
+            self.assertEqual(read_concurrently(url)['X-Cache'], 'MISS')
+            BlogPost.objects.filter(pk=post.pk).update(content='Edited')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['content'], 'Edited')
+
+    def test_etags_read_before_commit_do_not_match(self):
+        tag = self.tags[0]
+        urls = [
+            reverse('blogs-list'),
+            reverse('blogs-detail', args=[self.posts[0].slug]),
+        ]
+        with transaction.atomic():
+            invalidate('tags', f'tag:{tag.slug}')
+            etags = [read_concurrently(url)['ETag'] for url in urls]
+            Tag.objects.filter(pk=tag.pk).update(name='Renamed')
+        for url, etag in zip(urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+
+class SearchTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            email='writer@example.com', username='writer', password='!')
+        cls.django_tag = Tag.objects.create(name='django')
+
+        def create(title, content):
+            return BlogPost.objects.create(
+                thumbnail='thumbnails/post.jpg', title=title,
+                author=cls.author, content=content)
+
+        cls.in_title = create('Caching with Redis', 'Notes about memory.')
+        cls.in_content = create('Weekly notes', 'We tried redis for sessions.')
+        cls.tagged = create('Framework tips', 'Views and models.')
+        cls.tagged.tags.add(cls.django_tag)
+        cls.unrelated = create('Gardening', 'Tomatoes and basil.')
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('blogs-search'), {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def ids(self, data):
+        return [item['id'] for item in data['results']]
+
+    def test_ranks_title_matches_first(self):
+        data = self.search('redis')
+        self.assertEqual(self.ids(data), [self.in_title.id, self.in_content.id])
+        self.assertNotIn('content', data['results'][0])
+
+    def test_matches_tag_names(self):
+        self.assertEqual(self.ids(self.search('django')), [self.tagged.id])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.unrelated.content = 'Tomatoes, basil and a redis cluster.'
+        self.unrelated.save()
+        self.assertIn(self.unrelated.id, self.ids(self.search('redis')))
+
+        self.tagged.tags.clear()
+        self.assertEqual(self.ids(self.search('django')), [])
+
+        self.in_title.delete()
+        self.assertNotIn(self.in_title.id, self.ids(self.search('redis')))
+
+    def test_tag_rename_reindexes_posts(self):
+        self.django_tag.name = 'Python'
+        self.django_tag.save()
+        self.assertEqual(self.ids(self.search('python')), [self.tagged.id])
+
+    def test_cursor_pagination(self):
+        first = self.search('redis', page_size=1)
+        self.assertEqual(self.ids(first), [self.in_title.id])
+        second = self.client.get(first['next']).data
+        self.assertEqual(self.ids(second), [self.in_content.id])
+        self.assertIsNone(second['next'])
+
+    def test_other_databases_match_substrings(self):
+        with mock.patch.dict('blog.search.BACKENDS', clear=True):
+            self.unrelated.content = 'Tomatoes, basil and a redis cluster.'
+            self.unrelated.save()
+            self.assertEqual(
+                set(self.ids(self.search('redis'))),
+                {self.in_title.id, self.in_content.id, self.unrelated.id})
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.ids(self.search('redis" OR "basil')),
+                         [])
+
+    def test_requires_query(self):
+        response = self.client.get(reverse('blogs-search'))
+        self.assertEqual(response.status_code, 400)
+
+
+class TagFilterTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            email='writer@example.com', username='writer', password='!')
+        cls.a, cls.b, cls.c = [Tag.objects.create(name=name) for name in 'abc']
+        cls.unused = Tag.objects.create(name='unused')
+
+        def create(title, *tags):
+            post = BlogPost.objects.create(
+                thumbnail='thumbnails/post.jpg', title=title,
+                author=cls.author, content=title)
+            post.tags.add(*tags)
+            return post
+
+        cls.ab = create('ab', cls.a, cls.b)
+        cls.abc = create('abc', cls.a, cls.b, cls.c)
+        cls.only_a = create('a', cls.a)
+        cls.only_c = create('c', cls.c)
+
+    def setUp(self):
+        cache.clear()
+
+    def ids(self, url, **params):
+        response = self.client.get(url, {'page_size': 25, **params})
+        self.assertEqual(response.status_code, 200)
+        return {item['id'] for item in response.data['results']}
+
+    def test_match_any(self):
+        ids = self.ids(reverse('blogs-list'), tags='b,c')
+        self.assertEqual(ids, {self.ab.id, self.abc.id, self.only_c.id})
+
+    def test_match_all(self):
+        ids = self.ids(reverse('blogs-list'), tags='a,b', match='all')
+        self.assertEqual(ids, {self.ab.id, self.abc.id})
+        ids = self.ids(reverse('blogs-list'), tags='a,b,c', match='all')
+        self.assertEqual(ids, {self.abc.id})
+
+    def test_match_all_is_one_query_whatever_the_tag_count(self):
+        url = reverse('blogs-list')
+        # validators, count, page with authors, tags
+        with self.assertNumQueries(4):
+            self.client.get(url, {'tags': 'a,b', 'match': 'all'})
+        with self.assertNumQueries(4):
+            self.client.get(url, {'tags': 'a,b,c', 'match': 'all'})
+
+    def test_invalid_match(self):
+        response = self.client.get(
+            reverse('blogs-list'), {'tags': 'a', 'match': 'some'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_tag_page(self):
+        url = reverse('get_posts_by_tag', args=[self.c.slug])
+        self.assertEqual(self.ids(url), {self.abc.id, self.only_c.id})
+
+    def test_unknown_tag_is_404_and_unused_tag_is_empty(self):
+        response = self.client.get(reverse('get_posts_by_tag', args=['nope']))
+        self.assertEqual(response.status_code, 404)
+        url = reverse('get_posts_by_tag', args=[self.unused.slug])
+        self.assertEqual(self.ids(url), set())
+
+    def test_tagging_invalidates_filtered_list(self):
+        url = reverse('blogs-list')
+        self.assertEqual(self.ids(url, tags='c'), {self.abc.id, self.only_c.id})
+        self.only_a.tags.add(self.c)
+        self.assertEqual(
+            self.ids(url, tags='c'),
+            {self.abc.id, self.only_c.id, self.only_a.id})
+
+
+class TagCloudTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            email='writer@example.com', username='writer', password='!')
+        cls.a, cls.b, cls.c = [Tag.objects.create(name=name) for name in 'abc']
+        cls.posts = [
+            BlogPost.objects.create(
+                thumbnail='thumbnails/post.jpg', title=f'Post {i}',
+                author=cls.author, content='words')
+            for i in range(3)
+        ]
+        for post in cls.posts:
+            post.tags.add(cls.a)
+        cls.posts[0].tags.add(cls.b, cls.c)
+        cls.posts[1].tags.add(cls.b)
+
+    def setUp(self):
+        cache.clear()
+
+    def counts(self):
+        return {tag.slug: tag.post_count for tag in Tag.objects.all()}
+
+    def cloud(self, **params):
+        response = self.client.get(reverse('tags-cloud'), params)
+        self.assertEqual(response.status_code, 200)
+        return [(item['slug'], item['post_count']) for item in response.data]
+
+    def test_counts_follow_tagging(self):
+        self.assertEqual(self.counts(), {'a': 3, 'b': 2, 'c': 1})
+        self.posts[0].tags.remove(self.b, self.c)
+        self.posts[2].tags.remove(self.c)  # not linked: no change
+        self.assertEqual(self.counts(), {'a': 3, 'b': 1, 'c': 0})
+        self.posts[1].tags.set([self.c])
+        self.assertEqual(self.counts(), {'a': 2, 'b': 0, 'c': 1})
+        self.a.blog_posts.clear()
+        self.assertEqual(self.counts(), {'a': 0, 'b': 0, 'c': 1})
+        self.posts[1].delete()
+        self.assertEqual(self.counts(), {'a': 0, 'b': 0, 'c': 0})
+
+    def test_cloud_is_public_sorted_and_skips_unused_tags(self):
+        Tag.objects.create(name='unused')
+        self.assertEqual(self.cloud(), [('a', 3), ('b', 2), ('c', 1)])
+        self.assertEqual(self.cloud(limit=2), [('a', 3), ('b', 2)])
+
+    def test_cloud_reads_no_join_and_is_cached(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.cloud()
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('blogpost_tags', queries[0]['sql'])
+        with self.assertNumQueries(0):
+            self.cloud()
+        self.posts[2].tags.add(self.c)
+        self.assertEqual(self.cloud(), [('a', 3), ('b', 2), ('c', 2)])
+
+    def test_tags_route_is_not_taken_by_post_detail(self):
+        response = self.client.get(reverse('tags-list'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_reconcile_fixes_drift(self):
+        Tag.objects.filter(pk=self.a.pk).update(post_count=7)
+        out = StringIO()
+        call_command('reconcile_tag_counts', stdout=out)
+        self.assertIn('a: 7 -> 3', out.getvalue())
+        self.assertEqual(self.counts(), {'a': 3, 'b': 2, 'c': 1})
+
+
+class PostTagWriteTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            email='writer@example.com', username='writer', password='!')
+        cls.tags = [Tag.objects.create(name=f'tag{i}') for i in range(20)]
+        cls.post = BlogPost.objects.create(
+            thumbnail='thumbnails/post.jpg', title='Post', author=cls.author,
+            content='words')
+        cls.post.tags.add(*cls.tags[:3])
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+        self.url = reverse('blogs-detail', args=[self.post.slug])
+
+    def patch(self, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, data, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return len(queries)
+
+    def tag_slugs(self):
+        return set(self.post.tags.values_list('slug', flat=True))
+
+    def test_retagging_cost_does_not_grow_with_tag_count(self):
+        few = self.patch({'tags': [tag.pk for tag in self.tags[1:5]]})
+        self.assertEqual(self.tag_slugs(), {f'tag{i}' for i in range(1, 5)})
+        many = self.patch({'tags': [tag.pk for tag in self.tags[5:20]]})
+        self.assertEqual(self.tag_slugs(), {f'tag{i}' for i in range(5, 20)})
+        self.assertEqual(few, many)
+
+    def test_tag_names_create_missing_tags(self):
+        self.patch({'tags': [self.tags[0].pk],
+                    'tag_names': ['Tag1', 'brand new', 'Brand New']})
+        self.assertEqual(self.tag_slugs(), {'tag0', 'tag1', 'brand-new'})
+        self.assertEqual(Tag.objects.get(slug='brand-new').name, 'Brand new')
+        self.assertEqual(Tag.objects.filter(slug='tag1').count(), 1)
+
+    def test_untouched_tags_are_kept(self):
+        self.patch({'title': 'Renamed'})
+        self.assertEqual(self.tag_slugs(), {'tag0', 'tag1', 'tag2'})
+
+    def test_blank_tag_name_is_rejected(self):
+        response = self.client.patch(
+            self.url, {'tag_names': ['!!']}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_tag_id_is_rejected(self):
+        response = self.client.patch(
+            self.url, {'tags': [self.tags[0].pk, 999]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.tag_slugs(), {'tag0', 'tag1', 'tag2'})
+
+
+class CommentRepliesTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.tags, cls.posts = seed_posts(2)
+        post = cls.posts[0]
+        cls.comments = [
+            Comment.objects.create(
+                post=post, author=cls.users[i % 5], content=f'c{i}')
+            for i in range(4)
+        ]
+        cls.replies = [
+            Comment.objects.create(
+                parent=cls.comments[0], author=cls.users[i % 5],
+                content=f'r{i}')
+            for i in range(12)
+        ] + [
+            Comment.objects.create(
+                parent=cls.comments[1], author=cls.users[0], content='r')
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_listing_previews_replies_in_fixed_queries(self):
+        url = reverse('get_post_comments', args=[self.posts[0].id])
+        # validators, count, comments with authors and reply counts,
+        # first replies with authors
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        results = response.data['results']
+        self.assertEqual(
+            [item['reply_count'] for item in results], [12, 1, 0, 0])
+        self.assertEqual(
+            [reply['id'] for reply in results[0]['replies']],
+            [reply.id for reply in self.replies[:3]])
+        self.assertEqual(results[0]['replies'][0]['author']['id'],
+                         self.users[0].id)
+        self.assertEqual(len(results[1]['replies']), 1)
+
+    def test_replies_endpoint_pages_through_all_replies(self):
+        url = reverse('get_comment_replies', args=[self.comments[0].id])
+        ids = []
+        params = {'limit': 5}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data['results']]
+            url, params = response.data['next'], None
+        self.assertEqual(ids, [reply.id for reply in self.replies[:12]])
+
+    def test_replies_of_unknown_comment_is_404(self):
+        response = self.client.get(reverse('get_comment_replies', args=[999]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            reverse('get_comment_replies', args=[self.comments[3].id]))
+        self.assertEqual(response.data['results'], [])
+
+
+class CommentCountTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.tags, cls.posts = seed_posts(2)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.users[0])
+        self.post = self.posts[0]
+
+    def comment(self):
+        response = self.client.post(
+            reverse('get_post_comments', args=[self.post.id]),
+            {'content': 'Comment'})
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def reply(self, comment_id):
+        # Both reply routes are named 'reply'; reverse() finds the other one.
+        response = self.client.post(
+            f'/api/v1/blogs/comments/{comment_id}/reply/', {'content': 'Reply'})
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def counts(self, *comment_ids):
+        self.post.refresh_from_db()
+        replies = dict(Comment.objects.filter(
+            pk__in=comment_ids).values_list('pk', 'reply_count'))
+        return self.post.comment_count, [replies.get(pk) for pk in comment_ids]
+
+    def test_counts_follow_writes(self):
+        first, second = self.comment(), self.comment()
+        replies = [self.reply(first) for _ in range(3)]
+        self.reply(second)
+        self.assertEqual(self.counts(first, second), (6, [3, 1]))
+
+        self.client.delete(reverse('reply', args=[replies[0]]))
+        self.assertEqual(self.counts(first, second), (5, [2, 1]))
+        # Deleting a comment takes its replies with it.
+        self.client.delete(reverse('comment', args=[first]))
+        self.assertEqual(self.counts(second), (2, [1]))
+
+    def test_counts_are_served(self):
+        comment = self.comment()
+        self.reply(comment)
+        self.client.force_authenticate(None)
+        response = self.client.get(reverse('blogs-detail', args=[self.post.slug]))
+        self.assertEqual(response.data['comment_count'], 2)
+        response = self.client.get(reverse('blogs-list'), {'page_size': 25})
+        card = next(item for item in response.data['results']
+                    if item['id'] == self.post.id)
+        self.assertEqual(card['comment_count'], 2)
+        response = self.client.get(
+            reverse('get_post_comments', args=[self.post.id]))
+        self.assertEqual(response.data['results'][0]['reply_count'], 1)
+
+    def test_new_comment_changes_post_etag(self):
+        url = reverse('blogs-detail', args=[self.post.slug])
+        self.client.force_authenticate(None)
+        etag = self.client.get(url)['ETag']
+        Comment.objects.create(
+            post=self.post, author=self.users[1], content='Comment')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_reconcile_fixes_drift(self):
+        comment = self.comment()
+        self.reply(comment)
+        BlogPost.objects.filter(pk=self.post.pk).update(comment_count=9)
+        Comment.objects.filter(pk=comment).update(reply_count=0)
+        out = StringIO()
+        call_command('reconcile_comment_counts', batch_size=1, stdout=out)
+        self.assertIn(f'post {self.post.pk}: 9 -> 2', out.getvalue())
+        self.assertEqual(self.counts(comment), (2, [1]))
+
+
+class CommentExportTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.tags, cls.posts = seed_posts(2)
+        post = cls.posts[0]
+        first, second = [
+            Comment.objects.create(post=post, author=cls.users[0], content=c)
+            for c in ('first', 'second')
+        ]
+        cls.thread = [first]
+        cls.thread += [
+            Comment.objects.create(parent=first, author=cls.users[1], content=r)
+            for r in ('r1', 'r2')
+        ]
+        cls.thread.append(second)
+        Comment.objects.create(
+            post=cls.posts[1], author=cls.users[0], content='elsewhere')
+        cls.url = reverse('export_post_comments', args=[post.id])
+
+    def test_requires_authentication(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_streams_thread_as_ndjson(self):
+        self.client.force_authenticate(self.users[0])
+        # post lookup, thread cursor
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+            body = b''.join(response.streaming_content).decode()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(
+            [record['id'] for record in records],
+            [comment.id for comment in self.thread])
+        self.assertEqual(records[0]['reply_count'], 2)
+        self.assertEqual(records[1]['parent'], self.thread[0].id)
+        self.assertEqual(records[1]['author']['username'],
+                         self.users[1].username)
+
+    def test_unknown_post_is_404(self):
+        self.client.force_authenticate(self.users[0])
+        response = self.client.get(reverse('export_post_comments', args=[999]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ExportBlogTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.tags, cls.posts = seed_posts(3)
+        cls.comment = Comment.objects.create(
+            post=cls.posts[0], author=cls.users[0], content='Comment')
+
+    def setUp(self):
+        self.output = tempfile.TemporaryDirectory()
+        self.addCleanup(self.output.cleanup)
+
+    def export(self, *args):
+        call_command('export_blog', self.output.name, *args, stdout=StringIO())
+
+    def read_jsonl(self, name, opener=open):
+        with opener(os.path.join(self.output.name, name), 'rt') as fh:
+            return [json.loads(line) for line in fh]
+
+    def test_exports_every_dataset(self):
+        self.export()
+        users = self.read_jsonl('users.jsonl')
+        self.assertEqual(len(users), len(self.users))
+        self.assertNotIn('email', users[0])
+        self.assertNotIn('password', users[0])
+        posts = self.read_jsonl('posts.jsonl')
+        self.assertEqual([post['id'] for post in posts],
+                         sorted(post.id for post in self.posts))
+        self.assertEqual(
+            len(self.read_jsonl('post_tags.jsonl')),
+            BlogPost.tags.through.objects.count())
+        self.assertEqual(len(self.read_jsonl('tags.jsonl')), len(self.tags))
+        [comment] = self.read_jsonl('comments.jsonl')
+        self.assertEqual(comment['post_id'], self.posts[0].id)
+
+    def test_csv_gzip(self):
+        self.export('--format', 'csv', '--gzip')
+        path = os.path.join(self.output.name, 'comments.csv.gz')
+        with gzip.open(path, 'rt', newline='') as fh:
+            rows = list(csv.DictReader(fh))
+        self.assertEqual(rows[0]['content'], 'Comment')
+        self.assertEqual(rows[0]['parent_id'], '')
+
+    def test_since_exports_recent_changes(self):
+        cutoff = timezone.now()
+        self.posts[1].title = 'Edited'
+        self.posts[1].save()
+        self.export('--since', cutoff.isoformat())
+        self.assertEqual(
+            [post['id'] for post in self.read_jsonl('posts.jsonl')],
+            [self.posts[1].id])
+        self.assertEqual(self.read_jsonl('comments.jsonl'), [])
+        self.assertEqual(
+            {link['blogpost_id'] for link in self.read_jsonl('post_tags.jsonl')},
+            {self.posts[1].id})
+
+    def test_invalid_since_is_a_command_error(self):
+        for value in ('yesterday', '2024-13-01', '2024-02-30T10:00:00'):
+            with self.subTest(value=value):
+                with self.assertRaisesMessage(CommandError, 'Invalid --since'):
+                    self.export('--since', value)
+
+
+class ImportBlogTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.tags, cls.posts = seed_posts(3)
+        cls.comment = Comment.objects.create(
+            post=cls.posts[0], author=cls.users[0], content='Comment')
+        Comment.objects.create(
+            parent=cls.comment, author=cls.users[1], content='Reply')
+
+    def setUp(self):
+        self.output = tempfile.TemporaryDirectory()
+        self.addCleanup(self.output.cleanup)
+        call_command('export_blog', self.output.name, '--gzip', stdout=StringIO())
+        self.first_post_tags = set(
+            self.posts[0].tags.values_list('slug', flat=True))
+        # Import into an empty blog, as a migration would.
+        Comment.objects.all().delete()
+        BlogPost.objects.all().delete()
+        User.objects.filter(pk__in=[user.pk for user in self.users[1:]]).delete()
+
+    def import_blog(self, **options):
+        out = StringIO()
+        call_command('import_blog', self.output.name, batch_size=2, stdout=out,
+                     **options)
+        return out.getvalue()
+
+    def test_imports_threads_and_rebuilds_counters(self):
+        out = self.import_blog()
+        self.assertIn('rows/s', out)
+        # The author left in place gets a new account.
+        self.assertEqual(User.objects.count(), len(self.users) + 1)
+        post = BlogPost.objects.get(title=self.posts[0].title)
+        self.assertEqual(post.slug, self.posts[0].slug)
+        self.assertEqual(post.created_at, self.posts[0].created_at)
+        self.assertEqual(post.updated_at, self.posts[0].updated_at)
+        self.assertEqual(post.excerpt, self.posts[0].content)
+        self.assertEqual(
+            set(post.tags.values_list('slug', flat=True)), self.first_post_tags)
+        self.assertEqual(post.comment_count, 2)
+        comment = post.comments.get()
+        self.assertEqual(comment.reply_count, 1)
+        self.assertEqual(comment.updated_at, self.comment.updated_at)
+        self.assertEqual(comment.replies.get().content, 'Reply')
+        tag = Tag.objects.get(pk=self.tags[0].pk)
+        self.assertEqual(tag.post_count, tag.blog_posts.count())
+
+    def test_resumes_from_checkpoint(self):
+        with mock.patch('blog.imports.BlogImporter.import_replies',
+                        side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.import_blog()
+        self.assertEqual(BlogPost.objects.count(), len(self.posts))
+        self.assertFalse(Comment.objects.filter(parent__isnull=False).exists())
+
+        out = self.import_blog()
+        self.assertIn('posts: 0 rows', out)
+        self.assertEqual(BlogPost.objects.count(), len(self.posts))
+        self.assertEqual(Comment.objects.count(), 2)
+
+    def test_checkpoint_commits_with_the_batch(self):
+        with mock.patch('blog.imports.Checkpoint.record',
+                        side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.import_blog()
+        self.assertEqual(User.objects.count(), 1)
+        self.assertFalse(ImportBatch.objects.exists())
+
+        self.import_blog()
+        self.assertEqual(User.objects.count(), len(self.users) + 1)
+        self.assertEqual(BlogPost.objects.count(), len(self.posts))
+
+    def test_imported_users_do_not_take_over_accounts(self):
+        self.import_blog()
+        owner = self.users[0]
+        imported = User.objects.get(username=f'{owner.username}_2')
+        self.assertFalse(owner.blog_posts.exists())
+        self.assertEqual(
+            imported.blog_posts.get(title=self.posts[0].title).slug,
+            self.posts[0].slug)
+
+    def test_match_users_maps_authors_by_username(self):
+        self.import_blog(match_users=True)
+        self.assertEqual(User.objects.count(), len(self.users))
+        self.assertTrue(self.users[0].blog_posts.filter(
+            title=self.posts[0].title).exists())
+
+    def test_slugs_do_not_collide_with_existing_posts(self):
+        self.import_blog()
+        self.import_blog(restart=True)
+        slugs = sorted(BlogPost.objects.filter(
+            title=self.posts[0].title).values_list('slug', flat=True))
+        self.assertEqual(slugs, [self.posts[0].slug, f'{self.posts[0].slug}-2'])
+
+
+class BenchmarkCommandTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'seed_blog', users=4, posts=12, tags=5, comments=40,
+            viral_posts=1, stdout=StringIO())
+
+    def setUp(self):
+        cache.clear()
+
+    def test_seed_blog_fills_counters(self):
+        self.assertEqual(BlogPost.objects.count(), 12)
+        self.assertEqual(Comment.objects.count(), 40)
+        self.assertEqual(Comment.objects.filter(parent__isnull=False).count(), 20)
+        post = BlogPost.objects.order_by('-comment_count').first()
+        self.assertEqual(
+            post.comment_count,
+            Comment.objects.filter(post=post).count() +
+            Comment.objects.filter(parent__post=post).count())
+        tag = Tag.objects.order_by('-post_count').first()
+        self.assertEqual(tag.post_count, tag.blog_posts.count())
+        self.assertTrue(self.client.login(
+            email='seed0@example.com', password='bench-password'))
+
+    def test_bench_api_covers_every_route(self):
+        output = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+        output.close()
+        self.addCleanup(os.remove, output.name)
+        err = StringIO()
+        call_command(
+            'bench_api', iterations=2, warmup=0, output=output.name,
+            stdout=StringIO(), stderr=err)
+        self.assertNotIn('Not benchmarked', err.getvalue())
+        with open(output.name, encoding='utf-8') as fh:
+            report = json.load(fh)
+        for name, row in report['routes'].items():
+            self.assertLess(max(row['statuses']), 400, name)
+        self.assertEqual(report['meta']['rows']['posts'], 12)
+        self.assertEqual(BlogPost.objects.count(), 12)
+
+        out = StringIO()
+        call_command(
+            'bench_api', iterations=1, warmup=0, only=['posts:list'],
+            compare=output.name, stdout=out, stderr=StringIO())
+        self.assertIn('p50 diff', out.getvalue())
+
+
+@override_settings(METRICS_FLUSH_INTERVAL=0)
+class RequestMetricsTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.tags, cls.posts = seed_posts(3)
+        cls.staff = User.objects.create_user(
+            email='staff@example.com', username='staff', password='!',
+            is_staff=True)
+
+    def setUp(self):
+        metrics.registry.flush()
+        cache.clear()
+        clear_local_cache()
+
+    def test_server_timing_header(self):
+        self.assertNotIn(
+            'Server-Timing', self.client.get(reverse('blogs-list')))
+        cache.clear()
+        token = RefreshToken.for_user(self.staff).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        timing = self.client.get(reverse('blogs-list'))['Server-Timing']
+        for name in ('db;dur=', 'view;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(name, timing)
+        self.assertIn('count miss x1', timing)
+        self.assertIn('count hit x1',
+                      self.client.get(reverse('blogs-list'))['Server-Timing'])
+
+    def test_metrics_are_aggregated_per_view(self):
+        url = reverse('get_posts_by_tag', args=[self.tags[0].slug])
+        self.client.get(url)
+        self.client.get(url)
+        self.client.force_authenticate(self.staff)
+        # Past the response cache: the authors come from their cache.
+        self.client.get(url)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn(
+            'blog_requests_total{view="get_posts_by_tag",status="2xx"} 3', body)
+        self.assertIn(
+            'blog_cache_hits_total{view="get_posts_by_tag",cache="response"} 1',
+            body)
+        self.assertIn(
+            'blog_cache_misses_total{view="get_posts_by_tag",cache="author"} 3',
+            body)
+        self.assertIn(
+            'blog_cache_hits_total{view="get_posts_by_tag",cache="author"} 3',
+            body)
+        self.assertIn(
+            'blog_request_duration_seconds_count{view="get_posts_by_tag"} 3', body)
+        self.assertIn(
+            'blog_request_db_queries_bucket{view="get_posts_by_tag",le="+Inf"} 3',
+            body)
+
+    def test_metrics_are_staff_only(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        self.client.force_authenticate(self.users[0])
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+
+@override_settings(PROFILE_BUFFER_SIZE=2)
+class RequestProfilingTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.tags, cls.posts = seed_posts(3)
+        cls.staff = User.objects.create_user(
+            email='staff@example.com', username='staff', password='!',
+            is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def profile(self, user, url=None):
+        token = RefreshToken.for_user(user).access_token
+        return self.client.get(
+            url or reverse('blogs-list'), HTTP_X_PROFILE='1',
+            HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_staff_request_is_profiled(self):
+        response = self.profile(self.staff)
+        self.assertEqual(response.status_code, 200)
+        profile_id = response['X-Profile-Id']
+
+        self.client.force_authenticate(self.staff)
+        profile = self.client.get(reverse('profile', args=[profile_id])).data
+        self.assertEqual(profile['path'], reverse('blogs-list'))
+        self.assertEqual(profile['user'], self.staff.email)
+        self.assertIn('function calls', profile['stats'])
+        self.assertTrue(profile['sql'])
+        self.assertTrue(any(
+            line.startswith('blog/views.py')
+            for query in profile['sql'] for line in query['stack']))
+
+        download = self.client.get(
+            reverse('profile-download', args=[profile_id]))
+        self.assertIn('attachment', download['Content-Disposition'])
+        self.assertIsInstance(marshal.loads(download.content), dict)
+
+    def test_other_requests_are_not_profiled(self):
+        self.assertNotIn('X-Profile-Id', self.profile(self.users[0]))
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('blogs-list')))
+        self.assertNotIn(
+            'X-Profile-Id',
+            self.client.get(reverse('blogs-list'), HTTP_X_PROFILE='1',
+                            HTTP_AUTHORIZATION='Bearer invalid'))
+
+    def test_buffer_keeps_the_latest_profiles(self):
+        ids = [self.profile(self.staff)['X-Profile-Id'] for _ in range(3)]
+        self.client.force_authenticate(self.staff)
+        listed = self.client.get(reverse('profiles')).data
+        self.assertEqual([str(p['id']) for p in listed], ids[:0:-1])
+        self.assertEqual(
+            self.client.get(reverse('profile', args=[ids[0]])).status_code, 404)
+
+    def test_profiles_are_staff_only(self):
+        self.client.force_authenticate(self.users[0])
+        self.assertEqual(self.client.get(reverse('profiles')).status_code, 403)
+
+
+def image_upload(name='photo.png', size=(1500, 1000), mode='RGBA'):
+    buffer = BytesIO()
+    Image.new(mode, size, (200, 40, 40, 128)[:len(mode)]).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+IN_MEMORY_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(STORAGES=IN_MEMORY_STORAGES, THUMBNAIL_WORKERS=0)
+class ThumbnailRenditionTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            email='writer@example.com', username='writer', password='!')
+        cls.tag = Tag.objects.create(name='photos')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.author)
+
+    def create_post(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('blogs-list'), {
+                'title': 'Photo', 'content': 'words', 'tags': [self.tag.pk],
+                'thumbnail': image_upload(), **data,
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        return BlogPost.objects.get(pk=response.data['id'])
+
+    def test_upload_is_rendered_at_each_width(self):
+        post = self.create_post()
+        self.assertEqual(post.thumbnail_widths, list(THUMBNAIL_WIDTHS))
+        for extension, image_format in (('webp', 'WEBP'), ('jpg', 'JPEG')):
+            name = rendition_name(post.thumbnail.name, 320, extension)
+            with default_storage.open(name) as fh, Image.open(fh) as image:
+                self.assertEqual(image.format, image_format)
+                self.assertEqual(image.size, (320, 213))
+
+        self.client.force_authenticate(None)
+        data = self.client.get(reverse('blogs-detail', args=[post.slug])).data
+        srcset = data['thumbnail_srcset']
+        self.assertEqual(set(srcset), {'image/webp', 'image/jpeg'})
+        self.assertIn('-320w.webp 320w', srcset['image/webp'])
+        self.assertTrue(srcset['image/jpeg'].endswith('-1024w.jpg 1024w'))
+        card = self.client.get(reverse('blogs-list')).data['results'][0]
+        self.assertEqual(card['thumbnail_srcset'], srcset)
+
+    def test_small_images_are_not_upscaled(self):
+        post = self.create_post(thumbnail=image_upload(size=(200, 100), mode='RGB'))
+        self.assertEqual(post.thumbnail_widths, [200])
+
+    def test_new_thumbnail_is_rendered_again(self):
+        post = self.create_post()
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.patch(
+                reverse('blogs-detail', args=[post.slug]),
+                {'thumbnail': image_upload('other.png', size=(700, 700))},
+                format='multipart')
+        self.assertIsNone(response.data['thumbnail_srcset'])
+        for callback in callbacks:
+            callback()
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnail_widths, [320, 640])
+
+
+@override_settings(STORAGES=IN_MEMORY_STORAGES)
+class GenerateThumbnailsTests(TransactionTestCase):
+
+    def test_backfill_renders_posts_in_parallel(self):
+        author = User.objects.create(
+            email='writer@example.com', username='writer', password='!')
+        posts = [
+            BlogPost.objects.create(
+                thumbnail=default_storage.save(f'thumbnails/old{i}.png', image_upload()),
+                title=f'Old {i}', author=author, content='words')
+            for i in range(3)
+        ]
+        missing = BlogPost.objects.create(
+            thumbnail='thumbnails/missing.png', title='Missing', author=author,
+            content='words')
+        out, err = StringIO(), StringIO()
+        call_command('generate_thumbnails', workers=2, stdout=out, stderr=err)
+        self.assertIn('3 rendered, 1 failed', out.getvalue())
+        self.assertIn(f'post {missing.pk}', err.getvalue())
+        for post in posts:
+            post.refresh_from_db()
+            self.assertEqual(post.thumbnail_widths, list(THUMBNAIL_WIDTHS))
+
+        out = StringIO()
+        call_command('generate_thumbnails', stdout=out, stderr=StringIO())
+        self.assertIn('Rendering thumbnails of 1 posts', out.getvalue())
+
+
+@override_settings(STORAGES=IN_MEMORY_STORAGES, THUMBNAIL_WORKERS=0)
+class MediaDedupTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            email='writer@example.com', username='writer', password='!')
+        cls.tag = Tag.objects.create(name='photos')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.author)
+
+    def create_post(self, title, thumbnail):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('blogs-list'), {
+                'title': title, 'content': 'words', 'tags': [self.tag.pk],
+                'thumbnail': thumbnail,
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        return BlogPost.objects.get(pk=response.data['id'])
+
+    def test_identical_uploads_are_stored_once(self):
+        with mock.patch.object(default_storage, 'save',
+                               wraps=default_storage.save) as save, \
+                mock.patch('blog.renditions.render_thumbnail',
+                           wraps=render_thumbnail) as render, \
+                mock.patch('utils.media.content_sha256',
+                           wraps=media.content_sha256) as digest:
+            first = self.create_post('First', image_upload('a.png'))
+            second = self.create_post('Second', image_upload('b.PNG'))
+
+        self.assertEqual(first.thumbnail.name, second.thumbnail.name)
+        self.assertRegex(first.thumbnail.name, r'^thumbnails/[0-9a-f]{64}\.png$')
+        blob = MediaBlob.objects.get()
+        self.assertEqual((blob.name, blob.ref_count),
+                         (first.thumbnail.name, 2))
+        self.assertEqual(blob.size, first.thumbnail.size)
+        # One original and its renditions; the second post reuses them.
+        self.assertEqual(save.call_count, 1 + 2 * len(THUMBNAIL_WIDTHS))
+        render.assert_called_once()
+        self.assertEqual(second.thumbnail_widths, list(THUMBNAIL_WIDTHS))
+        # Hashed by the upload handler, not read again to hash it.
+        self.assertTrue(all(
+            hasattr(call.args[0], 'sha256') for call in digest.call_args_list))
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=0)
+    def test_uploads_streamed_to_disk_are_hashed(self):
+        post = self.create_post('Large', image_upload())
+        self.assertEqual(post.thumbnail.name, self.create_post(
+            'Large again', image_upload()).thumbnail.name)
+        self.assertEqual(MediaBlob.objects.get().ref_count, 2)
+
+    def test_profile_photos_are_deduplicated(self):
+        other = User.objects.create(
+            email='other@example.com', username='other', password='!')
+        for user in (self.author, other):
+            user.profile_photo = image_upload(size=(64, 64))
+            user.save()
+        self.assertEqual(self.author.profile_photo.name, other.profile_photo.name)
+        self.assertTrue(other.profile_photo.name.startswith('images/profile/'))
+        self.assertEqual(MediaBlob.objects.get().ref_count, 2)
+
+        other.delete()
+        self.assertEqual(MediaBlob.objects.get().ref_count, 1)
+        # Unrelated saves don't touch the counts.
+        User.objects.get(pk=self.author.pk).save()
+        self.assertEqual(MediaBlob.objects.get().ref_count, 1)
+
+    def test_names_copied_to_new_rows_are_counted(self):
+        self.author.profile_photo = image_upload(size=(64, 64))
+        self.author.save()
+        other = User.objects.create(
+            email='other@example.com', username='other', password='!',
+            profile_photo=self.author.profile_photo.name)
+        post = self.create_post('First', image_upload())
+        BlogPost.objects.create(
+            title='Copy', content='words', author=other,
+            thumbnail=post.thumbnail)
+        self.assertEqual(
+            MediaBlob.objects.get(name=other.profile_photo.name).ref_count, 2)
+        self.assertEqual(
+            MediaBlob.objects.get(name=post.thumbnail.name).ref_count, 2)
+
+        self.author.delete()
+        self.assertEqual(
+            MediaBlob.objects.get(name=other.profile_photo.name).ref_count, 1)
+
+    def test_counts_roll_back_with_the_save(self):
+        self.author.profile_photo = image_upload(size=(64, 64))
+        self.author.save()
+        old = self.author.profile_photo.name
+        self.author.profile_photo = image_upload(size=(32, 32))
+        with mock.patch('utils.media.release_blob',
+                        side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.author.save()
+        self.assertEqual(User.objects.get(pk=self.author.pk).profile_photo, old)
+        self.assertEqual(
+            list(MediaBlob.objects.values_list('name', 'ref_count')),
+            [(old, 1)])
+
+    def test_unreferenced_blobs_are_collected(self):
+        first = self.create_post('First', image_upload())
+        second = self.create_post('Second', image_upload())
+        old = first.thumbnail.name
+        response = self.client.patch(
+            reverse('blogs-detail', args=[first.slug]),
+            {'thumbnail': image_upload(size=(700, 700))}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(MediaBlob.objects.get(name=old).ref_count, 1)
+        second.delete()
+        self.assertEqual(MediaBlob.objects.get(name=old).ref_count, 0)
+
+        out = StringIO()
+        call_command('gc_media_blobs', stdout=out)
+        self.assertIn('Deleted 0 blobs', out.getvalue())
+
+        out = StringIO()
+        call_command('gc_media_blobs', grace=0, dry_run=True, stdout=out)
+        self.assertIn(old, out.getvalue())
+        self.assertTrue(default_storage.exists(old))
+
+        out = StringIO()
+        call_command('gc_media_blobs', grace=0, batch_size=1, stdout=out)
+        self.assertIn('Deleted 1 blobs', out.getvalue())
+        self.assertFalse(default_storage.exists(old))
+        self.assertFalse(default_storage.exists(rendition_name(old, 320, 'webp')))
+        self.assertFalse(MediaBlob.objects.filter(name=old).exists())
+        first.refresh_from_db()
+        self.assertTrue(default_storage.exists(first.thumbnail.name))
+
+        # Uploading the collected content again stores it again.
+        third = self.create_post('Third', image_upload())
+        self.assertEqual(third.thumbnail.name, old)
+        self.assertTrue(default_storage.exists(old))
+        self.assertEqual(MediaBlob.objects.get(name=old).ref_count, 1)
+
+
+class SpooledStorageTests(APITestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.remote = FileSystemStorage(
+            location=os.path.join(directory.name, 'bucket'),
+            base_url='https://bucket.example.com/')
+        self.storage = SpooledStorage(
+            remote=self.remote, location=os.path.join(directory.name, 'spool'),
+            base_url='/spool/', workers=1, retries=2, retry_delay=0)
+        self.addCleanup(self.storage.join)
+
+    def test_save_returns_before_the_upload(self):
+        release = threading.Event()
+        save = self.remote.save
+        with mock.patch.object(
+                self.remote, 'save',
+                side_effect=lambda *args: release.wait(5) and save(*args)):
+            name = self.storage.save('thumbnails/a.txt', ContentFile(b'data'))
+            self.assertFalse(self.remote.exists(name))
+            self.assertEqual(self.storage.url(name), '/spool/thumbnails/a.txt')
+            with self.storage.open(name) as fh:
+                self.assertEqual(fh.read(), b'data')
+            release.set()
+            self.storage.join()
+        self.assertTrue(self.remote.exists(name))
+        self.assertEqual(list(self.storage.spooled()), [])
+        self.assertEqual(
+            self.storage.url(name), 'https://bucket.example.com/thumbnails/a.txt')
+
+    def test_failed_uploads_are_retried(self):
+        with mock.patch.object(
+                self.remote, 'save', side_effect=[OSError('timeout'), 'a.txt']), \
+                self.assertLogs('custom_storages', 'WARNING'):
+            self.storage.save('a.txt', ContentFile(b'data'))
+            self.storage.join()
+            self.assertEqual(self.remote.save.call_count, 2)
+        self.assertEqual(list(self.storage.spooled()), [])
+
+    def test_files_stay_spooled_until_flushed(self):
+        with mock.patch.object(self.remote, 'save', side_effect=OSError('down')), \
+                self.assertLogs('custom_storages', 'ERROR'):
+            name = self.storage.save('a.txt', ContentFile(b'data'))
+            self.storage.join()
+        self.assertEqual(list(self.storage.spooled()), [name])
+
+        with override_settings(STORAGES={
+                'default': {'BACKEND': 'custom_storages.SpooledStorage',
+                            'OPTIONS': {'remote': self.remote,
+                                        'location': self.storage.spool.location,
+                                        'workers': 1}},
+                'staticfiles': IN_MEMORY_STORAGES['staticfiles']}):
+            response = self.client.get(f'/spool/{name}')
+            self.assertEqual(b''.join(response.streaming_content), b'data')
+            out = StringIO()
+            call_command('flush_upload_spool', stdout=out)
+            self.assertIn('1 of 1 spooled files uploaded', out.getvalue())
+            # Spool URLs handed out earlier redirect to the bucket.
+            response = self.client.get(f'/spool/{name}')
+            self.assertRedirects(
+                response, f'https://bucket.example.com/{name}',
+                fetch_redirect_response=False)
+
+
+class MediaURLTests(APITestCase):
+
+    def storage(self, **options):
+        return MediaStorage(
+            credentials=AnonymousCredentials(), project_id='test', **options)
+
+    def test_public_urls_skip_signing(self):
+        storage = self.storage(public_urls=True)
+        with mock.patch.object(Blob, 'generate_signed_url') as sign:
+            url = storage.url('thumbnails/a b.jpg')
+        sign.assert_not_called()
+        self.assertEqual(
+            url, f'https://storage.googleapis.com/{storage.bucket_name}'
+                 '/media/thumbnails/a%20b.jpg')
+        self.assertEqual(
+            self.storage(public_urls=True, custom_endpoint='https://cdn.example.com')
+            .url('a.jpg'), 'https://cdn.example.com/media/a.jpg')
+
+    def test_signed_urls_are_cached_until_half_their_lifetime(self):
+        storage = self.storage(expiration=timedelta(seconds=0.2))
+        with mock.patch.object(
+                Blob, 'generate_signed_url',
+                side_effect=lambda **kwargs: f'signed-{time.monotonic()}') as sign:
+            first = storage.url('a.jpg')
+            self.assertEqual(storage.url('a.jpg'), first)
+            storage.url('b.jpg')
+            self.assertEqual(sign.call_count, 2)
+            time.sleep(0.15)
+            self.assertNotEqual(storage.url('a.jpg'), first)
+            self.assertEqual(sign.call_count, 3)
+
+    def test_url_cache_can_be_disabled(self):
+        storage = self.storage(url_cache_size=0)
+        with mock.patch.object(
+                Blob, 'generate_signed_url', return_value='signed') as sign:
+            storage.url('a.jpg')
+            storage.url('a.jpg')
+        self.assertEqual(sign.call_count, 2)
@@ -6,25 +6,35 @@ from .views import (
     GetUserPostsView,
     GetPostsByTagView,
     ListCreateCommentView,
+    ExportCommentsView,
     CreateListTagsViewSet,
     UpdateDeleteCommentView,
+    ListRepliesView,
     CreateReplyView,
     UpdateDeleteReplyView
 )
 
 router = DefaultRouter()
 
-router.register("", BlogPostViewSet, basename="blogs")
+# Tags first: the post detail route ("<slug>/") would otherwise catch
+# "tags/".
 router.register("tags", CreateListTagsViewSet, basename="tags")
+router.register("", BlogPostViewSet, basename="blogs")
 
 urlpatterns = [
     path("", include(router.urls)),
     path("<int:post_id>/comments/",
          ListCreateCommentView.as_view(),
          name='get_post_comments'),
+    path("<int:post_id>/comments/export/",
+         ExportCommentsView.as_view(),
+         name='export_post_comments'),
     path("comments/<int:pk>/",
          UpdateDeleteCommentView.as_view(),
          name='comment'),
+    path("comments/<int:comment_id>/replies/",
+         ListRepliesView.as_view(),
+         name='get_comment_replies'),
     path("comments/<int:comment_id>/reply/",
          CreateReplyView.as_view(),
          name='reply'),
@@ -1,44 +1,78 @@
 from rest_framework import viewsets, status, mixins, generics
+from rest_framework.decorators import action
 from rest_framework.request import Request
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.permissions import AllowAny, IsAuthenticatedOrReadOnly, IsAuthenticated
+from rest_framework.exceptions import PermissionDenied, ValidationError
 
-from django.shortcuts import get_object_or_404
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
 
 from .models import BlogPost, Tag, Comment
+from . import cache, conditional
+from .exports import comment_record, comment_thread, ndjson_lines
+from .search import search_posts
+from .filters import filter_by_tags, get_tag_filter
 from .serializers import (
+    BlogPostCardSerializer,
     GetBlogPostSerializer,
-    GetUserBlogPostSerializer,
     CreateUpdateBlogPostSerializer,
     ListCommentSerializer,
+    ReplySerializer,
     CreateCommentSerializer,
     UpdateCommentSerializer,
     CreateReplySerializer,
     UpdateReplySerializer,
-    TagSerializer
+    TagSerializer,
+    TagCloudSerializer
+)
+from utils.pagination import (
+    CustomPageNumPagination,
+    CustomLimitOffsetPagination,
+    CommentCursorPagination,
+    CursorPaginationMixin,
+    SearchCursorPagination
 )
-from utils.pagination import CustomPageNumPagination, CustomLimitOffsetPagination
 from utils.responses import SuccessResponse
+from utils.cache import cache_public_response
+from utils.conditional import conditional_get
 from utils.permissions import BlogPostPermission, CommentPermission
 from utils import swagger_schemas
 
 from drf_yasg.utils import swagger_auto_schema
 
 
-class BlogPostViewSet(viewsets.ModelViewSet):
+class BlogPostViewSet(CursorPaginationMixin, viewsets.ModelViewSet):
 
-    queryset = BlogPost.objects.all()
+    queryset = BlogPost.objects.select_related('author').prefetch_related('tags')
     serializer_class = GetBlogPostSerializer
     pagination_class = CustomPageNumPagination
     permission_classes = [BlogPostPermission]
     lookup_field = 'slug'
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = queryset.defer('content')
+            slugs, match = get_tag_filter(self.request)
+            if slugs:
+                queryset = filter_by_tags(queryset, slugs, match)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return BlogPostCardSerializer
+        return super().get_serializer_class()
+
     @swagger_auto_schema(
         tags=['Blog Post'],
         operation_summary="Get posts",
-        operation_description="Get a list of posts with pagination"
+        operation_description="Get a list of posts with pagination, optionally "
+                              "filtered by tags (?tags=a,b&match=all|any)",
+        manual_parameters=swagger_schemas.TAG_FILTER_PARAMS,
     )
+    @conditional_get(conditional.post_list_validators)
+    @cache_public_response(cache.list_dependencies)
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
@@ -47,9 +81,34 @@ class BlogPostViewSet(viewsets.ModelViewSet):
         operation_summary="Get a post",
         operation_description="Get a post",
     )
+    @conditional_get(conditional.post_validators)
+    @cache_public_response(cache.detail_dependencies)
     def retrieve(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
 
+    @swagger_auto_schema(
+        tags=['Blog Post'],
+        operation_summary="Search posts",
+        operation_description="Full-text search over post titles, content and tags, "
+                              "best matches first, with cursor pagination",
+        manual_parameters=[swagger_schemas.SEARCH_QUERY_PARAM],
+        responses={
+            200: BlogPostCardSerializer(many=True),
+        },
+    )
+    @action(detail=False, methods=['get'])
+    def search(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError("Search query 'q' is required.")
+        queryset = search_posts(
+            self.get_queryset().defer('content'), query)
+        paginator = SearchCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = BlogPostCardSerializer(
+            page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
     @swagger_auto_schema(
         tags=['Blog Post'],
         operation_summary="Create a new post",
@@ -117,9 +176,10 @@ class BlogPostViewSet(viewsets.ModelViewSet):
         return SuccessResponse("Post deleted successfully")
 
 
-class GetUserPostsView(generics.ListAPIView):
-    queryset = BlogPost.objects.all()
-    serializer_class = GetUserBlogPostSerializer
+class GetUserPostsView(CursorPaginationMixin, generics.ListAPIView):
+    queryset = BlogPost.objects.select_related(
+        'author').prefetch_related('tags').defer('content')
+    serializer_class = BlogPostCardSerializer
     pagination_class = CustomPageNumPagination
 
     @swagger_auto_schema(
@@ -127,6 +187,8 @@ class GetUserPostsView(generics.ListAPIView):
         operation_summary="Get posts by user Id",
         operation_description="Get all posts of a user with pagination"
     )
+    @conditional_get(conditional.user_posts_validators)
+    @cache_public_response(cache.user_posts_dependencies)
     def get(self, request: Request, user_id=None) -> Response:
         queryset = self.queryset.filter(author=user_id)
         page = self.paginate_queryset(queryset)
@@ -137,17 +199,17 @@ class GetUserPostsView(generics.ListAPIView):
         return Response(serializer.data)
 
 
-class GetPostsByTagView(generics.ListAPIView):
-    queryset = BlogPost.objects.all()
-    serializer_class = GetUserBlogPostSerializer
+class GetPostsByTagView(CursorPaginationMixin, generics.ListAPIView):
+    queryset = BlogPost.objects.select_related(
+        'author').prefetch_related('tags').defer('content')
+    serializer_class = BlogPostCardSerializer
     pagination_class = CustomPageNumPagination
 
     def get_queryset(self):
         queryset = super().get_queryset()
         slug = self.kwargs.get('slug')
         if slug:
-            tag = get_object_or_404(Tag, slug=slug)
-            queryset = queryset.filter(tags=tag)
+            queryset = filter_by_tags(queryset, [slug])
         return queryset
 
     @swagger_auto_schema(
@@ -155,9 +217,15 @@ class GetPostsByTagView(generics.ListAPIView):
         operation_summary="Get posts by a tag",
         operation_description="Get all posts with a specific tag"
     )
+    @conditional_get(conditional.tag_posts_validators)
+    @cache_public_response(cache.tag_posts_dependencies)
     def get(self, request: Request, *args, **kwargs) -> Response:
         queryset = self.get_queryset()
         page = self.paginate_queryset(queryset)
+        # The tag is resolved inside the page query; only an empty page
+        # needs a second look to tell an unknown tag from an unused one.
+        if not page and not Tag.objects.filter(slug=kwargs.get('slug')).exists():
+            raise Http404
         if page is not None:
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
@@ -165,19 +233,34 @@ class GetPostsByTagView(generics.ListAPIView):
         return Response(serializer.data)
 
 
-class ListCreateCommentView(generics.ListCreateAPIView):
+class ListCreateCommentView(CursorPaginationMixin, generics.ListCreateAPIView):
     queryset = Comment.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly]
     serializer_class = CreateCommentSerializer
     pagination_class = CustomLimitOffsetPagination
+    cursor_pagination_class = CommentCursorPagination
+    # Replies shown under each comment; the rest are paged through
+    # ListRepliesView.
+    reply_preview_size = 3
+
+    def get_list_queryset(self, post_id):
+        # The sliced prefetch loads the first replies of every comment on
+        # the page in one windowed query, however many replies they have.
+        first_replies = Comment.objects.select_related('author').order_by(
+            'created_at', 'id')[:self.reply_preview_size]
+        return self.queryset.filter(post_id=post_id, parent=None).select_related(
+            'author').prefetch_related(
+            Prefetch('replies', queryset=first_replies, to_attr='first_replies'))
 
     @swagger_auto_schema(
         tags=['Comments and Replies'],
         operation_summary="Get comments",
-        operation_description="Get a list of comments",
+        operation_description="Get a list of comments, each with its first "
+                              "replies and its reply count",
     )
+    @conditional_get(conditional.comment_validators)
     def get(self, request: Request, post_id=None):
-        queryset = self.queryset.filter(post_id=post_id, parent=None)
+        queryset = self.get_list_queryset(post_id)
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = ListCommentSerializer(page, many=True)
@@ -200,6 +283,31 @@ class ListCreateCommentView(generics.ListCreateAPIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
 
+class ExportCommentsView(generics.GenericAPIView):
+    queryset = Comment.objects.all()
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        tags=['Comments and Replies'],
+        operation_summary="Export comments",
+        operation_description="Stream every comment and reply of a post as "
+                              "newline-delimited JSON, each comment followed "
+                              "by its replies",
+        responses={
+            200: 'application/x-ndjson stream, one comment per line',
+        },
+    )
+    def get(self, request: Request, post_id=None):
+        if not BlogPost.objects.filter(pk=post_id).exists():
+            raise Http404
+        response = StreamingHttpResponse(
+            ndjson_lines(comment_thread(post_id), comment_record),
+            content_type='application/x-ndjson')
+        response['Content-Disposition'] = (
+            f'attachment; filename="post-{post_id}-comments.ndjson"')
+        return response
+
+
 class UpdateDeleteCommentView(
     generics.GenericAPIView,
     mixins.UpdateModelMixin,
@@ -241,6 +349,27 @@ class UpdateDeleteCommentView(
         return SuccessResponse("Comment deleted successfully")
 
 
+class ListRepliesView(generics.ListAPIView):
+    queryset = Comment.objects.select_related('author')
+    serializer_class = ReplySerializer
+    pagination_class = CommentCursorPagination
+
+    @swagger_auto_schema(
+        tags=['Comments and Replies'],
+        operation_summary="Get replies",
+        operation_description="Get the replies of a comment, oldest first, "
+                              "with cursor pagination",
+    )
+    @conditional_get(conditional.reply_validators)
+    def get(self, request: Request, comment_id=None):
+        queryset = self.queryset.filter(parent_id=comment_id)
+        page = self.paginate_queryset(queryset)
+        if not page and not Comment.objects.filter(pk=comment_id).exists():
+            raise Http404
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
 class CreateReplyView(generics.CreateAPIView):
     queryset = Comment.objects.all()
     serializer_class = CreateReplySerializer
@@ -312,6 +441,8 @@ class CreateListTagsViewSet(
     serializer_class = TagSerializer
     permission_classes = [IsAuthenticated]
     # pagination_class = [CustomPagination]
+    cloud_limit = 50
+    max_cloud_limit = 200
 
     @swagger_auto_schema(
         tags=['Tags'],
@@ -321,6 +452,30 @@ class CreateListTagsViewSet(
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
+    @swagger_auto_schema(
+        tags=['Tags'],
+        operation_summary="Get the tag cloud",
+        operation_description="Get the most used tags with their post counts, "
+                              "most popular first",
+        manual_parameters=[swagger_schemas.TAG_CLOUD_LIMIT_PARAM],
+        responses={
+            200: TagCloudSerializer(many=True),
+        },
+    )
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    @cache_public_response(cache.tag_cloud_dependencies)
+    def cloud(self, request, *args, **kwargs):
+        try:
+            limit = int(request.query_params.get('limit', self.cloud_limit))
+        except ValueError:
+            raise ValidationError("'limit' must be an integer.")
+        limit = min(max(limit, 1), self.max_cloud_limit)
+        # Served from the post_count column; no join over the posts-tags
+        # table.
+        tags = Tag.objects.filter(post_count__gt=0).order_by(
+            '-post_count', 'name').only('name', 'slug', 'post_count')[:limit]
+        return Response(TagCloudSerializer(tags, many=True).data)
+
     @swagger_auto_schema(
         tags=['Tags'],
         operation_summary="Create a new tag",
@@ -28,6 +28,21 @@ env = Env(
     REFRESH_TOKEN_LIFETIME_DAYS=(int, 5),
     REFRESH_TOKEN_LIFETIME_HOURS=(int, 0),
     REFRESH_TOKEN_LIFETIME_MINUTES=(int, 0),
+    PAGINATION_COUNT_STRATEGY=(str, 'cached'),
+    PAGINATION_COUNT_CACHE_TTL=(int, 300),
+    PAGINATION_COUNT_ESTIMATE_THRESHOLD=(int, 10000),
+    REDIS_URL=(str, ''),
+    RESPONSE_CACHE_TIMEOUT=(int, 300),
+    METRICS_FLUSH_INTERVAL=(int, 10),
+    PROFILE_BUFFER_SIZE=(int, 20),
+    THUMBNAIL_WORKERS=(int, 2),
+    UPLOAD_SPOOL_DIR=(str, ''),
+    UPLOAD_SPOOL_WORKERS=(int, 4),
+    UPLOAD_RETRIES=(int, 3),
+    GS_PUBLIC_URLS=(bool, False),
+    GS_URL_CACHE_SIZE=(int, 10000),
+    AUTHOR_CACHE_TIMEOUT=(int, 300),
+    AUTHOR_CACHE_LOCAL_SIZE=(int, 10000),
 )
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -79,7 +94,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware'
+    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'utils.profiling.ProfilingMiddleware',
+    'utils.metrics.RequestMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'blog_api.urls'
@@ -92,6 +109,13 @@ REST_FRAMEWORK = {
     "EXCEPTION_HANDLER": "drf_standardized_errors.handler.exception_handler",
 }
 
+# How paginated responses compute their total: 'exact', 'cached' (exact,
+# cached per filter and dropped on writes), 'estimate' (PostgreSQL planner
+# estimate, exact below the threshold) or 'none'. Overridable with ?count=.
+PAGINATION_COUNT_STRATEGY = env('PAGINATION_COUNT_STRATEGY')
+PAGINATION_COUNT_CACHE_TTL = env('PAGINATION_COUNT_CACHE_TTL')
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = env('PAGINATION_COUNT_ESTIMATE_THRESHOLD')
+
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
         'Bearer': {
@@ -156,6 +180,49 @@ else:
         'default': dj_database_url.parse(env('DB_URL'))
     }
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+if env('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': env('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds an anonymous blog read response is cached (see utils.cache).
+RESPONSE_CACHE_TIMEOUT = env('RESPONSE_CACHE_TIMEOUT')
+
+# Seconds the author summaries embedded in posts and comments are cached,
+# and how many each process also keeps in memory (see blog.authors).
+AUTHOR_CACHE_TIMEOUT = env('AUTHOR_CACHE_TIMEOUT')
+AUTHOR_CACHE_LOCAL_SIZE = env('AUTHOR_CACHE_LOCAL_SIZE')
+
+# Seconds each worker buffers request metrics before adding them to the
+# shared cache (see utils.metrics).
+METRICS_FLUSH_INTERVAL = env('METRICS_FLUSH_INTERVAL')
+
+# Number of X-Profile request profiles kept (see utils.profiling).
+PROFILE_BUFFER_SIZE = env('PROFILE_BUFFER_SIZE')
+
+# Threads per process rendering thumbnail sizes after an upload; 0
+# renders them inline (see blog.renditions).
+THUMBNAIL_WORKERS = env('THUMBNAIL_WORKERS')
+
+# Django's upload handlers, hashing uploads as they are received so they
+# can be stored deduplicated (see utils.media).
+FILE_UPLOAD_HANDLERS = [
+    'utils.media.HashingMemoryFileUploadHandler',
+    'utils.media.HashingTemporaryFileUploadHandler',
+]
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -199,6 +266,10 @@ GS_CREDENTIALS = service_account.Credentials.from_service_account_file(
 )
 GS_PROJECT_ID = 'webappservices-416116'
 GS_BUCKET_NAME = 'drf-blog-api-bucket'
+# Unsigned URLs for a publicly readable bucket, and the number of signed
+# URLs cached per storage otherwise (see custom_storages.FastURLMixin).
+GS_PUBLIC_URLS = env('GS_PUBLIC_URLS')
+GS_URL_CACHE_SIZE = env('GS_URL_CACHE_SIZE')
 
 
 if DEBUG:
@@ -207,11 +278,21 @@ if DEBUG:
     STATIC_URL = '/static/'
     MEDIA_URL = '/media/'
 else:
-    DEFAULT_FILE_STORAGE = 'custom_storages.StaticStorage'
+    # With a spool directory, uploads are written locally and copied to
+    # the bucket in the background (see custom_storages.SpooledStorage).
+    DEFAULT_FILE_STORAGE = (
+        'custom_storages.SpooledStaticStorage' if env('UPLOAD_SPOOL_DIR')
+        else 'custom_storages.StaticStorage')
     STATICFILES_STORAGE = 'custom_storages.MediaStorage'
     STATIC_URL = f'https://storage.googleapis.com/{GS_BUCKET_NAME}/static/'
     MEDIA_URL = f'https://storage.googleapis.com/{GS_BUCKET_NAME}/media/'
 
+# Local spool for background uploads to the bucket; off when empty.
+UPLOAD_SPOOL_DIR = env('UPLOAD_SPOOL_DIR')
+UPLOAD_SPOOL_URL = '/spool/'
+UPLOAD_SPOOL_WORKERS = env('UPLOAD_SPOOL_WORKERS')
+UPLOAD_RETRIES = env('UPLOAD_RETRIES')
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -4,6 +4,14 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from custom_storages import serve_spooled
+from utils.metrics import MetricsView
+from utils.profiling import (
+    ProfileDetailView,
+    ProfileDownloadView,
+    ProfileListView,
+)
+
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -24,6 +32,13 @@ urlpatterns = [
     path('api-docs/', schema_view.with_ui('redoc',
          cache_timeout=0), name='schema-redoc'),
     path('admin/', admin.site.urls),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('profiles/', ProfileListView.as_view(), name='profiles'),
+    path('profiles/<int:profile_id>/', ProfileDetailView.as_view(),
+         name='profile'),
+    path('profiles/<int:profile_id>/download/', ProfileDownloadView.as_view(),
+         name='profile-download'),
+    path('spool/<path:name>', serve_spooled, name='spooled-file'),
 ]
 
 
@@ -1,12 +1,213 @@
-from storages.backends.gcloud import GoogleCloudStorage
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+from urllib.parse import quote
+
+from cachetools import TTLCache
 from django.conf import settings
+from django.core.files.storage import FileSystemStorage, Storage, default_storage
+from django.http import Http404, HttpResponseRedirect
+from django.views.static import serve
+from storages.backends.gcloud import GoogleCloudStorage
+from storages.utils import clean_name, setting
+
+
+logger = logging.getLogger(__name__)
+
+GCS_PUBLIC_ENDPOINT = 'https://storage.googleapis.com'
+
+
+class FastURLMixin:
+    """
+    Cheaper ``url()`` for GoogleCloudStorage, which builds a blob and signs
+    a URL on every call.
+
+    With ``public_urls`` (``GS_PUBLIC_URLS``), for a publicly readable
+    bucket, URLs are built from the endpoint, bucket and name alone.
+    Otherwise signed URLs are kept in a TTL/LRU cache of ``url_cache_size``
+    entries (``GS_URL_CACHE_SIZE``, 0 disables it). Entries expire after
+    half of the signature's ``expiration``, so a URL served from the cache
+    stays valid for at least that long.
+    """
 
+    def get_default_settings(self):
+        return {
+            **super().get_default_settings(),
+            'public_urls': setting('GS_PUBLIC_URLS', False),
+            'url_cache_size': setting('GS_URL_CACHE_SIZE', 10000),
+        }
 
-class StaticStorage(GoogleCloudStorage):
+    def __init__(self, **settings):
+        super().__init__(**settings)
+        expiration = self.expiration
+        if isinstance(expiration, timedelta):
+            expiration = expiration.total_seconds()
+        self._signed_urls = (
+            TTLCache(maxsize=self.url_cache_size, ttl=expiration / 2)
+            if self.url_cache_size else None)
+        self._signed_urls_lock = threading.Lock()
+
+    def url(self, name, parameters=None):
+        if self.public_urls:
+            return self.public_url(name)
+        if parameters or self._signed_urls is None:
+            return super().url(name, parameters)
+        with self._signed_urls_lock:
+            url = self._signed_urls.get(name)
+        if url is None:
+            url = super().url(name)
+            with self._signed_urls_lock:
+                self._signed_urls[name] = url
+        return url
+
+    def public_url(self, name):
+        name = self._normalize_name(clean_name(name))
+        base = self.custom_endpoint or f'{GCS_PUBLIC_ENDPOINT}/{self.bucket_name}'
+        return f"{base}/{quote(name, safe='/~')}"
+
+
+class StaticStorage(FastURLMixin, GoogleCloudStorage):
     location = 'static'
     bucket_name = settings.GS_BUCKET_NAME
 
 
-class MediaStorage(GoogleCloudStorage):
+class MediaStorage(FastURLMixin, GoogleCloudStorage):
     location = 'media'
     bucket_name = settings.GS_BUCKET_NAME
+
+
+class SpooledStorage(Storage):
+    """
+    Saves files to a local spool directory and returns at once; a pool of
+    uploader threads copies them to the ``remote`` storage, retrying with
+    backoff, and removes them from the spool once they are there. Until
+    then the file is read and served from the spool.
+
+    Files whose upload gave up stay in the spool; ``flush_upload_spool``
+    retries them. The spool is local to a host, so with several hosts a
+    file can be briefly missing on the others until its upload lands.
+    """
+
+    remote_class = None
+
+    def __init__(self, remote=None, location=None, base_url=None,
+                 workers=None, retries=None, retry_delay=1.0):
+        self.remote = remote if remote is not None else self.remote_class()
+        self.spool = FileSystemStorage(
+            location=location or settings.UPLOAD_SPOOL_DIR,
+            base_url=base_url or settings.UPLOAD_SPOOL_URL)
+        self.workers = workers or settings.UPLOAD_SPOOL_WORKERS
+        self.retries = settings.UPLOAD_RETRIES if retries is None else retries
+        self.retry_delay = retry_delay
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def get_available_name(self, name, max_length=None):
+        name = self.remote.get_available_name(name, max_length=max_length)
+        return self.spool.get_available_name(name, max_length=max_length)
+
+    def _save(self, name, content):
+        name = self.spool.save(name, content)
+        self.upload(name)
+        return name
+
+    def _open(self, name, mode='rb'):
+        try:
+            return self.spool.open(name, mode)
+        except FileNotFoundError:
+            return self.remote.open(name, mode)
+
+    def delete(self, name):
+        self.spool.delete(name)
+        self.remote.delete(name)
+
+    def exists(self, name):
+        return self.spool.exists(name) or self.remote.exists(name)
+
+    def size(self, name):
+        if self.spool.exists(name):
+            return self.spool.size(name)
+        return self.remote.size(name)
+
+    def url(self, name):
+        if self.spool.exists(name):
+            return self.spool.url(name)
+        return self.remote.url(name)
+
+    def upload(self, name):
+        """Queue the spooled file ``name`` for upload, once."""
+        with self._lock:
+            if name in self._pending:
+                return self._pending[name]
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='uploads')
+            future = self._executor.submit(self._upload, name)
+            self._pending[name] = future
+        future.add_done_callback(lambda _: self._forget(name))
+        return future
+
+    def spooled(self):
+        """Names of the files still waiting in the spool."""
+        root = self.spool.location
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                yield os.path.relpath(path, root).replace(os.sep, '/')
+
+    def join(self, timeout=None):
+        """Wait for the queued uploads; returns those still running."""
+        with self._lock:
+            futures = list(self._pending.values())
+        return wait(futures, timeout=timeout).not_done
+
+    def _upload(self, name):
+        for attempt in range(self.retries + 1):
+            try:
+                with self.spool.open(name, 'rb') as content:
+                    if attempt and self.remote.exists(name):
+                        # Left over from a failed attempt.
+                        self.remote.delete(name)
+                    stored = self.remote.save(name, content)
+            except FileNotFoundError:
+                return False  # deleted before it was uploaded
+            except Exception:
+                if attempt == self.retries:
+                    logger.exception(
+                        'Uploading %s failed; it stays in the spool', name)
+                    return False
+                logger.warning('Uploading %s failed, retrying', name,
+                               exc_info=True)
+                time.sleep(self.retry_delay * 2 ** attempt)
+                continue
+            if stored != name:
+                logger.error('%s was uploaded as %s', name, stored)
+            self.spool.delete(name)
+            return True
+
+    def _forget(self, name):
+        with self._lock:
+            self._pending.pop(name, None)
+
+
+class SpooledStaticStorage(SpooledStorage):
+    remote_class = StaticStorage
+
+
+def serve_spooled(request, name):
+    """
+    Serve a file still waiting in the upload spool, or redirect to the
+    bucket once it has been uploaded (URLs handed out earlier stay valid).
+    """
+    if not isinstance(default_storage, SpooledStorage):
+        raise Http404
+    try:
+        return serve(request, name, document_root=default_storage.spool.location)
+    except Http404:
+        if not default_storage.remote.exists(name):
+            raise
+        return HttpResponseRedirect(default_storage.remote.url(name))
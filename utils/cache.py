@@ -0,0 +1,124 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+from .metrics import record_cache_lookup
+
+
+# Bump when a cached representation changes shape so old entries are ignored.
+RESPONSE_CACHE_VERSION = 1
+
+
+# Moves on every invalidation; see cache_public_response.
+ANY_WRITE = '*'
+
+
+def invalidate(*dependencies):
+    """
+    Mark every cached response that depends on ``dependencies`` stale, now
+    and again when the current transaction commits.
+    """
+    _bump(dependencies)
+    if transaction.get_connection().in_atomic_block:
+        # Until the commit, other connections still read the old rows, and
+        # may store or validate them against the generations just bumped.
+        transaction.on_commit(lambda: _bump(dependencies))
+
+
+def cache_public_response(dependencies):
+    """
+    Cache the data of anonymous, successful GET responses of a view method.
+
+    ``dependencies(view, data, **kwargs)`` names what the response was built
+    from (e.g. ``post:1``, ``user:2``). The generation of each dependency is
+    stored with the entry, and the entry is served only while none of them
+    has been passed to :func:`invalidate` since. A response is not stored
+    when anything was invalidated while it was built, as it may predate
+    that write yet be stored under the new generations.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method != 'GET' or request.user.is_authenticated:
+                return method(self, request, *args, **kwargs)
+
+            key = response_cache_key(request)
+            entry = cache.get(key)
+            hit = entry is not None and _is_fresh(entry['generations'])
+            record_cache_lookup('response', hit)
+            if hit:
+                response = Response(entry['data'], status=entry['status'])
+                response['X-Cache'] = 'HIT'
+                return response
+
+            writes = _current_generations([ANY_WRITE])
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                names = set(dependencies(self, response.data, **kwargs))
+                generations = _current_generations(names)
+                if _is_fresh(writes):
+                    cache.set(key, {
+                        'data': response.data,
+                        'status': response.status_code,
+                        'generations': generations,
+                    }, settings.RESPONSE_CACHE_TIMEOUT)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def dependency_generations(*dependencies):
+    """
+    The current generations of ``dependencies``, for validators that have
+    to notice changes no column records (e.g. a renamed tag).
+    """
+    generations = _current_generations(dependencies)
+    return tuple(
+        generations.get(_generation_key(name)) for name in dependencies)
+
+
+def response_cache_key(request):
+    query = sorted(request.query_params.lists())
+    raw = f'{request.path}?{query!r}'
+    digest = hashlib.sha1(raw.encode()).hexdigest()
+    return f'response:{RESPONSE_CACHE_VERSION}:{digest}'
+
+
+def _generation_key(dependency):
+    return f'response-dep:{dependency}'
+
+
+def _bump(dependencies):
+    # ANY_WRITE moves first, so a response that read the generations after
+    # the new ones were set also sees ANY_WRITE moved.
+    for dependency in (ANY_WRITE, *dependencies):
+        key = _generation_key(dependency)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def _current_generations(dependencies):
+    keys = {_generation_key(name): name for name in dependencies}
+    generations = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in generations}
+    if missing:
+        # Initialise from the clock so an evicted generation never comes
+        # back with a value an older entry was stored under.
+        for key, value in missing.items():
+            cache.add(key, value, None)
+        generations.update(cache.get_many(missing))
+    return generations
+
+
+def _is_fresh(generations):
+    if not generations:
+        return True
+    return cache.get_many(generations.keys()) == generations
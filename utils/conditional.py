@@ -0,0 +1,39 @@
+import hashlib
+
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .cache import RESPONSE_CACHE_VERSION
+
+
+def conditional_get(validators):
+    """
+    ETag / Last-Modified support for a view method, answering 304 before
+    the view (and its serializers) runs.
+
+    ``validators(request, **kwargs)`` returns ``(state, last_modified)``
+    from cheap aggregate queries, or ``(None, None)`` when there is nothing
+    to validate. ``state`` is any repr-able value that changes whenever
+    the response would; it is hashed with the URL and Accept header into
+    a strong ETag.
+    """
+    def get_validators(request, *args, **kwargs):
+        if not hasattr(request, '_conditional_validators'):
+            state, last_modified = validators(request, **kwargs)
+            etag = None
+            if state is not None:
+                raw = repr((
+                    RESPONSE_CACHE_VERSION,
+                    request.get_full_path(),
+                    request.META.get('HTTP_ACCEPT', ''),
+                    state,
+                ))
+                etag = hashlib.sha1(raw.encode()).hexdigest()
+            request._conditional_validators = etag, last_modified
+        return request._conditional_validators
+
+    return method_decorator(condition(
+        etag_func=lambda *args, **kwargs: get_validators(*args, **kwargs)[0],
+        last_modified_func=lambda *args, **kwargs: get_validators(
+            *args, **kwargs)[1],
+    ))
@@ -0,0 +1,98 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .metrics import record_cache_lookup
+
+
+COUNT_EXACT = 'exact'
+COUNT_CACHED = 'cached'
+COUNT_ESTIMATE = 'estimate'
+COUNT_NONE = 'none'
+COUNT_STRATEGIES = (COUNT_EXACT, COUNT_CACHED, COUNT_ESTIMATE, COUNT_NONE)
+
+
+def get_count_strategy(request, default=None):
+    """
+    Count strategy for this request: ``?count=`` if valid, otherwise the
+    ``PAGINATION_COUNT_STRATEGY`` setting.
+    """
+    strategy = request.query_params.get('count') if request else None
+    if strategy in COUNT_STRATEGIES:
+        return strategy
+    return default or settings.PAGINATION_COUNT_STRATEGY
+
+
+def count_queryset(queryset, strategy):
+    """
+    Return ``(count, exact)`` for ``queryset``.
+
+    ``count`` is None when the strategy is ``none``; ``exact`` is False
+    when the value comes from the query planner.
+    """
+    if strategy == COUNT_NONE:
+        return None, False
+    if strategy == COUNT_EXACT:
+        return queryset.count(), True
+    if strategy == COUNT_ESTIMATE:
+        estimate = estimate_count(queryset)
+        if (estimate is not None and
+                estimate >= settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD):
+            return estimate, False
+    return cached_count(queryset), True
+
+
+def cached_count(queryset):
+    """Exact count, cached per filter until the TTL or the next write."""
+    key = _count_key(queryset)
+    count = cache.get(key)
+    record_cache_lookup('count', count is not None)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TTL)
+    return count
+
+
+def estimate_count(queryset):
+    """Row estimate from the PostgreSQL planner, None on other databases."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def invalidate_counts(model):
+    """Drop every cached count over ``model`` by moving to a new generation."""
+    key = _generation_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def _generation_key(model):
+    return f'count-gen:{model._meta.label_lower}'
+
+
+def _generation(model):
+    key = _generation_key(model)
+    generation = cache.get(key)
+    if generation is None:
+        # Start from the clock so an evicted generation never reuses a
+        # value that older cached counts were stored under.
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key, 0)
+    return generation
+
+
+def _count_key(queryset):
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.sha1(f'{sql}|{params!r}'.encode()).hexdigest()
+    return f'count:{_generation(queryset.model)}:{digest}'
@@ -0,0 +1,207 @@
+"""
+Content-addressed, deduplicated media files.
+
+Uploads are hashed with SHA-256 while they are received (see the upload
+handlers below, installed through ``FILE_UPLOAD_HANDLERS``), and
+:class:`DedupImageField` stores each file as ``<upload_to>/<sha256>.<ext>``.
+Every such name has a ``blog.MediaBlob`` row counting the model fields that
+point at it, so a file that is already stored is referenced again instead of
+being uploaded a second time. Blobs nothing points at any more are deleted
+by ``gc_media_blobs``.
+
+Files that predate this (or are assigned by name, e.g. by ``import_blog``)
+have no blob row and are left alone. Models with such fields derive from
+:class:`DedupMediaModel`, so the counts change in the transaction of the
+save.
+"""
+import hashlib
+import posixpath
+
+from django.apps import apps
+from django.core import checks
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler, TemporaryFileUploadHandler,
+)
+from django.db import models, router, transaction
+from django.db.models import F
+from django.db.models.fields.files import ImageFieldFile
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.utils import timezone
+
+
+class HashingUploadHandlerMixin:
+    """Set ``sha256`` on the uploaded files this handler builds."""
+
+    def new_file(self, *args, **kwargs):
+        # Before super(): the memory handler raises StopFutureHandlers.
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        remaining = super().receive_data_chunk(raw_data, start)
+        if remaining is None:  # this handler kept the chunk
+            self.sha256.update(raw_data)
+        return remaining
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(
+        HashingUploadHandlerMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(
+        HashingUploadHandlerMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def content_sha256(content):
+    """Hex SHA-256 of a file, from the upload handler when it was hashed."""
+    digest = getattr(content, 'sha256', None)
+    if digest is not None:
+        return digest
+    sha256 = hashlib.sha256()
+    for chunk in content.chunks():
+        sha256.update(chunk)
+    content.seek(0)
+    return sha256.hexdigest()
+
+
+def blob_model():
+    return apps.get_model('blog', 'MediaBlob')
+
+
+def store_blob(storage, name, sha256, content):
+    """
+    Make sure ``name`` is stored and has a blob row; the content is only
+    written when it isn't stored yet. Returns the stored name.
+    """
+    MediaBlob = blob_model()
+    blob, created = MediaBlob.objects.get_or_create(
+        name=name, defaults={'sha256': sha256, 'size': content.size})
+    # Touching the row keeps gc_media_blobs off it until it is referenced;
+    # no row to touch means it was just collected, so store it again.
+    if not created and MediaBlob.objects.filter(pk=blob.pk).update(
+            updated_at=timezone.now()):
+        return name
+    if not created:
+        MediaBlob.objects.create(name=name, sha256=sha256, size=content.size)
+    if storage.exists(name):
+        return name
+    return storage.save(name, content)
+
+
+def acquire_blob(name):
+    if name:
+        blob_model().objects.filter(name=name).update(
+            ref_count=F('ref_count') + 1, updated_at=timezone.now())
+
+
+def release_blob(name):
+    if name:
+        blob_model().objects.filter(name=name, ref_count__gt=0).update(
+            ref_count=F('ref_count') - 1, updated_at=timezone.now())
+
+
+class DedupImageFieldFile(ImageFieldFile):
+    def save(self, name, content, save=True):
+        sha256 = content_sha256(content)
+        extension = posixpath.splitext(name)[1].lower()
+        name = self.field.generate_filename(self.instance, sha256 + extension)
+        self.name = store_blob(self.storage, name, sha256, content)
+        setattr(self.instance, self.field.attname, self.name)
+        self._committed = True
+
+        if save:
+            self.instance.save()
+
+    save.alters_data = True
+
+
+class DedupMediaModel(models.Model):
+    """Base of the models with a :class:`DedupImageField`."""
+
+    class Meta:
+        abstract = True
+
+    def save_base(self, *args, using=None, **kwargs):
+        # The reference counts are kept by pre_save/post_save receivers, so
+        # they commit or roll back with the row.
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save_base(*args, using=using, **kwargs)
+
+    save_base.alters_data = True
+
+
+class DedupImageField(models.ImageField):
+    """
+    ImageField storing files under their SHA-256, shared between rows with
+    the same content and reference counted in ``blog.MediaBlob``.
+    """
+
+    attr_class = DedupImageFieldFile
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        if not cls._meta.abstract:
+            post_init.connect(self._remember_name, sender=cls)
+            pre_save.connect(self._load_name, sender=cls)
+            post_save.connect(self._count_references, sender=cls)
+            post_delete.connect(self._release_reference, sender=cls)
+
+    def check(self, **kwargs):
+        errors = super().check(**kwargs)
+        if not issubclass(self.model, DedupMediaModel):
+            errors.append(checks.Error(
+                f'{self.model.__name__} must derive from DedupMediaModel.',
+                obj=self, id='media.E001'))
+        return errors
+
+    def _names(self, instance):
+        return instance.__dict__.setdefault('_blob_names', {})
+
+    def _remember_name(self, instance, **kwargs):
+        # Read __dict__: the attribute of a deferred field would query.
+        if self.attname in instance.__dict__:
+            self._names(instance)[self.attname] = _name(
+                instance.__dict__[self.attname])
+
+    def _load_name(self, instance, raw=False, **kwargs):
+        names = self._names(instance)
+        if raw:
+            return
+        if instance._state.adding:
+            # Not loaded from the database: the name it was built with
+            # isn't counted yet (e.g. a photo copied from another row).
+            names.pop(self.attname, None)
+        if self.attname in names:
+            return
+        names[self.attname] = (
+            type(instance)._base_manager.filter(pk=instance.pk)
+            .values_list(self.attname, flat=True).first()
+            if instance.pk is not None else None)
+
+    def _count_references(self, instance, raw=False, update_fields=None,
+                          **kwargs):
+        if raw or (update_fields is not None
+                   and self.attname not in update_fields):
+            return
+        names = self._names(instance)
+        old, new = names.get(self.attname), _name(getattr(instance, self.attname))
+        if old != new:
+            acquire_blob(new)
+            release_blob(old)
+            names[self.attname] = new
+
+    def _release_reference(self, instance, **kwargs):
+        release_blob(self._names(instance).get(self.attname))
+
+
+def _name(value):
+    return getattr(value, 'name', value) or None
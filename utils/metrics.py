@@ -0,0 +1,282 @@
+"""
+Per-request instrumentation.
+
+:class:`RequestMetricsMiddleware` times each request's view, response
+rendering and database queries, and counts cache hits and misses. The
+numbers go into histograms keyed by the resolved URL name, and to staff
+users in a ``Server-Timing`` header.
+
+Each worker process keeps its observations in memory and adds them to
+integer counters in the shared cache with ``cache.incr`` every
+``METRICS_FLUSH_INTERVAL`` seconds. Increments are atomic on Redis, so
+gunicorn/uvicorn workers aggregate into the same series. ``MetricsView``
+serves those series in the Prometheus text format.
+"""
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+from .profiling import staff_user
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# name: (help, buckets, scale). Sums are stored as integers: seconds in
+# microseconds.
+HISTOGRAMS = {
+    'blog_request_duration_seconds': (
+        "Time from the view being called to the response being rendered.",
+        DURATION_BUCKETS, 1_000_000),
+    'blog_request_view_seconds': (
+        "Time spent in the view.", DURATION_BUCKETS, 1_000_000),
+    'blog_request_render_seconds': (
+        "Time spent serializing (rendering) the response.",
+        DURATION_BUCKETS, 1_000_000),
+    'blog_request_db_seconds': (
+        "Time spent in database queries.", DURATION_BUCKETS, 1_000_000),
+    'blog_request_db_queries': (
+        "Database queries per request.", QUERY_BUCKETS, 1),
+}
+
+# name: (help, label, label values)
+COUNTERS = {
+    'blog_requests_total': (
+        "Responses by status class.", 'status',
+        ('1xx', '2xx', '3xx', '4xx', '5xx')),
+    'blog_cache_hits_total': (
+        "Cache lookups that found an entry.", 'cache',
+        ('response', 'count', 'author')),
+    'blog_cache_misses_total': (
+        "Cache lookups that missed.", 'cache',
+        ('response', 'count', 'author')),
+}
+
+UNMATCHED_VIEW = 'unmatched'
+VIEWS_KEY = 'metrics:views'
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def record_cache_lookup(cache_name, hit):
+    """Count a cache hit or miss against the current request, if any."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache[cache_name, hit] = metrics.cache.get((cache_name, hit), 0) + 1
+
+
+class RequestMetrics:
+    """What one request spent its time on."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.render_started = None
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.cache = {}
+
+    def time_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - start
+
+    def timings(self, finished):
+        """``(total, view, render)`` in seconds."""
+        view_started = self.view_started or self.started
+        view_finished = self.render_started or finished
+        render = finished - self.render_started if self.render_started else 0.0
+        return finished - self.started, view_finished - view_started, render
+
+    def server_timing(self, total, view, render):
+        entries = [
+            f'db;dur={self.db_seconds * 1000:.2f};desc="{self.queries} queries"',
+            f'view;dur={view * 1000:.2f}',
+            f'render;dur={render * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ]
+        if self.cache:
+            lookups = ', '.join(
+                f"{name} {'hit' if hit else 'miss'} x{n}"
+                for (name, hit), n in sorted(self.cache.items()))
+            entries.insert(1, f'cache;desc="{lookups}"')
+        return ', '.join(entries)
+
+
+class MetricsRegistry:
+    """
+    This worker's observations not yet added to the shared cache, as
+    integer deltas per cache key.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.views = set()
+        self.last_flush = time.monotonic()
+
+    def observe(self, name, view, value):
+        _, buckets, scale = HISTOGRAMS[name]
+        bucket = next(
+            (str(bound) for bound in buckets if value <= bound), '+Inf')
+        with self.lock:
+            self.views.add(view)
+            for field, delta in ((f'le={bucket}', 1), ('count', 1),
+                                 ('sum', round(value * scale))):
+                key = _series_key(name, view, field)
+                self.pending[key] = self.pending.get(key, 0) + delta
+
+    def inc(self, name, view, label_value, delta=1):
+        key = _series_key(name, view, label_value)
+        with self.lock:
+            self.views.add(view)
+            self.pending[key] = self.pending.get(key, 0) + delta
+
+    def record(self, view, metrics, status_code, total, view_seconds, render):
+        self.observe('blog_request_duration_seconds', view, total)
+        self.observe('blog_request_view_seconds', view, view_seconds)
+        self.observe('blog_request_render_seconds', view, render)
+        self.observe('blog_request_db_seconds', view, metrics.db_seconds)
+        self.observe('blog_request_db_queries', view, metrics.queries)
+        self.inc('blog_requests_total', view, f'{status_code // 100}xx')
+        for (cache_name, hit), n in metrics.cache.items():
+            name = 'blog_cache_hits_total' if hit else 'blog_cache_misses_total'
+            self.inc(name, view, cache_name, n)
+        if time.monotonic() - self.last_flush >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            views, self.views = self.views, set()
+            self.last_flush = time.monotonic()
+        if views:
+            # Read-modify-write: a view lost to a concurrent flush is added
+            # back by the next flush that sees it.
+            known = set(cache.get(VIEWS_KEY) or ())
+            if not views <= known:
+                cache.set(VIEWS_KEY, sorted(known | views), None)
+        for key, delta in pending.items():
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                if not cache.add(key, delta, None):
+                    cache.incr(key, delta)
+
+    def render(self):
+        """The aggregated series of every worker in Prometheus text format."""
+        self.flush()
+        views = sorted(cache.get(VIEWS_KEY) or ())
+        keys = [_series_key(name, view, field)
+                for name, (_, buckets, _) in HISTOGRAMS.items()
+                for view in views
+                for field in [f'le={bound}' for bound in buckets] +
+                ['le=+Inf', 'count', 'sum']]
+        keys += [_series_key(name, view, value)
+                 for name, (_, _, values) in COUNTERS.items()
+                 for view in views for value in values]
+        values = cache.get_many(keys)
+
+        lines = []
+        for name, (help_text, buckets, scale) in HISTOGRAMS.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for view in views:
+                label = f'view="{_escape(view)}"'
+                if not values.get(_series_key(name, view, 'count')):
+                    continue
+                cumulative = 0
+                for bound in [str(bound) for bound in buckets] + ['+Inf']:
+                    cumulative += values.get(
+                        _series_key(name, view, f'le={bound}'), 0)
+                    lines.append(
+                        f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                total = values.get(_series_key(name, view, 'sum'), 0) / scale
+                lines.append(f'{name}_sum{{{label}}} {total:g}')
+                lines.append(f'{name}_count{{{label}}} {cumulative}')
+        for name, (help_text, label_name, label_values) in COUNTERS.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for view in views:
+                for value in label_values:
+                    count = values.get(_series_key(name, view, value))
+                    if count:
+                        lines.append(
+                            f'{name}{{view="{_escape(view)}",'
+                            f'{label_name}="{value}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetricsMiddleware:
+    """
+    Keep last in ``MIDDLEWARE``: rendering is timed from
+    ``process_template_response`` to the response coming back here.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        request.metrics = metrics
+        token = _current.set(metrics)
+        try:
+            with connection.execute_wrapper(metrics.time_query):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total, view_seconds, render = metrics.timings(time.perf_counter())
+        # Timings tell how much work a request costs: staff only.
+        if staff_user(request) is not None:
+            response['Server-Timing'] = metrics.server_timing(
+                total, view_seconds, render)
+        match = request.resolver_match
+        registry.record(
+            match.view_name if match else UNMATCHED_VIEW, metrics,
+            response.status_code, total, view_seconds, render)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        request.metrics.render_started = time.perf_counter()
+        return response
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        tags=['Monitoring'],
+        operation_summary="Request metrics",
+        operation_description=(
+            "Per-view latency, query and cache metrics of all workers in "
+            "the Prometheus text format. Staff only."
+        ),
+        responses={200: 'Prometheus text exposition format'}
+    )
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(
+            registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _series_key(name, view, field):
+    return f'metrics:{name}:{view}:{field}'
+
+
+def _escape(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
@@ -1,5 +1,71 @@
-from rest_framework.pagination import PageNumberPagination, LimitOffsetPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    BasePagination,
+    PageNumberPagination,
+    LimitOffsetPagination,
+    _positive_int,
+)
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .counting import COUNT_NONE, count_queryset, get_count_strategy
+
+
+class CountingPaginator(Paginator):
+    """
+    Paginator whose total comes from a count strategy (see
+    ``utils.counting``). With the ``none`` strategy no count is run and
+    the page is fetched with one extra row to tell whether a next page exists.
+    """
+
+    def __init__(self, object_list, per_page, count_strategy, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_strategy = count_strategy
+        self.count_exact = False
+        self._seen_pages = None
+
+    @cached_property
+    def count(self):
+        count, self.count_exact = count_queryset(
+            self.object_list, self.count_strategy)
+        return count
+
+    @cached_property
+    def num_pages(self):
+        if self.count_strategy == COUNT_NONE:
+            return self._seen_pages
+        return super().num_pages
+
+    def validate_number(self, number):
+        if self.count_strategy != COUNT_NONE:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        if self.count_strategy != COUNT_NONE:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        items = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not items and number > 1:
+            raise EmptyPage('That page contains no results')
+        # Known so far: this page, plus one more if the extra row came back.
+        self._seen_pages = number + (len(items) > self.per_page)
+        return self._get_page(items[:self.per_page], number, self)
 
 
 class CustomPageNumPagination(PageNumberPagination):
@@ -8,10 +74,20 @@ class CustomPageNumPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 25
 
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_strategy = get_count_strategy(request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def django_paginator_class(self, object_list, per_page):
+        return CountingPaginator(object_list, per_page, self.count_strategy)
+
     def get_paginated_response(self, data):
+        paginator = self.page.paginator
+        counted = paginator.count is not None
         return Response({
-            'count': self.page.paginator.count,
-            'total_pages': self.page.paginator.num_pages,
+            'count': paginator.count,
+            'count_type': _count_type(paginator.count, paginator.count_exact),
+            'total_pages': paginator.num_pages if counted else None,
             'current_page': self.page.number,
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
@@ -24,12 +100,237 @@ class CustomLimitOffsetPagination(LimitOffsetPagination):
     default_limit = 10
     max_limit = 50
 
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_strategy = get_count_strategy(request)
+        self.count_exact = False
+        if self.count_strategy != COUNT_NONE:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.request = request
+        results = list(queryset[self.offset:self.offset + self.limit + 1])
+        # Lower bound on the total, enough for next/previous links.
+        self.count = self.offset + len(results)
+        return results[:self.limit]
+
+    def get_count(self, queryset):
+        count, self.count_exact = count_queryset(queryset, self.count_strategy)
+        return count
+
     def get_paginated_response(self, data):
+        counted = self.count_strategy != COUNT_NONE
         return Response({
-            'count': self.count,
+            'count': self.count if counted else None,
+            'count_type': _count_type(
+                self.count if counted else None, self.count_exact),
             'offset': self.get_offset(self.request),
             'limit': self.get_limit(self.request),
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
             'results': data
         })
+
+
+class CustomCursorPagination(BasePagination):
+    """
+    Keyset pagination over ``ordering``.
+
+    The cursor holds the ordering values of the last (or first, when
+    paging backwards) row of the page, so every page is a single indexed
+    range scan and no ``COUNT(*)`` is run.
+    """
+
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    ordering = ('-created_at', '-id')
+    page_size = 5
+    page_size_query_param = 'page_size'
+    max_page_size = 25
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = getattr(view, 'cursor_ordering', self.ordering)
+        position, self.reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = [_invert(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            position = self.parse_position(queryset, position)
+            queryset = queryset.filter(_keyset_filter(ordering, position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > self.page_size
+        if self.reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = position is not None
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            position, reverse = payload['p'], bool(payload['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def parse_position(self, queryset, position):
+        """
+        The cursor's values as the ordering fields' Python types; a cursor
+        that doesn't convert (or holds nulls) is invalid.
+        """
+        parsed = []
+        for field, value in zip(self.ordering, position):
+            try:
+                value = _ordering_field(queryset, field.lstrip('-')).to_python(
+                    value)
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            parsed.append(value)
+        return parsed
+
+    def encode_cursor(self, instance, reverse):
+        position = [
+            _encode_value(getattr(instance, field.lstrip('-')))
+            for field in self.ordering
+        ]
+        payload = json.dumps({'p': position, 'r': int(reverse)})
+        encoded = urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            url = self.request.build_absolute_uri()
+            return remove_query_param(url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class CommentCursorPagination(CustomCursorPagination):
+    ordering = ('created_at', 'id')
+    page_size = 10
+    page_size_query_param = 'limit'
+    max_page_size = 50
+
+
+class SearchCursorPagination(CustomCursorPagination):
+    ordering = ('-rank', '-id')
+
+
+class CursorPaginationMixin:
+    """
+    Lets a paginated view switch to keyset pagination per request with
+    ``?pagination=cursor`` (or by following a ``cursor`` link).
+    """
+    cursor_pagination_class = CustomCursorPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and self.uses_cursor_pagination():
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
+
+    def uses_cursor_pagination(self):
+        request = getattr(self, 'request', None)
+        if request is None:
+            return False
+        params = request.query_params
+        return (
+            params.get('pagination') == 'cursor' or
+            self.cursor_pagination_class.cursor_query_param in params
+        )
+
+
+def _count_type(count, exact):
+    if count is None:
+        return 'omitted'
+    return 'exact' if exact else 'estimated'
+
+
+def _invert(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _ordering_field(queryset, name):
+    annotation = queryset.query.annotations.get(name)
+    if annotation is not None:
+        return annotation.output_field
+    return queryset.model._meta.get_field(name)
+
+
+def _keyset_filter(ordering, position):
+    """
+    Rows strictly after ``position`` in ``ordering``, e.g. for
+    ``('-created_at', '-id')``::
+
+        created_at <= c AND (created_at < c OR (created_at = c AND id < i))
+
+    The redundant leading bound lets the database use it as an index range.
+    """
+    fields = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+    after = Q()
+    for i, (name, descending) in enumerate(fields):
+        step = Q(**{f'{name}__{"lt" if descending else "gt"}': position[i]})
+        for j, (prev_name, _) in enumerate(fields[:i]):
+            step &= Q(**{prev_name: position[j]})
+        after |= step
+    leading, descending = fields[0]
+    bound = Q(**{f'{leading}__{"lte" if descending else "gte"}': position[0]})
+    return bound & after
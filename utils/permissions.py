@@ -24,6 +24,9 @@ class BlogPostPermission(BasePermission):
             print("create called")
             return request.user.is_authenticated
 
+        # Updates and deletes: ownership is checked per object.
+        return request.user.is_authenticated
+
     def has_object_permission(self, request, view, obj):
         if request.method in ('PUT', 'PATCH', 'DELETE'):
             return obj.author == request.user
@@ -0,0 +1,224 @@
+"""
+On-demand profiling of single requests.
+
+A request with an ``X-Profile`` header, sent with a staff user's JWT (or
+session), runs under cProfile. Every SQL statement is recorded with its
+duration and the project call site that issued it. The result is stored
+in a ring buffer of the last ``PROFILE_BUFFER_SIZE`` profiles in the
+shared cache, so any worker can serve it. The response carries the
+``X-Profile-Id`` to fetch it by. Requests without the header go straight
+through.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import time
+import traceback
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.http import Http404, HttpResponse
+from django.utils import timezone
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+COUNTER_KEY = 'profiles:last-id'
+STACK_DEPTH = 8
+STATS_LINES = 40
+
+
+class ProfilingMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user = staff_user(request) if PROFILE_HEADER in request.META else None
+        if user is None:
+            return self.get_response(request)
+
+        queries = []
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with connection.execute_wrapper(QueryRecorder(queries)):
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - started
+
+        stats = pstats.Stats(profiler)
+        profile_id = store_profile({
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'user': user.get_username(),
+            'created_at': timezone.now().isoformat(),
+            'duration_ms': round(duration * 1000, 3),
+            'sql': queries,
+            'stats': _stats_text(stats),
+            'pstats': marshal.dumps(stats.stats),
+        })
+        response['X-Profile-Id'] = profile_id
+        return response
+
+
+class QueryRecorder:
+    """``execute_wrapper`` recording each statement, its time and call site."""
+
+    def __init__(self, queries):
+        self.queries = queries
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'params': repr(params),
+                'many': many,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+                'stack': _project_stack(),
+            })
+
+
+def store_profile(profile):
+    """Store ``profile`` in the next ring buffer slot and return its id."""
+    if cache.add(COUNTER_KEY, 1, None):
+        profile_id = 1
+    else:
+        profile_id = cache.incr(COUNTER_KEY)
+    profile['id'] = profile_id
+    cache.set(_slot_key(profile_id), profile, None)
+    return profile_id
+
+
+def get_profile(profile_id):
+    profile = cache.get(_slot_key(profile_id))
+    # The slot may have been reused by a newer profile.
+    if profile is None or profile['id'] != profile_id:
+        return None
+    return profile
+
+
+def recent_profiles():
+    """The profiles in the buffer, newest first."""
+    last_id = cache.get(COUNTER_KEY) or 0
+    ids = range(last_id, max(last_id - settings.PROFILE_BUFFER_SIZE, 0), -1)
+    slots = cache.get_many([_slot_key(profile_id) for profile_id in ids])
+    profiles = []
+    for profile_id in ids:
+        profile = slots.get(_slot_key(profile_id))
+        if profile is not None and profile['id'] == profile_id:
+            profiles.append(profile)
+    return profiles
+
+
+class ProfileListView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        tags=['Monitoring'],
+        operation_summary="Recent request profiles",
+        operation_description=(
+            "Profiles of requests sent with an X-Profile header by staff, "
+            "newest first. Staff only."
+        ),
+    )
+    def get(self, request, *args, **kwargs):
+        return Response([
+            {field: profile[field] for field in (
+                'id', 'method', 'path', 'status', 'user', 'created_at',
+                'duration_ms')} | {'queries': len(profile['sql'])}
+            for profile in recent_profiles()
+        ])
+
+
+class ProfileDetailView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        tags=['Monitoring'],
+        operation_summary="Request profile",
+        operation_description=(
+            "The cProfile summary and SQL statements of a profiled request. "
+            "Staff only."
+        ),
+    )
+    def get(self, request, profile_id=None):
+        profile = get_profile(profile_id)
+        if profile is None:
+            raise Http404
+        return Response({
+            key: value for key, value in profile.items() if key != 'pstats'})
+
+
+class ProfileDownloadView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        tags=['Monitoring'],
+        operation_summary="Download request profile",
+        operation_description=(
+            "The raw cProfile data of a profiled request, for pstats or "
+            "snakeviz. Staff only."
+        ),
+    )
+    def get(self, request, profile_id=None):
+        profile = get_profile(profile_id)
+        if profile is None:
+            raise Http404
+        response = HttpResponse(
+            profile['pstats'], content_type='application/octet-stream')
+        response['Content-Disposition'] = (
+            f'attachment; filename="request-{profile_id}.prof"')
+        return response
+
+
+def staff_user(request):
+    """The active staff user of ``request`` (session or JWT), or None."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            authenticated = JWTAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return None
+        user = authenticated[0] if authenticated else None
+    if user is not None and user.is_active and user.is_staff:
+        return user
+    return None
+
+
+def _project_stack():
+    base = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()[:-2]
+        if frame.filename.startswith(base)
+        and 'site-packages' not in frame.filename
+        and frame.filename != __file__
+    ]
+    return [
+        f'{frame.filename[len(base) + 1:]}:{frame.lineno} in {frame.name}'
+        for frame in frames[-STACK_DEPTH:]
+    ]
+
+
+def _stats_text(stats):
+    stream = io.StringIO()
+    stats.stream = stream
+    stats.sort_stats('cumulative').print_stats(STATS_LINES)
+    return stream.getvalue()
+
+
+def _slot_key(profile_id):
+    return f'profiles:slot:{profile_id % settings.PROFILE_BUFFER_SIZE}'
@@ -41,3 +41,34 @@ UPDATE_PROFILE_REQ_BODY = openapi.Schema(
         'bio': openapi.Schema(type=openapi.TYPE_STRING, description='User bio'),
     },
 )
+
+SEARCH_QUERY_PARAM = openapi.Parameter(
+    'q',
+    openapi.IN_QUERY,
+    description='Search terms',
+    type=openapi.TYPE_STRING,
+    required=True,
+)
+
+TAG_FILTER_PARAMS = [
+    openapi.Parameter(
+        'tags',
+        openapi.IN_QUERY,
+        description='Comma-separated tag slugs',
+        type=openapi.TYPE_STRING,
+    ),
+    openapi.Parameter(
+        'match',
+        openapi.IN_QUERY,
+        description='Match posts with all or any of the tags (default any)',
+        type=openapi.TYPE_STRING,
+        enum=['all', 'any'],
+    ),
+]
+
+TAG_CLOUD_LIMIT_PARAM = openapi.Parameter(
+    'limit',
+    openapi.IN_QUERY,
+    description='Number of tags to return (default 50, at most 200)',
+    type=openapi.TYPE_INTEGER,
+)